@@ -1,4 +1,22 @@
-from .graphing import mechanism_name_map
-from .graphing import plot_mean_aucc, plot_auc_strategic, plot_estimation_mses, plot_kendall_tau, plot_kendall_taus
-from .graphing import plot_mi_mse_metrics_highlighted_no_dmi, plot_mi_mse_metrics_other, plot_mi_mse_other_metrics_real_data, plot_mi_mse_tau_real_data
-from .graphing import plot_mean_rank_changes, plot_variance_rank_changes, plot_mean_rank_changes_real_data, plot_variance_rank_changes_real_data
\ No newline at end of file
+"""
+The plotting functions are re-exported here, but graphing.py (and with it seaborn, matplotlib and pandas) is only imported the first time one of them is used,
+so that the simulations and the mechanisms can be imported without any of the plotting packages.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+_GRAPHING_NAMES = (
+        "mechanism_name_map",
+        "plot_mean_aucc", "plot_auc_strategic", "plot_estimation_mses", "plot_kendall_tau", "plot_kendall_taus",
+        "plot_mi_mse_metrics_highlighted_no_dmi", "plot_mi_mse_metrics_other", "plot_mi_mse_other_metrics_real_data", "plot_mi_mse_tau_real_data",
+        "plot_mean_rank_changes", "plot_variance_rank_changes", "plot_mean_rank_changes_real_data", "plot_variance_rank_changes_real_data",
+    )
+
+def __getattr__(name):
+    if name in _GRAPHING_NAMES:
+        from . import graphing
+        return getattr(graphing, name)
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+def __dir__():
+    return sorted(list(globals()) + list(_GRAPHING_NAMES))
@@ -0,0 +1,63 @@
+"""
+Command line entry point for running experiments from a config file (see experiments.py), e.g. from the root of the repo:
+
+    python -m model_code run config.yaml
+    python -m model_code run config.yaml --workers 8
+    python -m model_code merge config.yaml
+
+Running a config again after an interruption skips the batches of semesters that were completed, and merge rebuilds the results file of a config from its store without simulating anything.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from argparse import ArgumentParser
+import warnings
+
+from experiments import load_config, merge_sweep, run_sweep
+
+def main(argv=None):
+    """
+    Parses the command line and runs the requested command.
+
+    Parameters
+    ----------
+    argv : list of strings, optional.
+           The command line arguments. The default is None, which uses sys.argv.
+
+    Returns
+    -------
+    None.
+
+    """
+    parser = ArgumentParser(prog="python -m model_code", description="Runs the experiments of the model from config files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run (or resume) the sweep described by a config file")
+    run.add_argument("config", help="a .json, .yaml or .yml config file")
+    run.add_argument("--workers", type=int, default=None, help="number of worker processes, overriding the config (0 uses every available core)")
+
+    merge = commands.add_parser("merge", help="rebuild the results file of a config from its store of completed batches")
+    merge.add_argument("config", help="a .json, .yaml or .yml config file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        config = load_config(args.config)
+        if args.workers is not None:
+            config["workers"] = args.workers
+        if config["workers"] is not None and config["workers"] < 1:
+            config["workers"] = None
+
+        #Supress Warnings in console
+        warnings.filterwarnings("ignore")
+
+        run_sweep(config)
+
+    elif args.command == "merge":
+        merge_sweep(load_config(args.config))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Benchmarks for the hot paths of the model: grading, the mechanisms that scale worst with the number of students, the EM estimation and the loader for the real data.
+
+Every component is run on a synthetic semester (a single graded assignment) for each number of students in SIZES and each number of graders per submission in GRADERS.
+The time of each component is the best of a few runs, and its peak memory is measured (with tracemalloc) in a separate run, so tracing does not distort the times.
+The reports of an assignment are stored in coordinate form (see reports.AssignmentReports), so the memory used by every component grows with the number of reports
+(students x graders per submission), and every component is benchmarked at all of the SIZES, up to 100,000 students.
+
+Run from the model_code directory, e.g.
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --sizes 100 1000 --components dmi_mechanism em_estimate_parameters
+    python benchmarks/hot_paths.py --save baseline
+    python benchmarks/hot_paths.py --compare baseline
+
+Results can be saved (as benchmarks/results/NAME.json) and compared with a saved run, to track regressions and measure the value of an optimization.
+With --compare, the script exits with status 1 if any component is slower than the saved run by more than the threshold.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from argparse import ArgumentParser
+import gc
+import json
+import os, sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'real_data'))
+
+import numpy as np
+
+from setup import initialize_student_list, initialize_submission_list
+from grading import assign_grades, assign_graders, get_grading_dict, random_regular_assignment
+from grading_dmi import assign_graders_dmi_clusters
+
+from mechanisms.dmi import dmi_mechanism
+from mechanisms.parametric_mse import em_estimate_parameters
+from mechanisms.phi_divergence_pairing import parametric_phi_divergence_pairing_mechanism, phi_divergence_pairing_mechanism
+
+from load import load17
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+"""
+The numbers of students and of graders per submission that every component is benchmarked with.
+"""
+SIZES = [100, 1000, 10000, 100000]
+GRADERS = [4, 8]
+
+"""
+The parameters of the normal approximation of the distribution of true grades used by the parametric mechanisms (as in the simulations).
+"""
+MU = 7
+GAMMA = 1/2.1
+
+"""
+The number of assignments in a synthetic semester of real data (see synthetic_real_data).
+"""
+LOAD_ASSIGNMENTS = 4
+
+class Semester:
+    """
+    A synthetic semester with a single graded assignment (continuous effort, biased graders), shared by the benchmarks of the mechanisms.
+
+    Attributes
+    ----------
+    students : list of Student objects.
+    submissions : list of Submission objects.
+    grader_dict : dict.
+                  The random regular assignment of num_graders graders to each submission, graded.
+    dmi_grader_dict : dict or None.
+                      The assignment of graders in clusters of size num_graders (see grading_dmi.py), graded. None if num_graders does not divide the number of students.
+    num_graders : int.
+    """
+
+    def __init__(self, num_students, num_graders, rng):
+        """
+        Creates and grades a Semester object.
+        """
+        self.students = initialize_student_list(num_students, num_students, rng)
+        self.submissions = initialize_submission_list(self.students, 0, rng)
+
+        self.grader_dict = assign_graders(self.students, self.submissions, num_graders, rng)
+        assign_grades(get_grading_dict(self.grader_dict), 3, 0, True, True, rng)
+
+        self.num_graders = num_graders
+        self.dmi_grader_dict = None
+        if num_students % num_graders == 0:
+            dmi_submissions = initialize_submission_list(self.students, 1, rng)
+            self.dmi_grader_dict = assign_graders_dmi_clusters(self.students, dmi_submissions, num_graders)
+            assign_grades(get_grading_dict(self.dmi_grader_dict), 3, 1, True, True, rng)
+
+def synthetic_real_data(num_students, num_graders, num_assignments, rng):
+    """
+    Creates grading data in the format of the .npy files read by load17: array[student][week] = [submitted, graded],
+    where every student submits every assignment, each submission is peer graded by num_graders other students (on a 0-100 scale), and about 10% are also graded by a TA.
+
+    Parameters
+    ----------
+    num_students : int.
+    num_graders : int.
+    num_assignments : int.
+    rng : numpy.random.Generator.
+
+    Returns
+    -------
+    array : np.array of objects, shape (num_students,).
+
+    """
+    array = np.empty(num_students, dtype=object)
+    for student in range(num_students):
+        array[student] = [[[], []] for _ in range(num_assignments)]
+
+    s_id = 0
+    for assignment in range(num_assignments):
+        graders = random_regular_assignment(num_students, num_students, num_graders, authors=np.arange(num_students), rng=rng).tolist()
+        true_grades = rng.integers(0, 101, num_students).tolist()
+        scores = rng.integers(0, 101, (num_students, num_graders)).tolist()
+        ta = (rng.random(num_students) < 0.1).tolist()
+
+        for student in range(num_students):
+            grades = [[score, 0, grader, 0] for score, grader in zip(scores[student], graders[student])]
+            if ta[student]:
+                grades.append([true_grades[student], 0, -1, 1])
+            array[student][assignment][0].append([assignment, s_id, true_grades[student], int(ta[student]), grades])
+            for score, grader in zip(scores[student], graders[student]):
+                array[grader][assignment][1].append([0, s_id, score])
+            s_id += 1
+
+    return array
+
+def _bench_assign_grades(semester, rng):
+    grading_dict = get_grading_dict(semester.grader_dict)
+    return lambda: assign_grades(grading_dict, 3, 0, True, True, rng)
+
+def _bench_phi_divergence_pairing(semester, rng):
+    return lambda: phi_divergence_pairing_mechanism(semester.grader_dict, "TVD", rng)
+
+def _bench_parametric_phi_divergence_pairing(semester, rng):
+    return lambda: parametric_phi_divergence_pairing_mechanism(semester.grader_dict, semester.students, 0, MU, GAMMA, True, "TVD", rng)
+
+def _bench_em_estimate_parameters(semester, rng):
+    return lambda: em_estimate_parameters(semester.grader_dict, semester.students, 0, MU, GAMMA, True)
+
+def _bench_dmi(semester, rng):
+    if semester.dmi_grader_dict is None:
+        return None
+    return lambda: dmi_mechanism(semester.dmi_grader_dict, 1, semester.num_graders, rng=rng)
+
+"""
+Maps the name of each component to a function that takes a Semester object and a numpy.random.Generator and returns the call to benchmark (or None if the component does not apply to the semester).
+"""
+COMPONENTS = {
+        "assign_grades": _bench_assign_grades,
+        "phi_divergence_pairing_mechanism": _bench_phi_divergence_pairing,
+        "parametric_phi_divergence_pairing_mechanism": _bench_parametric_phi_divergence_pairing,
+        "em_estimate_parameters": _bench_em_estimate_parameters,
+        "dmi_mechanism": _bench_dmi,
+        "load17": None,
+    }
+
+def measure(call, repeats):
+    """
+    Benchmarks a call.
+
+    Parameters
+    ----------
+    call : function.
+           Takes no arguments.
+    repeats : int.
+              The number of timed runs.
+
+    Returns
+    -------
+    seconds : float.
+              The best time of the timed runs.
+    peak_memory : int.
+                  The peak memory (in bytes) allocated during an additional run, traced with tracemalloc.
+
+    """
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        current, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak_memory
+
+def _measure_load17(num_students, num_graders, repeats, rng):
+    """
+    Benchmarks load17 on a synthetic 336Spring17.npy file (see synthetic_real_data), which is written to a temporary directory.
+    """
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        np.save(os.path.join(directory, "336Spring17.npy"), synthetic_real_data(num_students, num_graders, LOAD_ASSIGNMENTS, rng), allow_pickle=True)
+        os.chdir(directory)
+        return measure(lambda: load17("Spring"), repeats)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+def run_benchmarks(sizes=SIZES, graders=GRADERS, components=list(COMPONENTS), repeats=3, seed=0):
+    """
+    Runs the benchmarks and prints a line for each one as it finishes.
+
+    Parameters
+    ----------
+    sizes : list of ints, optional.
+            The numbers of students. The default is SIZES.
+    graders : list of ints, optional.
+              The numbers of graders per submission. The default is GRADERS.
+    components : list of str, optional.
+                 Keys of COMPONENTS. The default is every component.
+    repeats : int, optional.
+              The number of timed runs of each component (a single run for semesters of more than 10000 students). The default is 3.
+    seed : int, optional.
+           The seed for the synthetic semesters and the mechanisms. The default is 0.
+
+    Returns
+    -------
+    results : dict.
+              Maps "component students graders" to { "seconds": float, "peak_memory": int }.
+              Components that were skipped (e.g. DMI when the number of graders does not divide the number of students) are left out.
+
+    """
+    results = {}
+
+    print("{:<46}{:>10}{:>9}{:>12}{:>14}".format("component", "students", "graders", "time [s]", "peak [MiB]"))
+
+    for num_students in sizes:
+        for num_graders in graders:
+            rng = np.random.default_rng([seed, num_students, num_graders])
+            component_repeats = repeats if num_students <= 10000 else 1
+
+            semester = None
+            if any(component != "load17" for component in components):
+                semester = Semester(num_students, num_graders, rng)
+
+            for component in components:
+                if component == "load17":
+                    seconds, peak_memory = _measure_load17(num_students, num_graders, component_repeats, rng)
+                else:
+                    call = COMPONENTS[component](semester, rng)
+                    if call is None:
+                        print("{:<46}{:>10}{:>9}{:>26}".format(component, num_students, num_graders, "(skipped)"), flush=True)
+                        continue
+                    seconds, peak_memory = measure(call, component_repeats)
+
+                results["{} {} {}".format(component, num_students, num_graders)] = {"seconds": seconds, "peak_memory": peak_memory}
+                print("{:<46}{:>10}{:>9}{:>12.4f}{:>14.1f}".format(component, num_students, num_graders, seconds, peak_memory / 2**20), flush=True)
+
+    return results
+
+def compare(results, baseline, threshold=1.2):
+    """
+    Compares the times of a run of the benchmarks with a saved run, and prints the ratio of the times of every benchmark in both.
+
+    Parameters
+    ----------
+    results : dict.
+              See run_benchmarks.
+    baseline : dict.
+               A saved run, in the same format.
+    threshold : float, optional.
+                A benchmark has regressed if its time is more than threshold times its time in the baseline. The default is 1.2.
+
+    Returns
+    -------
+    regressions : list of str.
+                  The benchmarks that regressed.
+
+    """
+    regressions = []
+
+    print()
+    print("{:<70}{:>12}{:>12}{:>8}".format("benchmark", "baseline [s]", "now [s]", "ratio"))
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[key]["seconds"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print("{:<70}{:>12.4f}{:>12.4f}{:>8.2f}{}".format(key, baseline[key]["seconds"], result["seconds"], ratio, flag))
+
+    return regressions
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Benchmarks the hot paths of the model on synthetic semesters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of students")
+    parser.add_argument("--graders", type=int, nargs="+", default=GRADERS, help="numbers of graders per submission")
+    parser.add_argument("--components", nargs="+", default=list(COMPONENTS), choices=list(COMPONENTS), help="components to benchmark")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs of each component")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic semesters")
+    parser.add_argument("--save", help="save the results as benchmarks/results/SAVE.json")
+    parser.add_argument("--compare", help="compare the results with benchmarks/results/COMPARE.json")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown (ratio of times) that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.graders, args.components, args.repeats, args.seed)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, args.save + ".json"), 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(os.path.join(RESULTS_DIR, args.compare + ".json"), encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,131 @@
+"""
+Measures the time it takes to import the core engine of the model (everything that the simulations need, i.e. every module except graphing.py) in a fresh interpreter,
+and checks it against a budget. Also checks that none of the plotting packages (or scikit-learn) are imported along the way, since every worker process pays for them.
+
+Run from the model_code directory, e.g.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeats 10 --budget 2.0
+
+The script exits with status 1 if the median import time is over the budget or if a plotting package was imported.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from argparse import ArgumentParser
+import json
+import os, sys
+import subprocess
+from statistics import median
+
+MODEL_CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+"""
+The modules of the core engine (importing the simulation scripts imports everything that the simulations use).
+"""
+CORE_MODULES = [
+        "classes", "setup", "grading", "grading_dmi", "topology", "reports", "evaluation",
+        "mechanisms.registry", "runner", "result_store", "seeding", "experiments",
+        "simulation_binary-effort_bias", "simulation_binary-effort_no-bias",
+        "simulation_continuous-effort_bias", "simulation_continuous-effort_no-bias", "simulation_continuous-effort_bias_MSE-quality",
+        "simulation_strategic_continous-effort_bias", "simulation_truthful-vs-strategic-payments", "simulation_incentives-for-deviating-from-truthfulness",
+    ]
+
+"""
+Packages that must not be imported by the core engine.
+"""
+FORBIDDEN_MODULES = ["matplotlib", "seaborn", "pandas", "sklearn", "graphing"]
+
+"""
+The import-time budget for the core engine, in seconds. Most of it is numpy and scipy.stats (for the distributions in classes.py and the metrics in evaluation.py).
+"""
+IMPORT_TIME_BUDGET = 2.0
+
+_MEASURE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "forbidden": [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+def measure_import_time():
+    """
+    Imports the core engine in a fresh interpreter (with python -X importtime).
+
+    Returns
+    -------
+    seconds : float.
+              The time it took to import CORE_MODULES.
+    forbidden : list of str.
+                The FORBIDDEN_MODULES that were imported.
+    packages : dict.
+               Maps each top-level package that was imported to its cumulative import time in seconds (from the python -X importtime report).
+
+    """
+    code = _MEASURE.format(modules=CORE_MODULES, forbidden=FORBIDDEN_MODULES)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=MODEL_CODE_DIR, capture_output=True, text=True, check=True)
+
+    packages = {}
+    for line in process.stderr.splitlines():
+        #import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[0].startswith("import time:") or fields[1].strip() == "cumulative":
+            continue
+        name = fields[2].rstrip()
+        if name.startswith(" ") and not name.startswith("  "):
+            package = name.strip().split(".")[0]
+            packages[package] = packages.get(package, 0) + int(fields[1]) / 1e6
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+
+    return result["seconds"], result["forbidden"], packages
+
+def check_import_time(repeats=5, budget=IMPORT_TIME_BUDGET):
+    """
+    Measures the import time of the core engine repeats times and prints a report.
+
+    Parameters
+    ----------
+    repeats : int, optional.
+              The default is 5.
+    budget : float, optional.
+             The budget for the median import time, in seconds. The default is IMPORT_TIME_BUDGET.
+
+    Returns
+    -------
+    ok : bool.
+         True if the median import time is within the budget and none of the FORBIDDEN_MODULES were imported.
+
+    """
+    runs = [measure_import_time() for _ in range(repeats)]
+    times = [seconds for seconds, forbidden, packages in runs]
+    forbidden = sorted({name for seconds, forbidden, packages in runs for name in forbidden})
+
+    median_time = median(times)
+    seconds, _, packages = min(runs, key=lambda run: abs(run[0] - median_time))
+
+    print("Import time of the core engine: median {:.3f} s, min {:.3f} s, max {:.3f} s ({} runs, budget {:.3f} s).".format(median_time, min(times), max(times), repeats, budget))
+    print("Slowest packages (cumulative, median run):")
+    for package, package_time in sorted(packages.items(), key=lambda item: -item[1])[:10]:
+        print("    {:<40} {:.3f} s".format(package, package_time))
+
+    ok = True
+    if forbidden:
+        print("FAILED: the core engine imports", ", ".join(forbidden))
+        ok = False
+    if median_time > budget:
+        print("FAILED: the median import time is over the budget.")
+        ok = False
+
+    return ok
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Checks the import time of the core engine against a budget.")
+    parser.add_argument("--repeats", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET, help="budget for the median import time, in seconds")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_import_time(args.repeats, args.budget) else 1)
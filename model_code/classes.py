@@ -32,7 +32,7 @@ class Student:
                     Used in experiments for real data to store info about submissions that a Student graded that do not meet the necessary criteria to be used as a Submission object in the experiments.
     """
     
-    def __init__(self, num, grader_type="active"):
+    def __init__(self, num, grader_type="active", rng=None):
         """
         Creates a Student object.
         
@@ -41,6 +41,8 @@ class Student:
         num : int.
               Identification number.
         grader_type : str "active" or "passive".
+        rng : numpy.random.Generator, optional.
+              Source of randomness for the bias and effort parameters. The default is None, which uses numpy's global random state.
 
         """
         self.id = num
@@ -49,11 +51,11 @@ class Student:
         
         self.mse = 0
         
-        self.bias = norm.rvs(loc=0, scale=1, random_state=None)
+        self.bias = norm.rvs(loc=0, scale=1, random_state=rng)
     
         lam = 0
         while lam == 0:
-            lam = uniform.rvs(loc=0, scale=2, random_state=None)
+            lam = uniform.rvs(loc=0, scale=2, random_state=rng)
         self.lam = lam
         
         self.grades = {}
@@ -119,7 +121,7 @@ class StrategicStudent(Student):
                           Denotes a bias correction term that is accessed when using the "Fix-Bias" strategy.
     """
     
-    def __init__(self, num, strat="TRUTH"):
+    def __init__(self, num, strat="TRUTH", rng=None):
         """
         Creates a StrategicStudent object.
         
@@ -129,13 +131,15 @@ class StrategicStudent(Student):
                Identification number.
         strat : str.
                 A strategy to follow (from the list above).
+        rng : numpy.random.Generator, optional.
+              Source of randomness for the bias, effort and bias correction parameters. The default is None, which uses numpy's global random state.
         
         """
-        super().__init__(num)
+        super().__init__(num, rng=rng)
 
         self.strategy = strat
         
-        bias_correction_magnitude = halfnorm.rvs(loc=0, scale=1, random_state=None)
+        bias_correction_magnitude = halfnorm.rvs(loc=0, scale=1, random_state=rng)
         bias_correction_sign = -1
         if self.bias < 0:
             bias_correction_sign = 1
@@ -143,7 +147,7 @@ class StrategicStudent(Student):
         self.bias_correction = bias_correction_sign * bias_correction_magnitude
     
         
-    def report(self, signal, prior=7):
+    def report(self, signal, prior=7, rng=None):
         """
         Generates a report for the StrategicStudent object given a signal. Supersedes report() method from Student class.
         
@@ -151,6 +155,10 @@ class StrategicStudent(Student):
         ----------
         signal : int 0-10.
                  Signal observed by the StrategicStudent grading a submission.
+        prior : int or float, optional.
+                The prior mean grade, used by the "MERGE", "PRIOR" and "HEDGE" strategies. The default is 7.
+        rng : numpy.random.Generator, optional.
+              Source of randomness for the "NOISE" strategy. The default is None, which uses numpy's global random state.
         
         Returns
         -------
@@ -162,7 +170,7 @@ class StrategicStudent(Student):
         sigma = self.strategy
         
         if sigma == "NOISE":
-            noise = norm.rvs(loc=0, scale=1, random_state=None)
+            noise = norm.rvs(loc=0, scale=1, random_state=rng)
             noisy_signal = signal + noise
             report = int(round(noisy_signal))
             if report > 10:
@@ -231,7 +239,7 @@ class Submission:
              Stores the reports from each Student who graded this submission.
              grades = {grader id (int): score (int 0-10) } 
     """
-    def __init__(self, s_id, assignment_num):
+    def __init__(self, s_id, assignment_num, rng=None):
         """
         Creates a Submission object.
         
@@ -239,10 +247,12 @@ class Submission:
         ----------
         s_id : int submission identification number.
         assignment_num : int assignment identification number.
+        rng : numpy.random.Generator, optional.
+              Source of randomness for the ground truth score. The default is None, which uses numpy's global random state.
 
         """
         self.student_id = s_id
         self.assignment_number = assignment_num
-        self.true_grade = binom.rvs(n=10, p=0.7, random_state=None)
+        self.true_grade = binom.rvs(n=10, p=0.7, random_state=rng)
         
         self.grades = {}
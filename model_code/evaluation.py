@@ -1,17 +1,400 @@
 """
 Evaluation metrics that are used to measure the performance of the mechanisms at various tasks.
 
+Each metric has an array version (suffix _arrays), which takes arrays of payments and ground truth values,
+and a version that takes a list of Student objects and reads those values from their attributes.
+
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from itertools import combinations
-from numpy import isnan
-from pandas import DataFrame, qcut
-from sklearn.metrics import roc_auc_score, mean_squared_error
+import numpy as np
 from scipy.stats import kendalltau, pearsonr
-from statistics import mean
 from sys import maxsize
 
+"""
+Upper bound on the number of entries in the intermediate arrays that are computed at once by the batch_ functions.
+"""
+MAX_BATCH_ENTRIES = 2**24
+
+def clean_payments(payments):
+    """
+    Formats payments so that they are valid inputs to the metrics: nan payments become 0, and payments are clamped to [-maxsize - 1, maxsize].
+
+    Parameters
+    ----------
+    payments : array-like of floats.
+
+    Returns
+    -------
+    payments : np.array of floats.
+
+    """
+    minsize = -maxsize - 1
+    payments = np.nan_to_num(np.asarray(payments, dtype=float), nan=0.0, posinf=maxsize, neginf=minsize)
+    return np.clip(payments, minsize, maxsize)
+
+def pairwise_aucs(scores, classes, num_classes):
+    """
+    Computes the ROC AUC score for separating every pair of classes by score, from a single sort of the scores.
+
+    The AUC for classes i < j (treating j as the positive class) is the Mann-Whitney statistic: the fraction of (i, j) pairs in which the member of class j has the higher score,
+    with ties counted as half. For every group of tied scores, the number of members of each class below the group is found with a cumulative sum over the sorted groups.
+
+    Parameters
+    ----------
+    scores : np.array of floats, shape (n,).
+    classes : np.array of ints, shape (n,).
+              The class of each score, in [0, num_classes).
+    num_classes : int.
+
+    Returns
+    -------
+    aucs : np.array of floats, shape (num_classes, num_classes).
+           aucs[j, i] is the AUC for classifying members of classes i and j as class j by their scores.
+
+    """
+    return batch_pairwise_aucs(scores[None, :], classes[None, :], num_classes)[0]
+
+def batch_pairwise_aucs(scores, classes, num_classes):
+    """
+    Row-by-row version of pairwise_aucs, for a 2-D array of scores (e.g. semesters x students), computed in one pass.
+
+    Parameters
+    ----------
+    scores : np.array of floats, shape (num_rows, n).
+    classes : np.array of ints, shape (num_rows, n).
+    num_classes : int.
+
+    Returns
+    -------
+    aucs : np.array of floats, shape (num_rows, num_classes, num_classes).
+           aucs[r, j, i] is pairwise_aucs(scores[r], classes[r], num_classes)[j, i].
+
+    """
+    num_rows, n = scores.shape
+
+    order = np.argsort(scores, axis=1, kind="stable")
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+    sorted_classes = np.take_along_axis(classes, order, axis=1)
+
+    #Index of the group of tied scores that each (sorted) score belongs to, within its row.
+    group = np.zeros((num_rows, n), dtype=np.int64)
+    np.cumsum(sorted_scores[:, 1:] != sorted_scores[:, :-1], axis=1, out=group[:, 1:])
+
+    flat = ((np.arange(num_rows)[:, None]*n + group)*num_classes + sorted_classes).ravel()
+    counts = np.bincount(flat, minlength=num_rows*n*num_classes).reshape(num_rows, n, num_classes).astype(float)
+    below = np.cumsum(counts, axis=1) - counts
+
+    wins = np.einsum("rgj,rgi->rji", counts, below + 0.5*counts)
+    class_sizes = counts.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return wins / (class_sizes[:, :, None]*class_sizes[:, None, :])
+
+def quantile_bins(values, q):
+    """
+    Assigns values to q equal-sized bins by quantile, in the same way as pandas.qcut(values, q, labels=False).
+
+    Parameters
+    ----------
+    values : np.array of floats, shape (n,).
+    q : int.
+        The number of bins.
+
+    Returns
+    -------
+    bins : np.array of ints, shape (n,).
+           The bin of each value, in [0, q). The bins are intervals (edges[k], edges[k + 1]], except that the first bin also includes the minimum.
+
+    """
+    bins, unique = batch_quantile_bins(np.asarray(values)[None, :], q)
+    if not unique[0]:
+        raise ValueError("Bin edges must be unique: " + repr(np.quantile(values, np.linspace(0, 1, q + 1))) + ".")
+    return bins[0]
+
+def batch_quantile_bins(values, q):
+    """
+    Row-by-row version of quantile_bins, for a 2-D array of values.
+
+    Parameters
+    ----------
+    values : np.array of floats, shape (num_rows, n).
+    q : int.
+
+    Returns
+    -------
+    bins : np.array of ints, shape (num_rows, n).
+    unique : np.array of bools, shape (num_rows,).
+             False for rows in which the bin edges are not unique (where quantile_bins raises an error).
+
+    """
+    edges = np.quantile(values, np.linspace(0, 1, q + 1), axis=1).T
+    unique = np.all(edges[:, 1:] != edges[:, :-1], axis=1)
+
+    #The number of inner edges below each value.
+    bins = (values[:, :, None] > edges[:, None, 1:-1]).sum(axis=2)
+
+    return bins, unique
+
+def roc_auc_arrays(labels, payments):
+    """
+    Computes the ROC AUC score for classifying agents by their payments.
+
+    Parameters
+    ----------
+    labels : array-like of bools or {0, 1}, shape (n,).
+             True (or 1) for the positive class.
+    payments : array-like of floats, shape (n,).
+
+    Returns
+    -------
+    score : float.
+            ROC AUC score.
+
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    if len(np.unique(labels)) != 2:
+        raise ValueError("Only one class present in y_true. ROC AUC score is not defined in that case.")
+
+    aucs = pairwise_aucs(clean_payments(payments), labels, 2)
+    return float(aucs[1, 0])
+
+def aucs_mse_arrays(payments, mses, include_q=True):
+    """
+    Computes AUC scores (binary and quinary AUC) for classifying a student as above or below the median in terms of grading ability (i.e. MSE in grading tasks) according to their payment.
+
+    Parameters
+    ----------
+    payments : array-like of floats, shape (n,).
+    mses : array-like of floats, shape (n,).
+    include_q : bool, optional
+        Indicates wheter to calculate quinary AUC (see paper) in addition to binary.
+        Default is True
+
+    Returns
+    -------
+    binary_score : float
+        Binary AUC (see paper)
+    quinary_score : float
+        Quinary AUC (see paper)
+        Zero if include_q is False
+
+    """
+    return _quality_aucs(clean_payments(payments), -1*np.asarray(mses, dtype=float), include_q)
+
+def _quality_aucs(payments, quality, include_q):
+    """
+    Binary and quinary AUC (see aucs_mse_arrays) for formatted payments and quality = -1*MSE.
+    """
+    binary = quantile_bins(quality, 2)
+    binary_score = float(pairwise_aucs(payments, binary, 2)[1, 0])
+
+    if include_q:
+        quinary = quantile_bins(quality, 5)
+        aucs = pairwise_aucs(payments, quinary, 5)
+        #Average over the pairs of quintiles i < j, with j as the positive class.
+        j, i = np.triu_indices(5, 1)[::-1]
+        quinary_score = float(np.mean(aucs[j, i]))
+    else:
+        quinary_score = 0
+
+    return binary_score, quinary_score
+
+def correlation_arrays(true, payments):
+    """
+    Computes the Pearson correlation coefficient (rho) between ground truth values and payments.
+
+    Parameters
+    ----------
+    true : array-like of floats, shape (n,).
+    payments : array-like of floats, shape (n,).
+
+    Returns
+    -------
+    rho : float.
+          Pearson correlation coefficient.
+
+    """
+    rho, p_value = pearsonr(np.asarray(true, dtype=float), clean_payments(payments))
+    return rho
+
+def kendall_tau_arrays(true, payments):
+    """
+    Computes the Kendall rank correlation coefficient (Kendall's tau_B) between the ranking given by ground truth values and the ranking given by payments.
+
+    Parameters
+    ----------
+    true : array-like of floats, shape (n,).
+    payments : array-like of floats, shape (n,).
+
+    Returns
+    -------
+    tau : float.
+          Kendall rank correlation coefficient.
+
+    """
+    tau, p_value = kendalltau(np.asarray(true, dtype=float), clean_payments(payments))
+    return tau
+
+def mse_metrics_arrays(payments, mses, include_q=True):
+    """
+    Computes all of the metrics that compare payments to MSE (see aucs_mse, kendall_tau_mse and correlation_mse), formatting the payments once and sharing them between the metrics.
+
+    Parameters
+    ----------
+    payments : array-like of floats, shape (n,).
+    mses : array-like of floats, shape (n,).
+    include_q : bool, optional
+        See aucs_mse_arrays. Default is True.
+
+    Returns
+    -------
+    binary_score : float
+    quinary_score : float
+    tau : float
+    rho : float
+
+    """
+    payments = clean_payments(payments)
+    quality = -1*np.asarray(mses, dtype=float)
+
+    binary_score, quinary_score = _quality_aucs(payments, quality, include_q)
+    tau, p_value = kendalltau(quality, payments)
+    rho, p_value = pearsonr(quality, payments)
+
+    return binary_score, quinary_score, tau, rho
+
+def batch_roc_auc_arrays(labels, payments):
+    """
+    Row-by-row version of roc_auc_arrays, for 2-D arrays (e.g. semesters x students).
+
+    Parameters
+    ----------
+    labels : array-like of bools or {0, 1}, shape (num_rows, n).
+    payments : array-like of floats, shape (num_rows, n).
+
+    Returns
+    -------
+    scores : np.array of floats, shape (num_rows,).
+             nan for rows in which only one class is present.
+
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    aucs = batch_pairwise_aucs(clean_payments(payments), labels, 2)
+    return aucs[:, 1, 0]
+
+def batch_metrics_arrays(payments, true, include_q=True):
+    """
+    Computes the binary AUC, quinary AUC, Kendall's tau and Pearson's rho between payments and a ground truth measure of quality for every row of 2-D arrays,
+    e.g. one row for each simulated (semester, mechanism). Row r gives the same values as mse_metrics_arrays(payments[r], -1*true[r], include_q).
+
+    Rows are processed in chunks (bounded by MAX_BATCH_ENTRIES). Kendall's tau is computed from the signs of all pairwise differences,
+    unless a single row has more than MAX_BATCH_ENTRIES pairs, in which case scipy.stats.kendalltau is called on each row.
+
+    Parameters
+    ----------
+    payments : array-like of floats, shape (num_rows, n).
+    true : array-like of floats, shape (num_rows, n).
+           Ground truth quality of each student, where higher is better (e.g. -1*MSE, or the effort parameter lam).
+    include_q : bool, optional
+        See aucs_mse_arrays. Default is True.
+
+    Returns
+    -------
+    binary_scores : np.array of floats, shape (num_rows,).
+    quinary_scores : np.array of floats, shape (num_rows,).
+                     All zero if include_q is False.
+    taus : np.array of floats, shape (num_rows,).
+    rhos : np.array of floats, shape (num_rows,).
+
+    Rows in which the quantile bins are not unique (where aucs_mse raises an error) have nan AUCs.
+
+    """
+    payments = clean_payments(np.atleast_2d(payments))
+    true = np.atleast_2d(np.asarray(true, dtype=float))
+    num_rows, n = payments.shape
+
+    binary_scores = np.zeros(num_rows)
+    quinary_scores = np.zeros(num_rows)
+    taus = np.zeros(num_rows)
+
+    chunk = max(1, MAX_BATCH_ENTRIES // max(1, 5*n))
+    j, i = np.triu_indices(5, 1)[::-1]
+
+    for start in range(0, num_rows, chunk):
+        rows = slice(start, start + chunk)
+
+        bins, unique = batch_quantile_bins(true[rows], 2)
+        binary_scores[rows] = np.where(unique, batch_pairwise_aucs(payments[rows], bins, 2)[:, 1, 0], np.nan)
+
+        if include_q:
+            bins, unique = batch_quantile_bins(true[rows], 5)
+            aucs = batch_pairwise_aucs(payments[rows], bins, 5)
+            quinary_scores[rows] = np.where(unique, aucs[:, j, i].mean(axis=1), np.nan)
+
+    chunk = MAX_BATCH_ENTRIES // max(1, n*n)
+    if chunk > 0:
+        for start in range(0, num_rows, chunk):
+            rows = slice(start, start + chunk)
+            taus[rows] = batch_kendall_tau(true[rows], payments[rows])
+    else:
+        for r in range(num_rows):
+            taus[r], p_value = kendalltau(true[r], payments[r])
+
+    rhos = batch_correlation(true, payments)
+
+    return binary_scores, quinary_scores, taus, rhos
+
+def batch_kendall_tau(x, y):
+    """
+    Computes Kendall's tau_B between the rows of two 2-D arrays, from the signs of all pairwise differences within each row.
+
+    tau_B = (concordant - discordant pairs) / sqrt((pairs not tied in x) * (pairs not tied in y)).
+
+    Parameters
+    ----------
+    x : np.array of floats, shape (num_rows, n).
+    y : np.array of floats, shape (num_rows, n).
+
+    Returns
+    -------
+    taus : np.array of floats, shape (num_rows,).
+           nan for rows in which x or y is constant.
+
+    """
+    sign_x = np.sign(x[:, :, None] - x[:, None, :]).astype(np.int8)
+    sign_y = np.sign(y[:, :, None] - y[:, None, :]).astype(np.int8)
+
+    difference = np.einsum("rij,rij->r", sign_x, sign_y, dtype=np.int64)
+    untied_x = np.abs(sign_x).sum(axis=(1, 2), dtype=np.int64)
+    untied_y = np.abs(sign_y).sum(axis=(1, 2), dtype=np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return difference / np.sqrt(untied_x.astype(float) * untied_y)
+
+def batch_correlation(x, y):
+    """
+    Computes Pearson's rho between the rows of two 2-D arrays.
+
+    Parameters
+    ----------
+    x : np.array of floats, shape (num_rows, n).
+    y : np.array of floats, shape (num_rows, n).
+
+    Returns
+    -------
+    rhos : np.array of floats, shape (num_rows,).
+           nan for rows in which x or y is constant.
+
+    """
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rhos = np.einsum("rn,rn->r", x, y) / np.sqrt(np.einsum("rn,rn->r", x, x) * np.einsum("rn,rn->r", y, y))
+
+    return np.clip(rhos, -1, 1)
+
 def roc_auc(student_list):
     """
     Computes the ROC AUC score for classifying agents as "active" or "passive" based on their payments.
@@ -23,38 +406,14 @@ def roc_auc(student_list):
 
     Returns
     -------
-    score : float. 
+    score : float.
             ROC AUC score.
 
     """
-    true = []
-    scores = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        classification = 0
-        if student.type == "active":
-            classification = 1
-        true.append(classification)
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the roc_auc_score function from sklearn.metrics.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        
-        scores.append(p)
-        
-    score = roc_auc_score(true, scores)
-    return score
+    labels = [student.type == "active" for student in student_list]
+    payments = [student.payment for student in student_list]
+
+    return roc_auc_arrays(labels, payments)
 
 def roc_auc_strategic(student_list):
     """
@@ -71,43 +430,19 @@ def roc_auc_strategic(student_list):
             ROC AUC score.
 
     """
-    true = []
-    scores = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        classification = 0
-        if student.strategy == "TRUTH":
-            classification = 1
-        true.append(classification)
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the roc_auc_score function from sklearn.metrics.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        
-        scores.append(p)
-        
-    score = roc_auc_score(true, scores)
-    return score
+    labels = [student.strategy == "TRUTH" for student in student_list]
+    payments = [student.payment for student in student_list]
+
+    return roc_auc_arrays(labels, payments)
 
 def aucs_mse(student_list, include_q = True):
     """
     Computes AUC scores (binary and quinary AUC) for classifying a student as above or below the median in terms of grading ability (i.e. MSE in grading tasks) according to their payment.
-    
+
     Parameters
     ----------
     student_list : list of Student objects.
-        
+
     include_q : bool, optional
         Indicates wheter to calculate quinary AUC (see paper) in addition to binary.
         Default is True
@@ -120,186 +455,93 @@ def aucs_mse(student_list, include_q = True):
         Quinary AUC (see paper)
         Zero if include_q is False
     """
-    payments = []
-    mses = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the roc_auc_score function from sklearn.metrics.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        payments.append(p)
-        
-        mses.append(-1*student.mse)
-    
-    d = {"Payment": payments, "MSE": mses}
-
-    df = DataFrame(data=d)
-    
-    df['Binary'] = qcut(df['MSE'], 2, labels = False)
-    if include_q:
-        df['Quinary'] = qcut(df['MSE'], 5, labels = False)
-    
-    binary_score = roc_auc_score(df['Binary'], df['Payment'])
-    
-    if include_q:
-        quinary_aucs = []
-        for (i,j) in combinations(range(5), 2):
-            q_df = df.loc[((df['Quinary'] == i) | (df['Quinary'] == j)), ['Payment', 'Quinary']]
-            pairwise = roc_auc_score(q_df['Quinary'], q_df['Payment'])
-            quinary_aucs.append(pairwise)
-        quinary_score = mean(quinary_aucs)
-    else:
-        quinary_score = 0
-        
-    return binary_score, quinary_score
+    payments = [student.payment for student in student_list]
+    mses = [student.mse for student in student_list]
+
+    return aucs_mse_arrays(payments, mses, include_q)
 
 def correlation_mse(student_list):
     """
     Computes the Pearson correlation coefficient (rho) between the mse of agent reports and their payments.
     Payments were assigned according to some mechanism for completing peer grading tasks over the course of a simulated semester.
-                                                       
+
     Parameters
     ----------
     student_list : A list of Student objects.
-        
+
     Returns
     -------
     rho : float.
           Pearson correlation coefficient.
 
     """
-    rho = 0 
-    
-    true = []
-    scores = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        score = -1*student.mse
-        true.append(score)
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the kendalltau function from scipy.stats.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        
-        scores.append(p)
-    
-    rho, p_value = pearsonr(true, scores)
-    
-    return rho
-    
+    true = [-1*student.mse for student in student_list]
+    payments = [student.payment for student in student_list]
+
+    return correlation_arrays(true, payments)
 
 def kendall_tau(student_list):
     """
     Computes the Kendall rank correlation coefficient (Kendall's tau_B) between the ranking of agents according to the continuous effort parameter (lam) and the ranking of agents according to their payments.
     Payments were assigned according to some mechanism for completing peer grading tasks over the course of a simulated semester.
-                                                       
+
     Parameters
     ----------
     student_list : A list of Student objects.
-        
+
     Returns
     -------
     tau : float.
           Kendall rank correlation coefficient.
 
     """
-    tau = 0 
-    
-    true = []
-    scores = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        score = student.lam
-        true.append(score)
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the kendalltau function from scipy.stats.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        
-        scores.append(p)
-    
-    tau, p_value = kendalltau(true, scores)
-    
-    return tau
+    true = [student.lam for student in student_list]
+    payments = [student.payment for student in student_list]
+
+    return kendall_tau_arrays(true, payments)
 
 def kendall_tau_mse(student_list):
     """
     Computes the Kendall rank correlation coefficient (Kendall's tau_B) between the ranking of agents according to the mse of their reports and the ranking of agents according to their payments.
     Payments were assigned according to some mechanism for completing peer grading tasks over the course of a simulated semester.
-                                                       
+
     Parameters
     ----------
     student_list : A list of Student objects.
-        
+
     Returns
     -------
     tau : float.
           Kendall rank correlation coefficient.
 
     """
-    tau = 0 
-    
-    true = []
-    scores = []
-    
-    minsize = -maxsize - 1
-    
-    for student in student_list:
-        score = -1*student.mse
-        true.append(score)
-        
-        p = student.payment
-        
-        """
-        Formatting to ensure all payments are valid inputs to the kendalltau function from scipy.stats.
-        """
-        if p > maxsize:
-            p = maxsize
-        if p < minsize:
-            p = minsize
-        if isnan(p):
-            #print("Payment is nan")
-            p = 0
-        
-        scores.append(p)
-    
-    tau, p_value = kendalltau(true, scores)
-    
-    return tau
+    true = [-1*student.mse for student in student_list]
+    payments = [student.payment for student in student_list]
+
+    return kendall_tau_arrays(true, payments)
+
+def mse_metrics(student_list, include_q=True):
+    """
+    Computes the binary and quinary AUC, Kendall's tau and Pearson's rho between the mse of agent reports and their payments (see mse_metrics_arrays).
+
+    Parameters
+    ----------
+    student_list : A list of Student objects.
+    include_q : bool, optional
+        See aucs_mse. Default is True.
+
+    Returns
+    -------
+    binary_score : float
+    quinary_score : float
+    tau : float
+    rho : float
+
+    """
+    payments = [student.payment for student in student_list]
+    mses = [student.mse for student in student_list]
+
+    return mse_metrics_arrays(payments, mses, include_q)
 
 def true_grade_mse(true_scores, computed_scores):
     """
@@ -307,9 +549,9 @@ def true_grade_mse(true_scores, computed_scores):
 
     Parameters
     ----------
-    true_scores : list of int 0-10. 
+    true_scores : list of int 0-10.
                   The ground truth scores for the submissions.
-    computed_scores : list of float. 
+    computed_scores : list of float.
                       The estimated scores for the submissions.
 
     Returns
@@ -318,4 +560,7 @@ def true_grade_mse(true_scores, computed_scores):
           The mean squared error of the computed scores.
 
     """
-    return mean_squared_error(true_scores, computed_scores)
\ No newline at end of file
+    #Imported here, because importing scikit-learn takes longer than importing everything else that the simulations need.
+    from sklearn.metrics import mean_squared_error
+
+    return mean_squared_error(true_scores, computed_scores)
@@ -0,0 +1,344 @@
+"""
+Declarative experiment configurations, so that a sweep of simulations can be launched (and restarted) from a config file instead of by editing the __main__ block of a simulation script.
+
+A config is a JSON or YAML file (see load_config), e.g.
+
+    setting: strategic              # honest, MSE-quality, strategic, truthful-vs-strategic or incentives
+    effort: continuous              # binary or continuous
+    bias: true
+    strategies: [NOISE, FIX-BIAS, MERGE, HEDGE]
+    mechanisms:
+      - [BASELINE, MSE]
+      - [Phi-DIV, KL]
+      - [Phi-DIV_P, TVD]
+    iterations: 100
+    workers: 8
+    seed: 0
+    filename: strategic-ce-bias-filename
+
+The setting, effort model and bias select the simulation script that implements the experiment (see SETTINGS), and the sweep is run point by point with that script's
+compare_mechanisms function, with the same seeds and the same layout of results as the script's own simulate function. The optional keys (and their defaults) are listed in DEFAULTS:
+
+    num_active : list of ints, or int.
+                 The numbers of active graders to sweep over (binary effort only). A single int runs a single point, like simulate__fix_num_active_graders.
+    num_assignments : int, or list of ints.
+                      The number of assignments in each semester. For the honest continuous effort and MSE-quality settings, the list of values to sweep over.
+    num_strategic : list of ints.
+                    The numbers of strategic graders to sweep over (strategic settings only). Each point uses the strategy map { strategy: n, "TRUTH": num_students - n }.
+    crn : bool.
+          Common random numbers mode (see runner.run_common_semesters).
+    warm_start : bool.
+                 Indicates whether the EM procedure of the parametric mechanisms is warm-started from the estimates for the previous assignment (see mechanisms.registry.MechanismSettings).
+    accelerate : bool.
+                 Indicates whether the EM procedure of the parametric mechanisms uses SQUAREM extrapolation.
+    plot : bool.
+           Indicates whether the plots that the script makes for the experiment are made as well.
+    batch_size : int.
+                 The number of semesters in each batch of jobs that is saved to the store (see below).
+
+Results are saved as filename.json in the ./results directory (and plots in the ./figures directory) of model_code, exactly as if the script had been run.
+The results of each batch of semesters are saved to filename.jobs.jsonl in the ./results directory as they come in (see result_store.py),
+so an interrupted sweep skips the completed batches when it is run again, and merge_sweep rebuilds filename.json from the store alone.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import ast
+import importlib
+import json
+import os
+
+import numpy as np
+
+from mechanisms.registry import get_mechanism
+from result_store import BATCH_SIZE, ResultStore
+from runner import spawn_seeds
+
+"""
+The directory of the simulation scripts, which holds the results and figures directories.
+"""
+MODEL_CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+"""
+The values of the optional keys of a config. None means that the default depends on the setting (see the _points functions).
+"""
+DEFAULTS = {
+        "iterations": None,
+        "num_students": None,
+        "num_assignments": None,
+        "num_active": None,
+        "num_strategic": None,
+        "strategies": [],
+        "workers": 1,
+        "seed": None,
+        "crn": False,
+        "warm_start": False,
+        "accelerate": False,
+        "plot": True,
+        "batch_size": BATCH_SIZE,
+    }
+
+"""
+The keys of a config that do not change the results of the sweep (and are therefore left out of the hash that keys the store).
+"""
+RUN_OPTIONS = ("workers", "plot", "batch_size")
+
+class Setting:
+    """
+    An experimental setting that a config can select.
+
+    Attributes
+    ----------
+    script : str.
+             The name of the simulation script (without .py) that implements the setting.
+    points : function.
+             points(config) returns the points of the sweep, as a list of (path, args, seed) tuples,
+             where path is the tuple of keys of the point in the results, args are the arguments to the script's compare_mechanisms that precede the list of mechanisms and seed is its root seed.
+    plots : list of 2-tuples of strings.
+            The plotting functions (in graphing.py) that the script calls on the results, with the suffix added to the filename for each.
+    fixed_plots : list of 2-tuples of strings, optional.
+                  The plotting functions for a sweep with a single point (path ()). The default is () (no plots).
+    mechanism_first : bool, optional.
+                      Indicates whether the results are keyed by mechanism first and then by point (as in the MSE-quality script) instead of by point and then by mechanism. The default is False.
+    """
+
+    def __init__(self, script, points, plots, fixed_plots=(), mechanism_first=False):
+        """
+        Creates a Setting object (see the class docstring for the parameters).
+        """
+        self.script = script
+        self.points = points
+        self.plots = plots
+        self.fixed_plots = fixed_plots
+        self.mechanism_first = mechanism_first
+
+def _value(config, key, default):
+    """
+    Returns config[key], or the default if the key was not given.
+    """
+    return default if config[key] is None else config[key]
+
+def _binary_points(config):
+    num_active = _value(config, "num_active", [10, 20, 30, 40, 50, 60, 70, 80, 90])
+    iterations = _value(config, "iterations", 100)
+    num_assignments = _value(config, "num_assignments", 10)
+    num_students = _value(config, "num_students", 100)
+
+    if isinstance(num_active, int):
+        return [((), (iterations, num_assignments, num_students, num_active), np.random.SeedSequence(config["seed"]))]
+
+    seeds = spawn_seeds(config["seed"], len(num_active))
+    return [((active,), (iterations, num_assignments, num_students, active), seed) for active, seed in zip(num_active, seeds)]
+
+def _num_assignments_points(config, iterations, num_students):
+    num_assignments = _value(config, "num_assignments", list(range(1, 16)))
+    if isinstance(num_assignments, int):
+        num_assignments = [num_assignments]
+
+    iterations = _value(config, "iterations", iterations)
+    num_students = _value(config, "num_students", num_students)
+
+    seeds = spawn_seeds(config["seed"], len(num_assignments))
+    return [((n,), (iterations, n, num_students), seed) for n, seed in zip(num_assignments, seeds)]
+
+def _continuous_points(config):
+    return _num_assignments_points(config, 100, 100)
+
+def _mse_quality_points(config):
+    return _num_assignments_points(config, 50, 500)
+
+def _strategic_points(config, num_strategic, with_strategy=False):
+    num_strategic = _value(config, "num_strategic", num_strategic)
+    iterations = _value(config, "iterations", 100)
+    num_assignments = _value(config, "num_assignments", 10)
+    num_students = _value(config, "num_students", 100)
+
+    if not config["strategies"]:
+        raise ValueError("The " + config["setting"] + " setting requires a list of strategies.")
+
+    points = []
+    strategy_seeds = spawn_seeds(config["seed"], len(config["strategies"]))
+    for strategy, strategy_seed in zip(config["strategies"], strategy_seeds):
+        seeds = spawn_seeds(strategy_seed, len(num_strategic))
+        for strat, seed in zip(num_strategic, seeds):
+            strategy_map = {strategy: strat, "TRUTH": num_students - strat}
+            args = (iterations, num_assignments, strategy_map, strategy) if with_strategy else (iterations, num_assignments, strategy_map)
+            points.append(((strategy, strat), args, seed))
+    return points
+
+def _kendall_tau_strategic_points(config):
+    return _strategic_points(config, [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
+
+def _auc_strategic_points(config):
+    return _strategic_points(config, [10, 20, 30, 40, 50, 60, 70, 80, 90])
+
+def _incentives_points(config):
+    return _strategic_points(config, [10, 20, 30, 40, 50, 60, 70, 80, 90], True)
+
+"""
+Maps (setting, effort, bias) to the Setting object that implements it.
+"""
+SETTINGS = {
+        ("honest", "binary", True): Setting("simulation_binary-effort_bias", _binary_points, [("plot_mean_aucc", "")]),
+        ("honest", "binary", False): Setting("simulation_binary-effort_no-bias", _binary_points, [("plot_mean_aucc", "")]),
+        ("honest", "continuous", True): Setting("simulation_continuous-effort_bias", _continuous_points, [("plot_kendall_tau", "")]),
+        ("honest", "continuous", False): Setting("simulation_continuous-effort_no-bias", _continuous_points, [("plot_kendall_tau", "")]),
+        ("MSE-quality", "continuous", True): Setting("simulation_continuous-effort_bias_MSE-quality", _mse_quality_points, [], mechanism_first=True),
+        ("strategic", "continuous", True): Setting("simulation_strategic_continous-effort_bias", _kendall_tau_strategic_points, [("plot_kendall_taus", "")]),
+        ("truthful-vs-strategic", "continuous", True): Setting("simulation_truthful-vs-strategic-payments", _auc_strategic_points, [("plot_auc_strategic", "")]),
+        ("incentives", "continuous", True): Setting("simulation_incentives-for-deviating-from-truthfulness", _incentives_points,
+                                                   [("plot_mean_rank_changes", "-mean_gain"), ("plot_variance_rank_changes", "-variance_gain")]),
+    }
+
+def get_setting(config):
+    """
+    Looks up the Setting object selected by a config. Raises a ValueError if the combination of setting, effort and bias does not match any of the options.
+    """
+    key = (config["setting"], config["effort"], config["bias"])
+    if key not in SETTINGS:
+        options = ", ".join("(" + ", ".join(str(v) for v in option) + ")" for option in SETTINGS)
+        raise ValueError("The given (setting, effort, bias) " + str(key) + " does not match any of the options: " + options + ".")
+    return SETTINGS[key]
+
+def _plotting_functions():
+    """
+    Returns the set of names of the functions in graphing.py, which is parsed rather than imported so that checking a config does not import the plotting packages.
+    """
+    with open(os.path.join(MODEL_CODE_DIR, "graphing.py"), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+
+def load_config(filename):
+    """
+    Reads a config file (YAML if the filename ends in .yaml or .yml, which requires the PyYAML package, and JSON otherwise) and fills in the defaults.
+
+    Parameters
+    ----------
+    filename : str.
+
+    Returns
+    -------
+    config : dict.
+             The required keys are setting, effort, bias, mechanisms and filename (see the module docstring). Mechanisms are converted to 2-tuples of strings.
+
+    """
+    with open(filename, encoding='utf-8') as f:
+        if filename.endswith((".yaml", ".yml")):
+            import yaml
+            raw = yaml.safe_load(f)
+        else:
+            raw = json.load(f)
+
+    missing = [key for key in ("setting", "effort", "bias", "mechanisms", "filename") if key not in raw]
+    if missing:
+        raise ValueError("The config " + filename + " is missing the required keys: " + ", ".join(missing) + ".")
+
+    unknown = [key for key in raw if key not in DEFAULTS and key not in ("setting", "effort", "bias", "mechanisms", "filename")]
+    if unknown:
+        raise ValueError("The config " + filename + " has unknown keys: " + ", ".join(unknown) + ".")
+
+    config = dict(DEFAULTS)
+    config.update(raw)
+
+    config["mechanisms"] = [(str(mechanism), str(param)) for mechanism, param in config["mechanisms"]]
+    for mechanism, param in config["mechanisms"]:
+        get_mechanism(mechanism)
+
+    setting = get_setting(config)
+
+    if config["plot"]:
+        functions = _plotting_functions()
+        missing = [plot for plot, suffix in list(setting.plots) + list(setting.fixed_plots) if plot not in functions]
+        if missing:
+            raise ValueError("The plotting functions " + ", ".join(missing) + " of the setting " + setting.script + " do not exist in graphing.py.")
+
+    return config
+
+def _set(results, path, value):
+    """
+    Sets results[path[0]][path[1]]...[path[-1]] = value, creating the nested dicts as needed.
+    """
+    for key in path[:-1]:
+        results = results.setdefault(key, {})
+    results[path[-1]] = value
+
+def _write_json(filename, contents):
+    """
+    Writes a JSON file under a temporary name and then renames it, so an interrupted write never leaves a partial file behind.
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(contents, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_filename, filename)
+
+def _result_store(config, read_only=False):
+    """
+    Returns the ResultStore of a config, and the config with its root seed (see ResultStore.root_seed).
+    """
+    filename = os.path.join(MODEL_CODE_DIR, "results", config["filename"] + ".jobs.jsonl")
+    contents = {key: value for key, value in config.items() if key not in RUN_OPTIONS}
+    store = ResultStore(filename, contents, config["batch_size"], read_only)
+    return store, dict(config, seed=store.root_seed(config["seed"]))
+
+def run_sweep(config, merge_only=False):
+    """
+    Runs the sweep described by a config (see load_config), skipping the batches of semesters that are already in the store from a previous (interrupted) run.
+
+    Saves a file containing the results of the experiment (in the layout of the script's simulate function) and generates and saves the script's plots of those results.
+    Results are saved as filename.json in the ./results directory of model_code.
+    Plots are saved in the ./figures directory of model_code.
+
+    Parameters
+    ----------
+    config : dict.
+    merge_only : bool, optional.
+                 If True, nothing is simulated: the results are merged from the store, which raises a ValueError if any batch is missing (see merge_sweep). The default is False.
+
+    Returns
+    -------
+    results : dict.
+
+    """
+    setting = get_setting(config)
+    module = importlib.import_module(setting.script)
+
+    store, config = _result_store(config, merge_only)
+
+    points = setting.points(config)
+
+    results = {}
+    for path, args, seed in points:
+        print("Working on simulations for", path)
+        evals = module.compare_mechanisms(*args, config["mechanisms"], config["workers"], seed, config["crn"], store.point(args, seed), config["warm_start"], config["accelerate"])
+
+        for key, score_dict in evals.items():
+            _set(results, (key,) + path if setting.mechanism_first else path + (key,), score_dict)
+
+    """
+    Export JSON file of simulation data to results directory
+    """
+    filename = config["filename"]
+    _write_json(os.path.join(MODEL_CODE_DIR, "results", filename + ".json"), results)
+
+    """
+    Graphing the results in the figures directory
+    """
+    plots = setting.fixed_plots if points[0][0] == () else setting.plots
+    if config["plot"] and plots:
+        cwd = os.getcwd()
+        os.chdir(MODEL_CODE_DIR)
+        try:
+            import graphing
+            for plot, suffix in plots:
+                getattr(graphing, plot)(results, filename + suffix)
+        finally:
+            os.chdir(cwd)
+
+    return results
+
+def merge_sweep(config):
+    """
+    Rebuilds filename.json (and the plots) of a config from its store, without simulating anything, e.g. after the batches were run by several processes.
+    Raises a ValueError if the store does not hold every batch of the sweep.
+    """
+    return run_sweep(config, merge_only=True)
@@ -4,20 +4,31 @@ Helper functions that perform tasks related to "grading an assignment" in a simu
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from networkx import random_regular_graph
-from scipy.stats import binom, poisson
-from statistics import mean
+import numpy as np
 
-def assign_graders(student_list, submission_list, num_graders):
+from reports import AssignmentReports
+from seeding import as_generator
+from topology import AssignmentTopology
+
+def assign_graders(student_list, submission_list, num_graders, rng=None, reciprocal=True):
     """
     Assigns graders (Student objects) to submissions (Submission objects) that they will "grade" (i.e. for which they will receive a signal and compute a report).      
     
+    Every submission gets num_graders distinct graders, the grading load is spread evenly over the students, and no student grades their own submission.
+    When every student wrote exactly one of the submissions (as in the simulations) and reciprocal is True, the graders are the neighbors of the author 
+    in a random num_graders-regular graph on the students (see random_regular_graph), so student i grades student j's submission exactly when j grades i's, 
+    as in the original simulations (which used networkx.random_regular_graph). Otherwise the assignment is drawn by random_regular_assignment, which is not reciprocal.
+    
     Parameters
     ----------
     student_list : list of Student objects.
     submission_list : list of Submission objects for a single assignment (i.e. that all have the same assignment_number attribute).
     num_graders : int.
                   Number of graders that are assigned to grade each submission.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the assignment. The default is None, which uses a Generator seeded from numpy's global random state.
+    reciprocal : bool, optional.
+                 Whether to use a random regular graph when every student wrote exactly one of the submissions. The default is True.
 
     Returns
     -------
@@ -26,25 +37,243 @@ def assign_graders(student_list, submission_list, num_graders):
                  grader_dict = { submission (Submission object): [ graders (Student objects) ] } 
     """
     
-    #student_id_map maps student id numbers (int) to the corresponding Student objects
-    student_id_map = {s.id: s for s in student_list}
+    #student_index maps student id numbers (int) to the position of the corresponding Student object in student_list
+    student_index = {s.id: idx for idx, s in enumerate(student_list)}
+    
+    authors = np.array([student_index.get(submission.student_id, -1) for submission in submission_list], dtype=np.int64)
+    
+    num_students = len(student_list)
+    if reciprocal and len(submission_list) == num_students and np.array_equal(np.sort(authors), np.arange(num_students)):
+        assignment = random_regular_graph(num_students, num_graders, rng)[authors]
+    else:
+        assignment = random_regular_assignment(len(submission_list), num_students, num_graders, authors=authors, rng=rng)
+    
+    topology = AssignmentTopology.from_assignment(assignment, len(student_list))
+    
+    return topology.grader_dict(student_list, submission_list)
+
+def random_regular_assignment(num_submissions, num_graders, d, loads=None, authors=None, rng=None):
+    """
+    Draws a random assignment of graders to submissions in which every submission is graded by d distinct graders.
+    
+    The d*num_submissions grading tasks are dealt out by a configuration model: each grader contributes as many "stubs" as its load, 
+    the stubs are shuffled and cut into rows of d, and any row that repeats a grader or contains the submission's author is repaired 
+    by swapping the offending stubs with randomly chosen stubs elsewhere (which leaves every grader's load unchanged). 
+    Only a small fraction of the stubs ever needs to be swapped, so the cost is linear in the number of grading tasks.
+    
+    When num_submissions == num_graders and authors[i] == i, this is a d-regular assignment without self-grading. Unlike a random regular graph (see random_regular_graph), 
+    it is directed: grader i grading submission j does not mean that grader j grades submission i. It is also not sampled exactly uniformly, since the swaps that repair conflicts 
+    slightly favor some assignments.
+
+    Parameters
+    ----------
+    num_submissions : int.
+    num_graders : int.
+    d : int.
+        Number of graders assigned to each submission. Must be at most num_graders (less the author, if there is one).
+    loads : np.array of ints, shape (num_graders,), optional.
+            The number of submissions assigned to each grader. Must sum to d*num_submissions. 
+            The default is None, which spreads the load as evenly as possible (each grader gets either the floor or the ceiling of d*num_submissions/num_graders).
+    authors : np.array of ints, shape (num_submissions,), optional.
+              The index of the grader who wrote each submission (-1 if the author is not a grader), who will not be assigned to grade it. 
+              The default is None, which means submission i was written by grader i when i < num_graders.
+    rng : numpy.random.Generator, optional.
+          The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    assignment : np.array of ints, shape (num_submissions, d).
+                 Row i contains the indices of the graders of submission i.
+
+    """
+    rng = as_generator(rng)
+    
+    total = d*num_submissions
+    
+    if loads is None:
+        loads = np.full(num_graders, total // num_graders, dtype=np.int64)
+        loads[rng.choice(num_graders, total % num_graders, replace=False)] += 1
+    else:
+        loads = np.asarray(loads, dtype=np.int64)
+        if loads.shape != (num_graders,) or loads.sum() != total:
+            raise ValueError("loads must contain one entry per grader and sum to d*num_submissions.")
+    
+    if authors is None:
+        authors = np.arange(num_submissions, dtype=np.int64)
+        authors[authors >= num_graders] = -1
+    else:
+        authors = np.asarray(authors, dtype=np.int64)
+    
+    if d > num_graders - (1 if np.any(authors >= 0) else 0):
+        raise ValueError("Not enough graders to assign " + str(d) + " distinct graders to every submission.")
+    
+    stubs = np.repeat(np.arange(num_graders, dtype=np.int64), loads)
+    assignment = rng.permutation(stubs).reshape(num_submissions, d)
+    
+    """
+    Repair conflicts, first with rounds of vectorized random swaps, and then (for the few that remain) one at a time.
+    """
+    for _ in range(20):
+        bad = _conflicts(assignment, authors)
+        if bad.size == 0:
+            return assignment
+        
+        partners = rng.integers(0, total, size=bad.size)
+        
+        #Only perform swaps that do not share a position with another swap, so that the multiset of stubs is preserved.
+        positions, counts = np.unique(np.concatenate((bad, partners)), return_counts=True)
+        shared = positions[counts > 1]
+        keep = ~(np.isin(bad, shared) | np.isin(partners, shared))
+        bad, partners = bad[keep], partners[keep]
+        
+        flat = assignment.reshape(-1)
+        flat[bad], flat[partners] = flat[partners], flat[bad].copy()
+    
+    bad = _conflicts(assignment, authors)
+    attempts = 0
+    
+    while bad.size > 0:
+        attempts += 1
+        if attempts > 1000*total:
+            raise ValueError("Could not find a valid assignment with the given loads.")
+        
+        position = int(bad[rng.integers(0, bad.size)])
+        partner = int(rng.integers(0, total))
+        
+        row, other = position // d, partner // d
+        if row != other and _swap_improves(assignment, authors, row, position % d, other, partner % d):
+            flat = assignment.reshape(-1)
+            flat[position], flat[partner] = flat[partner], flat[position]
+            bad = _conflicts(assignment, authors)
+    
+    return assignment
+
+def random_regular_graph(n, d, rng=None):
+    """
+    Draws a random d-regular graph on n nodes (without self-loops or repeated edges), as the list of the neighbors of each node.
+    
+    The edges are drawn by the pairing (configuration) model: each node contributes d "stubs", and the shuffled stubs are paired up. 
+    Self-loops and repeated edges are then repaired one at a time by random double edge swaps, which replace a bad edge (u, v) and another edge (x, y) 
+    with (u, x) and (v, y) when neither of those is a self-loop or an existing edge. The number of bad edges does not grow with n (for fixed d), 
+    so the cost is linear in the number of edges. The pairing model conditioned on a simple graph is uniform over d-regular graphs; 
+    the repair (like the algorithm of networkx.random_regular_graph) only approximates that distribution.
+
+    Parameters
+    ----------
+    n : int.
+        The number of nodes.
+    d : int.
+        The degree of every node. Must be less than n, and n*d must be even.
+    rng : numpy.random.Generator, optional.
+          The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    neighbors : np.array of ints, shape (n, d).
+                Row i contains the neighbors of node i, in increasing order.
+
+    """
+    rng = as_generator(rng)
+    
+    if d >= n or (n*d) % 2 != 0:
+        raise ValueError("There is no " + str(d) + "-regular graph on " + str(n) + " nodes (d must be less than n, and n*d must be even).")
+    
+    num_edges = n*d // 2
+    edges = rng.permutation(np.repeat(np.arange(n, dtype=np.int64), d)).reshape(num_edges, 2)
+    
+    keys = np.minimum(edges[:, 0], edges[:, 1])*n + np.maximum(edges[:, 0], edges[:, 1])
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    
+    repeated = np.isin(keys, unique_keys[counts > 1])
+    bad = np.flatnonzero((edges[:, 0] == edges[:, 1]) | repeated).tolist()
+    
+    if len(bad) > 0:
+        """
+        Repair the bad edges, keeping a count of the copies of every edge.
+        """
+        multiplicity = dict(zip(unique_keys.tolist(), counts.tolist()))
+        key = lambda u, v: min(u, v)*n + max(u, v)
+        
+        attempts = 0
+        while len(bad) > 0:
+            attempts += 1
+            if attempts > 1000*num_edges:
+                raise ValueError("Could not repair the random regular graph.")
+            
+            #Edges are skipped once they are no longer bad (e.g. the other copy of a repeated edge, or an edge that was swapped away).
+            e = bad.pop()
+            u, v = edges[e].tolist()
+            if u != v and multiplicity[key(u, v)] == 1:
+                continue
+            
+            f = int(rng.integers(0, num_edges))
+            x, y = edges[f].tolist()
+            if rng.random() < 0.5:
+                x, y = y, x
+            
+            if f == e or u == x or v == y or key(u, x) == key(v, y) or key(u, x) in multiplicity or key(v, y) in multiplicity:
+                bad.append(e)
+                continue
+            
+            for old in (key(u, v), key(x, y)):
+                multiplicity[old] -= 1
+                if multiplicity[old] == 0:
+                    del multiplicity[old]
+            multiplicity[key(u, x)] = 1
+            multiplicity[key(v, y)] = 1
+            edges[e] = (u, x)
+            edges[f] = (v, y)
+    
+    """
+    List the neighbors of each node.
+    """
+    nodes = np.concatenate((edges[:, 0], edges[:, 1]))
+    neighbors = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.lexsort((neighbors, nodes))
+    
+    return neighbors[order].reshape(n, d)
+
+def _conflicts(assignment, authors):
+    """
+    Returns the flat positions in assignment that repeat a grader earlier in the same row or that assign a submission to its author.
+    """
+    order = np.argsort(assignment, axis=1, kind="stable")
+    sorted_rows = np.take_along_axis(assignment, order, axis=1)
+    
+    repeated = np.zeros(assignment.shape, dtype=bool)
+    duplicate = sorted_rows[:, 1:] == sorted_rows[:, :-1]
+    np.put_along_axis(repeated, order[:, 1:], duplicate, axis=1)
     
-    d = num_graders
-    n = len(student_list)
-    G = random_regular_graph(d, n)
+    own = assignment == authors[:, None]
     
-    grader_dict = {}
-    for submission in submission_list:
-        node = submission.student_id
-        neighbors = G.neighbors(node)
-        graders = [student_id_map[neighbor] for  neighbor in neighbors]
-        grader_dict[submission] = graders
-    return grader_dict
+    return np.flatnonzero(repeated | own)
+
+def _row_conflicts(row, author):
+    """
+    Counts the entries of a row that repeat an earlier entry or that are equal to the author.
+    """
+    return (len(row) - len(set(row))) + sum(1 for g in row if g == author)
+
+def _swap_improves(assignment, authors, row, col, other, other_col):
+    """
+    Checks that exchanging assignment[row, col] and assignment[other, other_col] does not increase the number of conflicts in the two rows.
+    (Swaps that leave the number unchanged are accepted, so that the search can move away from configurations where no single swap helps.)
+    """
+    first = assignment[row].tolist()
+    second = assignment[other].tolist()
+    before = _row_conflicts(first, authors[row]) + _row_conflicts(second, authors[other])
+    
+    first[col], second[other_col] = second[other_col], first[col]
+    after = _row_conflicts(first, authors[row]) + _row_conflicts(second, authors[other])
+    
+    return after <= before
 
 def get_grading_dict(grader_dict):
     """
     Inverts the information in grader_dict to create a grading_dict that maps a Student object to a list of Submission objects that they will grade.
     
+    The inversion is done on index arrays (see topology.py). Graders appear in the order in which they first appear in grader_dict, and their submissions in the order of the keys of grader_dict.
+    
     Parameters
     ----------
     grader_dict :  dict.
@@ -58,21 +287,19 @@ def get_grading_dict(grader_dict):
 
     """
     
-    grading_dict = {}
-    for key, val in grader_dict.items():
-        for grader in val:
-            if grader not in grading_dict.keys():
-                grading_dict[grader] = []
-            grading_dict[grader].append(key)
-    return grading_dict
+    topology, graders, submissions = AssignmentTopology.from_grader_dict(grader_dict)
+    
+    return topology.grading_dict(graders, submissions)
 
-def assign_grades(grading_dict, num_draws, assignment_num, continuous_effort=False, bias=False):
+def assign_grades(grading_dict, num_draws, assignment_num, continuous_effort=False, bias=False, rng=None):
     """
     Simulates the grading process. Records the appropriate grading reports.
     Students grade the Submissions that they are assigned to grade (according to grading_dict) as follows:
         First, a signal is generated (according to the ground truth score and the bias and effort of the grader).
         Then, a report, which is a function of the signal, is generated and stored in the "grades" attribute (a dict) of the relevant Student and Submission object.
     
+    All of the signals for the assignment are generated at once by generate_signals.
+    
     Parameters
     ----------
     grading_dict : dict.
@@ -81,51 +308,100 @@ def assign_grades(grading_dict, num_draws, assignment_num, continuous_effort=Fal
     num_draws: int.
                Number of draws from Binom distribution that an active grader gets to see. 
                Only relevant when continuous_effort = False.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the signals and the strategic reports. The default is None, which uses a Generator seeded from numpy's global random state.
 
     Returns
     -------
-    None.
+    reports : AssignmentReports object.
+              Array-backed copy of the reports (see reports.py), which the array versions of the mechanisms consume directly.
     
     """
-    for grader, submissions in grading_dict.items():
-        
-        grader.grades[assignment_num] = {}
-        
+    rng = as_generator(rng)
+    
+    graders = list(grading_dict.keys())
+    
+    submission_map = {}
+    for submissions in grading_dict.values():
         for submission in submissions:
-            ground_truth = submission.true_grade
-            bias_val = 0
-            
-            if bias:
-                bias_val += grader.bias
-            
-            probability = (ground_truth + bias_val)/10.0
-            if probability > 1:
-                probability = 1.0
-            elif probability < 0:
-                probability = 0.0
-                
-            if continuous_effort:
-                l = grader.lam
-                num = 1 + poisson.rvs(mu=l, loc=0, random_state=None)
-        
-            else:
-                if grader.type == "active":
-                    num = num_draws
-                else:
-                    num = 1
-                    
-            draws = []
-            for i in range(num):
-                draw = binom.rvs(n=10, p=probability, random_state=None)
-                draws.append(draw)
-                
-            avg = mean(draws)
-            signal = int(round(avg))
-            
-            grade = grader.report(signal)
-                
-            grader.grades[assignment_num][submission.student_id] = grade
-            submission.grades[grader.id] = grade
+            submission_map[submission.student_id] = submission
+    submissions = [submission_map[key] for key in sorted(submission_map.keys())]
+    task_index = {submission.student_id: idx for idx, submission in enumerate(submissions)}
+    
+    rows = []
+    cols = []
+    for g_idx, grader in enumerate(graders):
+        for submission in grading_dict[grader]:
+            rows.append(g_idx)
+            cols.append(task_index[submission.student_id])
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+    
+    true_grades = np.array([submission.true_grade for submission in submissions], dtype=float)
+    
+    if bias:
+        bias_vals = np.array([grader.bias for grader in graders], dtype=float)
+    else:
+        bias_vals = np.zeros(len(graders))
+    
+    if continuous_effort:
+        lams = np.array([grader.lam for grader in graders], dtype=float)
+        num = 1 + rng.poisson(lams[rows])
+    else:
+        per_grader = np.array([num_draws if grader.type == "active" else 1 for grader in graders], dtype=np.int64)
+        num = per_grader[rows]
+    
+    signals = generate_signals(true_grades[cols], bias_vals[rows], num, rng)
+    
+    """
+    Apply each grader's reporting strategy. Truthful graders report their signals, so only strategic graders need to be visited individually.
+    """
+    grades = signals.copy()
+    strategic = np.array([getattr(grader, "strategy", "TRUTH") != "TRUTH" for grader in graders], dtype=bool)
+    if strategic.any():
+        for idx in np.flatnonzero(strategic[rows]).tolist():
+            grades[idx] = graders[rows[idx]].report(int(signals[idx]), rng=rng)
+    
+    grader_ids = [grader.id for grader in graders]
+    task_ids = [submission.student_id for submission in submissions]
+    
+    reports = AssignmentReports(assignment_num, grader_ids, task_ids, rows, cols, grades.astype(np.int8), None, true_grades)
+    reports.write_to_objects(graders, submissions)
+    
+    errors = reports.squared_errors().tolist()
+    for g_idx, grader in enumerate(graders):
+        grader.mse += errors[g_idx]
             
-            grader.update_mse(ground_truth, grade)
-    
\ No newline at end of file
+    return reports
+
+def generate_signals(true_grades, bias_vals, num, rng):
+    """
+    Generates a batch of signals.
+    
+    Each signal is the average of num draws from Binom(10, p), rounded to the nearest integer, where p = (true grade + bias)/10 clipped to [0, 1].
+    The sum of num independent Binom(10, p) draws is a single Binom(10*num, p) draw, so one call to the Generator suffices for the whole batch.
+
+    Parameters
+    ----------
+    true_grades : np.array of floats.
+                  The ground truth score of the submission being graded, for each signal.
+    bias_vals : np.array of floats.
+                The bias of the grader, for each signal.
+    num : np.array of ints.
+          The number of draws averaged into each signal.
+    rng : numpy.random.Generator.
+
+    Returns
+    -------
+    signals : np.array of ints 0-10.
+
+    """
+    probability = np.clip((true_grades + bias_vals)/10.0, 0.0, 1.0)
+    num = np.asarray(num, dtype=np.int64)
+    
+    draws = rng.binomial(10*num, probability)
+    
+    #np.rint rounds half to even, like round() in the scalar version.
+    signals = np.rint(draws / num).astype(np.int64)
+    
+    return signals
@@ -5,12 +5,20 @@ Helper function that assigns graders when the DMI mechanism is being used, effec
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
+from functools import lru_cache
+
+import numpy as np
+
+from topology import AssignmentTopology
+
 def assign_graders_dmi_clusters(student_list, submission_list, cluster_size):
     """
     Assigns graders (Student objects) to submissions (Submission objects) that they will "grade" (i.e. for which they will receive a signal and compute a report).
         
     Graders are clustered in groups such that a group will all grade the same Submissions 
     (which will be the Submissions submitted by the Students from another cluster). 
+    
+    The clusters only depend on the number of students and the cluster size, so the topology is computed once and reused (see dmi_cluster_topology).
        
     Parameters
     ----------
@@ -27,13 +35,38 @@ def assign_graders_dmi_clusters(student_list, submission_list, cluster_size):
 
     """
     
-    grader_dict = {}
+    topology = dmi_cluster_topology(len(submission_list), cluster_size)
+    
+    grader_dict = topology.grader_dict(student_list, submission_list)
     
+    #Submissions are listed starting from the ones graded by the first cluster.
     submissions = submission_list[cluster_size:] + submission_list[:cluster_size]
     
-    for i in range(0, len(submissions), cluster_size):
-        students = [student_list[i + j] for j in range(cluster_size)]
-        for j in range(cluster_size):
-            grader_dict[submissions[i + j]] = students
+    return {submission: grader_dict[submission] for submission in submissions}
+
+@lru_cache(maxsize=64)
+def dmi_cluster_topology(num_students, cluster_size):
+    """
+    Computes (and caches) the topology of the DMI clusters: the students in positions [i, i + cluster_size) grade the submissions in positions [i + cluster_size, i + 2*cluster_size), 
+    wrapping around at the end of the list.
+
+    Parameters
+    ----------
+    num_students : int.
+                   Should be divisible by cluster_size.
+    cluster_size : int.
+
+    Returns
+    -------
+    topology : AssignmentTopology object.
+
+    """
+    if num_students % cluster_size != 0:
+        raise ValueError("The number of students (" + str(num_students) + ") must be divisible by the cluster size (" + str(cluster_size) + ").")
+    
+    submissions = np.arange(num_students, dtype=np.int64)
+    first_grader = ((submissions // cluster_size) - 1) % (num_students // cluster_size) * cluster_size
+    
+    graders = first_grader[:, None] + np.arange(cluster_size, dtype=np.int64)
     
-    return grader_dict
\ No newline at end of file
+    return AssignmentTopology.from_assignment(graders, num_students)
@@ -1,6 +1,8 @@
 """
 Functions that plot the results from the simulated experiments.
 
+This is the only module that needs seaborn, matplotlib (with a LaTeX install, for text.usetex) and pandas, so the simulation scripts only import it when they make a plot.
+
 @author: Noah Burrell <burrelln@umich.edu>
 """
 import seaborn as sns
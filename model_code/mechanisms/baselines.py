@@ -6,6 +6,8 @@ Implementation of the baseline MSE mechanism.
 
 from statistics import mean
 
+import numpy as np
+
 def mean_squared_error(grader_dict):
     """
     Computes payments for students according to the baseline MSE mechanism.
@@ -40,4 +42,34 @@ def mean_squared_error(grader_dict):
             
             grader.payment -= avg_squared_error
 
-    return scores            
\ No newline at end of file
+    return scores
+
+def mean_squared_error_arrays(reports):
+    """
+    Computes payments for students according to the baseline MSE mechanism, using the array-backed reports for an assignment.
+    Equivalent to mean_squared_error, but returns the payments instead of updating the Student objects (see AssignmentReports.add_payments).
+    
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+
+    Returns
+    -------
+    scores : np.array of floats, shape (n_tasks,).
+             ``consensus grade'' for each task (nan for penalty tasks).
+    payments : np.array of floats, shape (n_graders,).
+
+    """
+    rows, cols, values = reports.entries()
+    keep = reports.is_submission[cols]
+    rows, cols, values = rows[keep], cols[keep], values[keep].astype(float)
+    
+    counts = np.bincount(cols, minlength=reports.num_tasks)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        consensus_grades = np.bincount(cols, weights=values, minlength=reports.num_tasks) / counts
+    consensus_grades[~reports.is_submission] = np.nan
+    
+    errors = values - consensus_grades[cols]
+    payments = -0.25 * np.bincount(rows, weights=errors * errors, minlength=reports.num_graders)
+    
+    return consensus_grades, payments
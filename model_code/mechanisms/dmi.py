@@ -5,11 +5,22 @@ Implementation of the Determinant-based Mutual Information (DMI) Mechanism (Kong
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from itertools import combinations
-from random import shuffle
 import numpy as np
-        
-def dmi_mechanism(grader_dict, assignment_num, cluster_size):
+
+from reports import AssignmentReports
+from seeding import as_generator
+
+"""
+Maps each grade (0-10) to a report category: grades 0-6 are reported as 0 and grades 7-10 are reported as 1.
+"""
+GRADE_MAP = np.array([0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1])
+
+"""
+Upper bound on the number of entries in the stacked (clusters x graders x graders x C x C) count matrices that are computed at once.
+"""
+MAX_BATCH_ENTRIES = 2**22
+
+def dmi_mechanism(grader_dict, assignment_num, cluster_size, grade_map=GRADE_MAP, rng=None):
     """
     Computes payments for students according to the DMI mechanism.
 
@@ -22,56 +33,94 @@ def dmi_mechanism(grader_dict, assignment_num, cluster_size):
     cluster_size : int.
                    The size of the clusters in which students grade submissions (should evenly divide the number of students.)
                    All students in a cluster grade the same submissions (the submissions from another cluster of students.)
+    grade_map : np.array of ints, optional.
+                grade_map[grade] is the report category of a grade. The default is GRADE_MAP (2 categories).
+    rng : numpy.random.Generator, optional.
+          Source of randomness for splitting the tasks of each cluster in half. The default is None, which uses a Generator seeded from numpy's global random state.
 
     Returns
     -------
     None.
 
     """
-    grade_map = {
-        0: 0,
-        1: 0,
-        2: 0,
-        3: 0,
-        4: 0,
-        5: 0,
-        6: 0,
-        7: 1,
-        8: 1,
-        9: 1,
-        10: 1
-        }
-    
-    submission_dict = {submission.student_id: submission for submission in grader_dict.keys()}
-    task_list = [submission.student_id for submission in grader_dict.keys()]
-    
-    task_list.sort()
-    
-    for i in range(0, len(task_list), cluster_size):
-        submission0 = submission_dict[i]
-        graders = grader_dict[submission0]
-        tasks = [task_list[i + j] for j in range(cluster_size)]
-        shuffle(tasks)
-        
-        for (j, k) in combinations(graders, 2):
-            M_1 = np.zeros((2, 2), dtype=np.uint8)
-            M_2 = np.zeros((2, 2), dtype=np.uint8)
-            
-            
-            for t in range(cluster_size):
-                j_grade = grade_map[j.grades[assignment_num][tasks[t]]]
-                k_grade = grade_map[k.grades[assignment_num][tasks[t]]]
-    
-                if t < cluster_size/2:
-                    M_1[j_grade, k_grade] += 1
-                    
-                else:
-                    M_2[j_grade, k_grade] += 1
-        
-            d1 = np.linalg.det(M_1)
-            d2 = np.linalg.det(M_2)
-        
-            score = d1*d2
-        
-            j.payment += score
-            k.payment += score
\ No newline at end of file
+    reports = AssignmentReports.from_grader_dict(grader_dict, assignment_num)
+
+    payments = dmi_mechanism_arrays(reports, cluster_size, grade_map, rng)
+
+    graders = {grader.id: grader for grader_list in grader_dict.values() for grader in grader_list}
+    reports.add_payments(payments, graders.values())
+
+def dmi_mechanism_arrays(reports, cluster_size, grade_map=GRADE_MAP, rng=None):
+    """
+    Computes payments for students according to the DMI mechanism, using the array-backed reports for an assignment.
+    Equivalent to dmi_mechanism, but returns the payments instead of updating the Student objects (see AssignmentReports.add_payments).
+
+    The tasks (sorted by id) are split into consecutive clusters of cluster_size tasks, which are all graded by the same graders.
+    The tasks of each cluster are shuffled and split in half, and every pair of graders (j, k) in the cluster is paid det(M_1)*det(M_2),
+    where M_1[c, d] (resp. M_2) counts the tasks in the first (resp. second) half for which j reported category c and k reported category d.
+
+    The reports are one-hot encoded as a (clusters x graders x tasks x C) array, so the count matrices for all of the pairs of graders (in many clusters at once)
+    are computed with a single einsum, and the determinants with a single call to np.linalg.det on the stack of C x C matrices.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    cluster_size : int.
+                   See dmi_mechanism.
+    grade_map : np.array of ints, optional.
+                See dmi_mechanism. The default is GRADE_MAP.
+    rng : numpy.random.Generator, optional.
+          See dmi_mechanism. The default is None.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+
+    """
+    rng = as_generator(rng)
+
+    grade_map = np.asarray(grade_map)
+    num_categories = int(grade_map.max()) + 1
+
+    if reports.num_tasks % cluster_size != 0:
+        raise ValueError("The cluster size (" + str(cluster_size) + ") must evenly divide the number of tasks (" + str(reports.num_tasks) + ").")
+
+    num_clusters = reports.num_tasks // cluster_size
+
+    clusters = np.argsort(reports.task_ids, kind="stable").reshape(num_clusters, cluster_size)
+    clusters = rng.permuted(clusters, axis=1)
+
+    indptr, indices = reports.graders_by_task()
+    graders = [indices[indptr[cluster[0]]:indptr[cluster[0] + 1]] for cluster in clusters]
+    num_graders = len(graders[0]) if num_clusters > 0 else 0
+    if any(len(rows) != num_graders for rows in graders):
+        raise ValueError("Every cluster of tasks must be graded by the same number of graders.")
+
+    payments = np.zeros(reports.num_graders)
+    if num_graders < 2:
+        return payments
+
+    graders = np.array(graders)
+
+    #Category of the report of grader graders[k, i] for task clusters[k, t].
+    categories = grade_map[reports.lookup(graders[:, :, None], clusters[:, None, :])]
+    one_hot = (categories[..., None] == np.arange(num_categories)).astype(float)
+
+    half = (cluster_size + 1) // 2
+    batch = max(1, MAX_BATCH_ENTRIES // (num_graders*num_graders*num_categories*num_categories))
+
+    for start in range(0, num_clusters, batch):
+        block = one_hot[start:start + batch]
+
+        M_1 = np.einsum("kitc,kjtd->kijcd", block[:, :, :half], block[:, :, :half])
+        M_2 = np.einsum("kitc,kjtd->kijcd", block[:, :, half:], block[:, :, half:])
+
+        scores = np.linalg.det(M_1) * np.linalg.det(M_2)
+
+        #Each grader is paid the scores of the pairs it belongs to (the matrix of scores is symmetric, and the diagonal holds the "pairs" (j, j)).
+        diagonal = np.arange(num_graders)
+        scores[:, diagonal, diagonal] = 0
+
+        np.add.at(payments, graders[start:start + batch], scores.sum(axis=2))
+
+    return payments
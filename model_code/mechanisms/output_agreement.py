@@ -51,4 +51,54 @@ def oa_mechanism(grader_dict):
                 score = 1.0 / R[one_report]
                 
             one.payment += constant*score
-            two.payment += constant*score
\ No newline at end of file
+            two.payment += constant*score
+
+def oa_mechanism_arrays(reports):
+    """
+    Computes payments for students according to the OA mechanism, using the array-backed reports for an assignment.
+    Equivalent to oa_mechanism, but returns the payments instead of updating the Student objects (see AssignmentReports.add_payments).
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+
+    """
+    
+    H = np.ones(11)
+    R = np.multiply(H, (1.0/np.sum(H)))
+    
+    return agreement_payments(reports, R)
+
+def agreement_payments(reports, R):
+    """
+    Computes the payments from scoring every pair of graders on every submission with score 1/R[report] when the pair agrees (and 0 otherwise).
+    
+    A grader's total score on a task only depends on how many of the other graders gave the same report, so the payments are computed from the per-task report counts rather than from the pairs.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    R : np.array of floats.
+        Normalized histogram of report values.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+
+    """
+    counts = reports.report_counts(len(R))
+    num_graders = counts.sum(axis=1)
+    
+    rows, cols, values = reports.entries()
+    keep = reports.is_submission[cols] & (num_graders[cols] > 1)
+    rows, cols, values = rows[keep], cols[keep], values[keep].astype(np.int64)
+    
+    constant = 1/(num_graders[cols] - 1)
+    agreements = counts[cols, values] - 1
+    scores = constant * agreements * (1.0 / R[values])
+    
+    return np.bincount(rows, weights=scores, minlength=reports.num_graders)
@@ -7,10 +7,10 @@ Implementation of the parametric MSE mechanism and the EM procedure used to esti
 from math import sqrt
 
 import numpy as np
-from sklearn.metrics import mean_squared_error as mse
-from scipy.stats import gamma as gamma_distribution    
 
-def mse_p_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias=True, bias_correct=False):
+from reports import AssignmentReports
+
+def mse_p_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias=True, bias_correct=False, em_state=None):
     """
     Computes payments for students according to the MSE_P mechanism.   
     
@@ -32,6 +32,10 @@ def mse_p_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias=T
         The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
     bias : bool, optional.
         Indicates whether agents have bias, and therefore whether bias parameters should be estimated. The default is True.
+    bias_correct : bool, optional.
+        Indicates whether the estimated biases are subtracted from the reports before they are compared to the estimated grades. The default is False.
+    em_state : EMState object, optional.
+        Carries estimates across assignments (warm starts) and records iteration counts. The default is None.
 
     Returns
     -------
@@ -43,33 +47,73 @@ def mse_p_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias=T
              {student_id: estimated bias}
 
     """
-    biases, reliability, scores, iteration = em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma, bias)
+    reports = AssignmentReports.from_grader_dict(grader_dict, assignment_num)
+    
+    score_array, reliability_array, bias_array, payments, iteration = mse_p_mechanism_arrays(reports, mu, gamma, bias, bias_correct, em_state)
     
     if not iteration < 1000:
         print("EM estimation procedure did not converge.")
-        for student in student_list:
-            student.payment += 0
     
     else:
-        for student in student_list:
-            tasks = []
-            reports = []
-            ground_truth = []
-            if bias_correct:
-                b = biases[student.id]
-            else:
-                b = 0
-            
-            for task, report in student.grades[assignment_num].items():
-                tasks.append(task)
-                reports.append(report - b)
-                ground_truth.append(scores[task])
-                
-            student.payment -= mse(ground_truth, reports)
+        reports.add_payments(payments, student_list)
+    
+    scores, reliability, biases = _parameter_dicts(reports, student_list, score_array, reliability_array, bias_array)
             
     return scores, reliability, biases
 
-def em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma, include_bias=False):
+def mse_p_mechanism_arrays(reports, mu, gamma, bias=True, bias_correct=False, em_state=None):
+    """
+    Computes payments for students according to the MSE_P mechanism, using the array-backed reports for an assignment.
+    Equivalent to mse_p_mechanism, but returns the payments instead of updating the Student objects (see AssignmentReports.add_payments).
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    mu : float.
+        The mean of the normal approximation of the distribution of true grades.
+    gamma : float.
+        The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
+    bias : bool, optional.
+        Indicates whether agents have bias, and therefore whether bias parameters should be estimated. The default is True.
+    bias_correct : bool, optional.
+        Indicates whether the estimated biases are subtracted from the reports before they are compared to the estimated grades. The default is False.
+    em_state : EMState object, optional.
+        Carries estimates across assignments (warm starts) and records iteration counts. The default is None.
+
+    Returns
+    -------
+    scores : np.array of floats, shape (n_tasks,).
+             Estimated grade of each task (nan for penalty tasks).
+    reliability : np.array of floats, shape (n_graders,).
+    biases : np.array of floats, shape (n_graders,).
+    payments : np.array of floats, shape (n_graders,).
+               All zeros if the EM estimation procedure did not converge.
+    iteration : int.
+                See em_estimate_parameters.
+
+    """
+    if em_state is None:
+        biases, reliability, scores, iteration = em_estimate_parameters_arrays(reports, mu, gamma, bias)
+    else:
+        biases, reliability, scores, iteration = em_state.estimate(reports, mu, gamma, bias)
+    
+    payments = np.zeros(reports.num_graders)
+    
+    if iteration < 1000:
+        rows, cols, values = _submission_entries(reports)
+        
+        b = biases[rows] if bias_correct else 0
+        errors = (scores[cols] - (values - b))**2
+        
+        n = np.bincount(rows, minlength=reports.num_graders)
+        total = np.bincount(rows, weights=errors, minlength=reports.num_graders)
+        
+        graded = n > 0
+        payments[graded] = -total[graded]/n[graded]
+    
+    return scores, reliability, biases, payments, iteration
+
+def em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma, include_bias=False, em_state=None):
     """
     Estimates parametric model parameters using EM-style algorithm with Bayesian updating. 
 
@@ -87,6 +131,8 @@ def em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma,
         The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
     include_bias : bool, optional.
         Indicates whether agents have bias, and therefore whether bias parameters should be estimated. The default is False.
+    em_state : EMState object, optional.
+        Carries estimates across assignments (warm starts) and records iteration counts. The default is None.
 
     Returns
     -------
@@ -102,90 +148,278 @@ def em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma,
                 Value indicates either that the score estimates conveged or that the score estimates did not converge and the estimation was stopped after 1000 iterations.
     """
     
-    biases = {student.id: 0 for student in student_list}
-    reliability = {student.id: (2*gamma)for student in student_list} 
-    scores = {submission.student_id: int(round(mu)) for submission in grader_dict.keys()}
+    reports = AssignmentReports.from_grader_dict(grader_dict, assignment_num)
     
-    new_scores = np.zeros(len(scores))
-    old_scores = np.ones(len(scores))
+    if em_state is None:
+        bias_array, reliability_array, score_array, iteration = em_estimate_parameters_arrays(reports, mu, gamma, include_bias)
+    else:
+        bias_array, reliability_array, score_array, iteration = em_state.estimate(reports, mu, gamma, include_bias)
     
-    iteration = 0
-    termination = 0.0001
+    scores, reliability, biases = _parameter_dicts(reports, student_list, score_array, reliability_array, bias_array)
+    
+    return biases, reliability, scores, iteration
+
+def em_estimate_parameters_arrays(reports, mu, gamma, include_bias=False, initial_biases=None, initial_reliability=None, accelerate=False):
+    """
+    Estimates parametric model parameters using EM-style algorithm with Bayesian updating, from the array-backed reports for an assignment.
     
-    score = np.linalg.norm((old_scores - new_scores))
+    The reports are treated as a sparse (graders x tasks) matrix in coordinate form, so each step of an iteration is a weighted sum over the reports (np.bincount) 
+    rather than a loop over Student and Submission objects. The updates and the convergence criterion are the same as in em_estimate_parameters.
     
-    while score > termination and iteration < 1000:
+    With accelerate=True, the EM updates of (biases, reliability) are treated as a fixed-point map F and extrapolated with SQUAREM (Varadhan and Roland 2008):
+    every two EM steps are followed by a step of length alpha along the estimated direction of convergence. 
+    Each evaluation of F counts as one iteration, so the iteration counts are comparable with and without acceleration.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    mu : float.
+        The mean of the normal approximation of the distribution of true grades.
+    gamma : float.
+        The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
+    include_bias : bool, optional.
+        Indicates whether agents have bias, and therefore whether bias parameters should be estimated. The default is False.
+    initial_biases : np.array of floats, shape (n_graders,), optional.
+        Starting values for the biases (e.g. the estimates from the previous assignment). The default is None, which starts from zero.
+        Ignored when include_bias==False.
+    initial_reliability : np.array of floats, shape (n_graders,), optional.
+        Starting values for the reliabilities. The default is None, which starts from 2*gamma.
+    accelerate : bool, optional.
+        Indicates whether to use SQUAREM extrapolation. The default is False.
+
+    Returns
+    -------
+    biases : np.array of floats, shape (n_graders,).
+             All zeros when include_bias==False.
+    reliability : np.array of floats, shape (n_graders,).
+    scores : np.array of floats, shape (n_tasks,).
+             Estimated grade of each task (nan for penalty tasks).
+    iteration : int.
+                The total number of iterations of the EM process.
+                Value indicates either that the score estimates conveged or that the score estimates did not converge and the estimation was stopped after 1000 iterations.
+
+    """
+    n_graders = reports.num_graders
+    n_tasks = reports.num_tasks
+    
+    rows, cols, values = _submission_entries(reports)
+    
+    #Number of reports given by each grader.
+    n = np.bincount(rows, minlength=n_graders)
+    
+    biases = np.zeros(n_graders)
+    if include_bias and initial_biases is not None:
+        biases = np.array(initial_biases, dtype=float)
         
-        old_scores_dict = scores.copy()
+    reliability = np.full(n_graders, 2*gamma)
+    if initial_reliability is not None:
+        reliability = np.array(initial_reliability, dtype=float)
+    
+    submissions = reports.is_submission
     
-        #One Iteration of EM
-        for submission in grader_dict.keys():
+    prior_tau = 1
+    prior_a = 10.0/1.05
+    prior_B = 10.0
+    
+    def em_step(biases, reliability):
+        """
+        One Iteration of EM. Returns the scores computed from the given parameters, and the updated parameters.
+        """
         #First compute the scores
-            graders = list(submission.grades.keys())
-            
-            numerator_list = [sqrt(reliability[g])*(submission.grades[g] - biases[g]) for g in graders]
-            denominator_list = [sqrt(reliability[g]) for g in graders]
-            
-            numerator_sum = sum(numerator_list)
-            denominator_sum = sum(denominator_list)
-            
-            numerator = sqrt(gamma)*mu + numerator_sum
-            denominator = sqrt(gamma) + denominator_sum
-            
-            scores[submission.student_id] = numerator/denominator
+        weights = np.sqrt(reliability)[rows]
+        
+        numerator_sum = np.bincount(cols, weights=weights*(values - biases[rows]), minlength=n_tasks)
+        denominator_sum = np.bincount(cols, weights=weights, minlength=n_tasks)
+        
+        scores = (sqrt(gamma)*mu + numerator_sum)/(sqrt(gamma) + denominator_sum)
         
         if include_bias:
-            for student in student_list:
             #Then compute the bias
+            """
+            BAYESIAN UPDATING: Conjugate prior is a Normal distirbution.
+            """
+            sample_sum = np.bincount(rows, weights=values - scores[cols], minlength=n_graders)
+            
+            posterior_tau = prior_tau + n*reliability
+            biases = (reliability*sample_sum)/posterior_tau
+            
+        #Then compute the reliability
+        """
+        BAYESIAN UPDATING: Conjugate Prior is a Gamma distribution
+        """
+        residuals = (values - (scores[cols] + biases[rows]))**2
+        residual_sum = np.bincount(rows, weights=residuals, minlength=n_graders)
+        
+        posterior_a = prior_a + n/2.0
+        posterior_B = prior_B + residual_sum/2.0
+        
+        #Mean of the Gamma(a, scale=1/B) distribution.
+        reliability = posterior_a / posterior_B
+        
+        return scores, biases, reliability
+    
+    iteration = 0
+    termination = 0.0001
+    
+    old_scores = np.full(n_tasks, float(int(round(mu))))
+    score = np.inf
+    
+    while score > termination and iteration < 1000:
+        
+        scores, new_biases, new_reliability = em_step(biases, reliability)
+        iteration += 1
+        score = np.linalg.norm((old_scores - scores)[submissions])
+        old_scores = scores
+        
+        if accelerate and score > termination and iteration < 1000:
+            scores, next_biases, next_reliability = em_step(new_biases, new_reliability)
+            iteration += 1
+            score = np.linalg.norm((old_scores - scores)[submissions])
+            old_scores = scores
+            
+            if score > termination:
                 """
-                BAYESIAN UPDATING: Conjugate prior is a Normal distirbution.
+                SQUAREM extrapolation.
                 """
-                #prior_mu = 0
-                prior_tau = 1
+                theta_0 = np.concatenate((biases, reliability))
+                theta_1 = np.concatenate((new_biases, new_reliability))
+                theta_2 = np.concatenate((next_biases, next_reliability))
                 
-                samples = [(s - scores[num]) for num, s in student.grades[assignment_num].items()]
-                sample_sum = sum(samples)
+                r = theta_1 - theta_0
+                v = (theta_2 - theta_1) - r
                 
-                n = len(samples)
+                norm_v = np.linalg.norm(v)
+                alpha = -np.linalg.norm(r)/norm_v if norm_v > 0 else -1.0
+                alpha = min(alpha, -1.0)
                 
-                tau = reliability[student.id]
+                theta = theta_0 - 2*alpha*r + (alpha**2)*v
                 
-                posterior_tau = prior_tau + n*tau
-                posterior_mu = (tau*sample_sum)/posterior_tau
+                #Fall back to the plain EM iterate if the extrapolation leaves the parameter space.
+                if np.all(np.isfinite(theta)) and np.all(theta[n_graders:] > 0):
+                    new_biases, new_reliability = theta[:n_graders], theta[n_graders:]
+                else:
+                    new_biases, new_reliability = next_biases, next_reliability
+            else:
+                new_biases, new_reliability = next_biases, next_reliability
+        
+        biases, reliability = new_biases, new_reliability
+    
+    scores = np.array(old_scores)
+    scores[~submissions] = np.nan
+        
+    return biases, reliability, scores, iteration
 
-                biases[student.id] = posterior_mu
-                
-            
-        for student in student_list:
-        #Then compute the reliability
-            """
-            BAYESIAN UPDATING: Conjugate Prior is a Gamma distribution
-            """
-            prior_a = 10.0/1.05
-            prior_B = 10.0
-            
-            residuals = [ (s - (scores[num] + biases[student.id]))**2 for num, s in student.grades[assignment_num].items()]
-            n = len(residuals)
-            residual_sum = sum(residuals)
-            
-            posterior_a = prior_a + n/2.0
-            posterior_B = prior_B + residual_sum/2.0
-            
-            posterior_theta = 1.0 / posterior_B
+class EMState:
+    """
+    Per-student EM estimates that are carried over from one assignment to the next over the course of a semester, along with a record of the number of iterations each EM run took.
+    
+    Passing an EMState object to the MSE_P or parametric Phi-Div mechanisms warm-starts the EM procedure from the previous estimates of each student's reliability and bias
+    (students who have not been seen before start from the usual defaults).
+
+    Attributes
+    ----------
+    warm_start : bool.
+                 Indicates whether stored estimates are used as starting values. If False, only the telemetry is recorded.
+    accelerate : bool.
+                 Indicates whether the EM procedure uses SQUAREM extrapolation.
+    reliability : dict.
+                  { student_id: most recent estimated reliability }
+    biases : dict.
+             { student_id: most recent estimated bias }
+    iterations : list of ints.
+                 The number of iterations taken by each EM run, in order.
+    """
+    
+    def __init__(self, warm_start=True, accelerate=False):
+        """
+        Creates an EMState object.
+
+        Parameters
+        ----------
+        warm_start : bool, optional.
+                     The default is True.
+        accelerate : bool, optional.
+                     The default is False.
+
+        """
+        self.warm_start = warm_start
+        self.accelerate = accelerate
+        self.reliability = {}
+        self.biases = {}
+        self.iterations = []
+    
+    def estimate(self, reports, mu, gamma, include_bias=False):
+        """
+        Runs em_estimate_parameters_arrays, starting from the stored estimates (if warm_start is True), and then stores the new estimates.
         
-            score = gamma_distribution.mean(a=posterior_a, scale=posterior_theta)
+        Estimates are only stored when the EM procedure converged.
 
-            reliability[student.id] = score
+        Parameters
+        ----------
+        reports : AssignmentReports object.
+        mu : float.
+        gamma : float.
+        include_bias : bool, optional.
+                       The default is False.
+
+        Returns
+        -------
+        Same as em_estimate_parameters_arrays.
+
+        """
+        initial_biases = None
+        initial_reliability = None
         
-        idx = 0
-        for sid, score in scores.items():
-            old_score = old_scores_dict[sid]
-            old_scores[idx] = old_score
-            new_scores[idx] = score
-            idx += 1
-            
-        score = np.linalg.norm((old_scores - new_scores))
+        if self.warm_start:
+            grader_ids = reports.grader_ids.tolist()
+            initial_biases = np.array([self.biases.get(g, 0.0) for g in grader_ids], dtype=float)
+            initial_reliability = np.array([self.reliability.get(g, 2*gamma) for g in grader_ids], dtype=float)
         
-        iteration += 1
+        biases, reliability, scores, iteration = em_estimate_parameters_arrays(reports, mu, gamma, include_bias, initial_biases, initial_reliability, self.accelerate)
         
-    return biases, reliability, scores, iteration
\ No newline at end of file
+        self.iterations.append(iteration)
+        
+        if iteration < 1000:
+            grader_ids = reports.grader_ids.tolist()
+            self.biases.update(zip(grader_ids, biases.tolist()))
+            self.reliability.update(zip(grader_ids, reliability.tolist()))
+        
+        return biases, reliability, scores, iteration
+    
+    def mean_iterations(self):
+        """
+        Returns the average number of iterations per EM run (0 if there have been no runs).
+        """
+        if len(self.iterations) == 0:
+            return 0
+        return sum(self.iterations)/len(self.iterations)
+
+def _submission_entries(reports):
+    """
+    Returns the reports on submission tasks in coordinate form (see AssignmentReports.entries), with float values.
+    """
+    rows, cols, values = reports.entries()
+    keep = reports.is_submission[cols]
+    return rows[keep], cols[keep], values[keep].astype(float)
+
+def _parameter_dicts(reports, student_list, scores, reliability, biases):
+    """
+    Converts estimated parameters from arrays into the dicts returned by em_estimate_parameters and mse_p_mechanism.
+    Students who did not grade any submission get a bias of 0 and the prior mean of the reliability.
+    """
+    task_ids = reports.task_ids.tolist()
+    score_dict = {task_ids[t]: float(scores[t]) for t in np.flatnonzero(reports.is_submission)}
+    
+    prior_reliability = (10.0/1.05)/10.0
+    reliability_dict = {}
+    bias_dict = {}
+    for student in student_list:
+        idx = reports.grader_index.get(student.id)
+        if idx is None:
+            reliability_dict[student.id] = prior_reliability
+            bias_dict[student.id] = 0
+        else:
+            reliability_dict[student.id] = float(reliability[idx])
+            bias_dict[student.id] = float(biases[idx])
+    
+    return score_dict, reliability_dict, bias_dict
@@ -7,6 +7,8 @@ Implementation of the Peer Truth Serum Mechanism (Faltings, Jurca, and Radanovic
 import numpy as np
 from itertools import combinations
 
+from .output_agreement import agreement_payments
+
 def pts_mechanism(grader_dict, H_init):
     """
     Computes payments for students according to the PTS mechanism.
@@ -61,4 +63,39 @@ def pts_mechanism(grader_dict, H_init):
             H[one_report] += 1
             H[two_report] += 1
             
-    return H
\ No newline at end of file
+    return H
+
+def pts_mechanism_arrays(reports, H_init):
+    """
+    Computes payments for students according to the PTS mechanism, using the array-backed reports for an assignment.
+    Equivalent to pts_mechanism, but returns the payments instead of updating the Student objects (see AssignmentReports.add_payments).
+    
+    As in pts_mechanism, R is computed from H_init for the whole assignment, and the histogram update counts each report once for every pair it is a part of.
+    Since R does not change within the assignment, the sequential updates are equivalent to a single update with the per-task report counts.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    H_init : np.array (or list) of ints. 
+             Initial histogram of report values.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+    H : np.array of ints.
+        Updated histogram of report values.
+
+    """
+    
+    H = np.array(H_init)
+    R = np.multiply(H, (1.0/np.sum(H)))
+    
+    payments = agreement_payments(reports, R)
+    
+    counts = reports.report_counts(len(H))
+    num_graders = counts.sum(axis=1)
+    pairs_per_report = np.maximum(num_graders - 1, 0)
+    
+    H = H + np.dot(pairs_per_report, counts).astype(H.dtype)
+    
+    return payments, H
@@ -4,14 +4,17 @@ Implementation of the non-parametric and parametric Phi-Divergence pairing mecha
 @author: Noah Burrell <burrelln@umich.edu>
 """
 import numpy as np
-from random import shuffle, choice
-from math import log, exp, sqrt
+from math import exp, sqrt
 from sys import maxsize
-from itertools import combinations
+from functools import lru_cache
 
-from .parametric_mse import em_estimate_parameters
+from .parametric_mse import em_estimate_parameters_arrays
+from .phi_divergences import get_phi_divergence
 
-def phi_divergence_pairing_mechanism(grader_dict, phi_divergence="TVD"):
+from reports import AssignmentReports
+from seeding import as_generator
+
+def phi_divergence_pairing_mechanism(grader_dict, phi_divergence="TVD", rng=None):
     """
     Computes payments for students according to the non-parametric Phi-Div pairing mechanism. 
     
@@ -41,6 +44,8 @@ def phi_divergence_pairing_mechanism(grader_dict, phi_divergence="TVD"):
                             - f(a) = (1 - sqrt(a))^2
                             - f*(b) = -b/b-1, b < 1; infty otherwise.
                             - df(a) = 1 - 1/sqrt(a)
+    rng : numpy.random.Generator, optional.
+          Source of randomness for choosing penalty tasks. The default is None, which uses a Generator seeded from numpy's global random state.
 
     Returns
     -------
@@ -48,130 +53,64 @@ def phi_divergence_pairing_mechanism(grader_dict, phi_divergence="TVD"):
 
     """
     
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+    
+    payments, dropped = phi_divergence_pairing_mechanism_arrays(reports, phi_divergence, rng)
+    
+    apply_pairing_payments(reports, grader_dict, payments, dropped)
+
+def phi_divergence_pairing_mechanism_arrays(reports, phi_divergence="TVD", rng=None):
+    """
+    Computes payments for students according to the non-parametric Phi-Div pairing mechanism, using the array-backed reports for an assignment.
+    Equivalent to phi_divergence_pairing_mechanism, but returns the payments instead of updating the Student objects (see apply_pairing_payments).
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    phi_divergence : str, optional. 
+                     One of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER" (see phi_divergence_pairing_mechanism). The default is TVD.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for partitioning the tasks and choosing penalty tasks. The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+    dropped : np.array of ints, shape (n_graders,).
+              The number of submissions for which each grader had no pair with valid penalty tasks.
+
+    """
+    rng = as_generator(rng)
+    
     minsize = -maxsize - 1
     
-    A, B, S_A, S_B = estimate_pairwise_scoring_matrices(grader_dict, phi_divergence)
+    in_A, S_A, S_B = estimate_pairwise_scoring_matrices_arrays(reports, phi_divergence, rng)
     
-    for submission, graders in grader_dict.items():
-        
-        """
-        COMPUTING THE SCORES
-        
-        1) Randomly separate the four agents into pairs
+    #Penalty scores f*(S[x, y]) for every pair of reports.
+    conjugate = get_phi_divergence(phi_divergence).conjugate
+    P_A = conjugate(S_A)
+    P_B = conjugate(S_B)
     
-        2) For each pair: Choose a penalty task for each agent, score the pair.
+    """
+    COMPUTING THE SCORES
     
-        (Take an average over this process)
-        
-        """
-        assignment = submission.assignment_number
-        
-        bonus = submission.student_id
-        
-        constant_dict = {}
-        temp_scores = {}
-        
-        for grader in graders:
-            constant_dict[grader.id] = (len(graders) - 1)
-            temp_scores[grader.id] = 0
-        
-        pairs = combinations(graders, 2)
+    1) Randomly separate the four agents into pairs
+
+    2) For each pair: Choose a penalty task for each agent, score the pair.
+
+    (Take an average over this process)
+    
+    """
+    def score_pairs(one, two, bonus, x_bonus, y_bonus, x_penalty, y_penalty):
+        scores = np.where(in_A[bonus], 
+                          S_A[x_bonus, y_bonus] - P_A[x_penalty, y_penalty], 
+                          S_B[x_bonus, y_bonus] - P_B[x_penalty, y_penalty])
         
-        for pair in pairs:
-            one = pair[0]
-            two = pair[1]
-            
-            bonus_one_grade = one.grades[assignment][bonus]
-            bonus_two_grade = two.grades[assignment][bonus]
-            
-            penalties_one = list(one.grades[assignment].keys()) 
-            if assignment in one.penalty_tasks.keys():
-                penalties_one += list(one.penalty_tasks[assignment].keys())
-            penalties_one.remove(bonus)
-            penalties_two = list(two.grades[assignment].keys())
-            if assignment in two.penalty_tasks.keys():
-               penalties_two += list(two.penalty_tasks[assignment].keys())
-            penalties_two.remove(bonus)
-            
-            i = 0
-            found = False
-            shuffle(penalties_one)
-            while (i < len(penalties_one)) and (not found):
-                possible = penalties_one[i]
-                if possible not in penalties_two:
-                    penalty_one = possible
-                    found = True
-                elif len(penalties_two) > 1:
-                    penalty_one = possible
-                    penalties_two.remove(penalty_one)
-                    found = True
-                i += 1
-                
-            if not found:
-                #print("Pair of students without possible penalty task:", one.id, two.id)
-                constant_dict[one.id] -= 1
-                constant_dict[two.id] -= 1
-                continue
-                
-            else:
-                if penalty_one in one.grades[assignment].keys():
-                    penalty_one_grade = one.grades[assignment][penalty_one]
-                else:
-                    penalty_one_grade = one.penalty_tasks[assignment][penalty_one]
-                    
-                penalty_two = choice(penalties_two)
-                if penalty_two in two.grades[assignment].keys():
-                    penalty_two_grade = two.grades[assignment][penalty_two]
-                else:
-                    penalty_two_grade = two.penalty_tasks[assignment][penalty_two]
-            
-            if phi_divergence == "TVD":
-                conjugate = lambda b: b
-                    
-            elif phi_divergence == "KL":
-                conjugate = lambda b: exp(b - 1)
-            
-            elif phi_divergence == "CHI_SQUARED":
-                conjugate = lambda b: (b*b)/4 + 1
-                
-            elif phi_divergence == "SQUARED_HELLINGER":
-                conjugate = lambda b: (-b)/(b - 1)
-            
-            if bonus in A:
-                penalty_score = conjugate(S_A[penalty_one_grade, penalty_two_grade])
-                
-                if phi_divergence == "SQUARED_HELLINGER" and np.isnan(penalty_score):
-                    #Conjugate may evaluate to infty/-infty, limit as b -> -infty is -1.
-                    penalty_score = -1
-                    
-                score = S_A[bonus_one_grade, bonus_two_grade] - penalty_score
-            
-            elif bonus in B:
-                penalty_score = conjugate(S_B[penalty_one_grade, penalty_two_grade])
-                
-                if phi_divergence == "SQUARED_HELLINGER" and np.isnan(penalty_score):
-                    #Conjugate may evaluate to infty/-infty, limit as b -> -infty is -1.
-                    penalty_score = -1
-                    
-                score = S_B[bonus_one_grade, bonus_two_grade] - penalty_score
-            
-            #Get rid of numpy -infty vales (raises error in scoring)
-            if score < minsize:
-                score = minsize
-                
-            temp_scores[one.id] += score
-            temp_scores[two.id] += score
-            
-        for grader in graders:
-            constant_inv = constant_dict[grader.id]
-            if constant_inv > 0:
-                constant = 1/constant_inv
-                temp_score = temp_scores[grader.id]
-                grader.payment += constant*temp_score
-            else:
-                grader.num_graded -= 1
+        #Get rid of numpy -infty vales (raises error in scoring)
+        return np.where(scores < minsize, minsize, scores)
+    
+    return pairing_payments(reports, score_pairs, rng)
             
-def estimate_pairwise_scoring_matrices(grader_dict, phi_divergence="TVD"):
+def estimate_pairwise_scoring_matrices(grader_dict, phi_divergence="TVD", rng=None):
     """
     Estimates the scoring matrices used by the non-parametric Phi-Div pairing mechanism. 
 
@@ -197,6 +136,8 @@ def estimate_pairwise_scoring_matrices(grader_dict, phi_divergence="TVD"):
                             - f(a) = (1 - sqrt(a))^2
                             - f*(b) = -b/b-1, b < 1; infty otherwise.
                             - df(a) = 1 - 1/sqrt(a)
+    rng : numpy.random.Generator, optional.
+          Source of randomness for partitioning the tasks. The default is None, which uses a Generator seeded from numpy's global random state.
         
     Returns
     -------
@@ -207,79 +148,80 @@ def estimate_pairwise_scoring_matrices(grader_dict, phi_divergence="TVD"):
                 Used for scoring the tasks in lists A and B, respectively, based on a pair of agent reports.
 
     """
-    A = []
-    B = []
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+    
+    in_A, S_A, S_B = estimate_pairwise_scoring_matrices_arrays(reports, phi_divergence, rng)
+    
+    task_ids = reports.task_ids.tolist()
+    A = [task_ids[t] for t in np.flatnonzero(in_A)]
+    B = [task_ids[t] for t in np.flatnonzero(reports.is_submission & ~in_A)]
+    
+    return A, B, S_A, S_B
+
+def estimate_pairwise_scoring_matrices_arrays(reports, phi_divergence="TVD", rng=None):
+    """
+    Estimates the scoring matrices used by the non-parametric Phi-Div pairing mechanism from the array-backed reports for an assignment.
+    
+    The joint distribution estimate for a set of tasks is sum_t w_t (c_t c_t^T - diag(c_t)), where c_t is the vector of report counts for task t, 
+    so the estimates for both halves of the partition are computed from the count matrix with one matrix product each.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    phi_divergence : str, optional. 
+                     One of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER" (see estimate_pairwise_scoring_matrices). The default is TVD.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for partitioning the tasks. The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    in_A : np.array of bools, shape (n_tasks,).
+           True for the submission tasks in A; the remaining submission tasks form B.
+    S_A,  S_B : 11x11 numpy 2d-arrays.
+                Used for scoring the tasks in A and B, respectively, based on a pair of agent reports.
+
+    """
+    rng = as_generator(rng)
     
     """
     Partition the set of tasks into two equal-sized sets A and B.
     """
     
-    tasks = [submission.student_id for submission in grader_dict.keys()]
-    shuffle(tasks)
-        
+    tasks = np.flatnonzero(reports.is_submission)
+    tasks = tasks[rng.permutation(len(tasks))]
+    
     halfway = int(round(len(tasks)/2))
-        
-    A = tasks[:halfway]
-    B = tasks[halfway:]
     
-    """
+    in_A = np.zeros(reports.num_tasks, dtype=bool)
+    in_A[tasks[:halfway]] = True
+    in_B = reports.is_submission & ~in_A
     
+    """
     COMPUTE EXPECTED RANDOM ESTIMATE OF DISTRIBUTIONS
     
     """
-        
-    normalize_A = 1/len(A)
-    normalize_B = 1/len(B)
-    
-    # JOINT DISTRIBUTION ESTIMATES
-    JA = np.zeros(shape=(11, 11))
-    JB = np.zeros(shape=(11, 11))
     
-    # MARGINAL DISTRIBUTION ESTIMATES
-    MA = np.zeros(11)
-    MB = np.zeros(11)
+    counts = reports.report_counts(11).astype(float)
+    num_graders = counts.sum(axis=1)
     
-    """
-    Compute the expectation of the process of estimating the joint distribution of signals
-    along w/the expectation of the process of estimating the marginal distribution.
-    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        joint_weights = np.where(num_graders > 1, 1/(num_graders*(num_graders - 1)), 0.0)
+        marginal_weights = np.where(num_graders > 0, 1/num_graders, 0.0)
     
-    for submission, graders in grader_dict.items():
-        
-        task = submission.student_id
-        counts = np.zeros(11)
-        
-        for grade in submission.grades.values():
-            counts[grade] += 1
-        
-        matrix = np.outer(counts, counts)
+    def estimate(split):
+        normalize = 1/np.sum(split)
         
-        for i in range(len(counts)):
-            count = counts[i]
-            if count > 0:
-                matrix[i, i] = count * (count - 1)
+        # JOINT DISTRIBUTION ESTIMATE
+        w = np.where(split, joint_weights, 0.0) * normalize
+        J = np.dot(counts.T * w, counts) - np.diag(np.dot(w, counts))
         
-        normalization_coefficient = 1/(len(graders)*(len(graders) - 1))
-        marginal_normalization_coeff = 1/len(graders)
+        # MARGINAL DISTRIBUTION ESTIMATE
+        M = np.dot(np.where(split, marginal_weights, 0.0), counts) * normalize
         
-        if task in A:
-            normalization_coefficient *= normalize_A
-            matrix = np.multiply(matrix, normalization_coefficient)
-            JA += matrix
-            
-            counts *= marginal_normalization_coeff
-            MA += counts
-            
-        else:
-            normalization_coefficient *= normalize_B
-            matrix = np.multiply(matrix, normalization_coefficient)
-            JB += matrix
-            
-            counts *= marginal_normalization_coeff
-            MB += counts
-            
-    MA *= normalize_A
-    MB *= normalize_B
+        return J, M
+    
+    JA, MA = estimate(in_A)
+    JB, MB = estimate(in_B)
     
     """
     Compute the products of the marginal distrubitions estimates
@@ -295,9 +237,9 @@ def estimate_pairwise_scoring_matrices(grader_dict, phi_divergence="TVD"):
     S_A = compute_K(JB, PMB, phi_divergence) 
     S_B = compute_K(JA, PMA, phi_divergence)
     
-    return A, B, S_A, S_B
+    return in_A, S_A, S_B
 
-def parametric_phi_divergence_pairing_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias_correct=True, phi_divergence="TVD"):
+def parametric_phi_divergence_pairing_mechanism(grader_dict, student_list, assignment_num, mu, gamma, bias_correct=True, phi_divergence="TVD", rng=None, em_state=None):
     """
     Computes payments for students according to the parametric Phi-Divergence pairing mechanism, using parametric model estimates for the joint-to-marginal product ratio.
     
@@ -335,6 +277,10 @@ def parametric_phi_divergence_pairing_mechanism(grader_dict, student_list, assig
                             - f(a) = (1 - sqrt(a))^2
                             - f*(b) = -b/b-1, b < 1; infty otherwise.
                             - df(a) = 1 - 1/sqrt(a)
+    rng : numpy.random.Generator, optional.
+          Source of randomness for choosing penalty tasks. The default is None, which uses a Generator seeded from numpy's global random state.
+    em_state : EMState object, optional.
+          Carries EM estimates across assignments (warm starts) and records iteration counts. Only used when bias_correct==True. The default is None.
 
     Returns
     -------
@@ -342,141 +288,83 @@ def parametric_phi_divergence_pairing_mechanism(grader_dict, student_list, assig
 
     """
     
-    minsize = -maxsize - 1
+    reports = AssignmentReports.from_grader_dict(grader_dict, assignment_num)
+    
+    payments, dropped = parametric_phi_divergence_pairing_mechanism_arrays(reports, mu, gamma, bias_correct, phi_divergence, rng, em_state)
+    
+    apply_pairing_payments(reports, grader_dict, payments, dropped)
+
+def parametric_phi_divergence_pairing_mechanism_arrays(reports, mu, gamma, bias_correct=True, phi_divergence="TVD", rng=None, em_state=None):
+    """
+    Computes payments for students according to the parametric Phi-Divergence pairing mechanism, using the array-backed reports for an assignment.
+    Equivalent to parametric_phi_divergence_pairing_mechanism, but returns the payments instead of updating the Student objects (see apply_pairing_payments).
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    mu : float.
+        The mean of the normal approximation of the distribution of true grades.
+    gamma : float.
+        The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
+    bias_correct : bool, optional.
+        Indicates whether reliability and bias parameters should be estimated and used in scoring. The default is True.
+    phi_divergence : str, optional. 
+                     One of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER" (see parametric_phi_divergence_pairing_mechanism). The default is TVD.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for choosing penalty tasks. The default is None, which uses a Generator seeded from numpy's global random state.
+    em_state : EMState object, optional.
+          See parametric_phi_divergence_pairing_mechanism. The default is None.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+    dropped : np.array of ints, shape (n_graders,).
+              The number of submissions for which each grader had no pair with valid penalty tasks.
+
+    """
     
     if bias_correct:
-        biases, reliability, scores, iteration = em_estimate_parameters(grader_dict, student_list, assignment_num, mu, gamma, include_bias=True)
+        if em_state is None:
+            biases, reliability, scores, iteration = em_estimate_parameters_arrays(reports, mu, gamma, include_bias=True)
+        else:
+            biases, reliability, scores, iteration = em_state.estimate(reports, mu, gamma, include_bias=True)
         if not iteration < 1000:
             print("EM estimation procedure did not converge.")
-            biases = {student.id: 0 for student in student_list}
-            reliability = {student.id: 0 for student in student_list}
+            biases = np.zeros(reports.num_graders)
+            reliability = np.zeros(reports.num_graders)
+    else:
+        #Every pair of graders is scored with the same parameters, so a single pair of tables serves the whole assignment.
+        tau_1, tau_2 = regularize_reliability(1/0.7, 1/0.7)
+        shared_tables = parametric_K_tables(mu, gamma, tau_1, tau_2, 0, 0, phi_divergence)
     
-    for submission, graders in grader_dict.items():
-        
-        """
-        COMPUTING THE SCORES
-        
-        1) Randomly separate the four agents into pairs
+    """
+    COMPUTING THE SCORES
     
-        2) For each pair: Choose a penalty task for each agent, score the pair.
+    1) Randomly separate the four agents into pairs
+
+    2) For each pair: Choose a penalty task for each agent, score the pair.
+
+    (Take an average over this process)
     
-        (Take an average over this process)
-        
-        """
-        assignment = submission.assignment_number
-        
-        bonus = submission.student_id
-        
-        constant_dict = {}
-        temp_scores = {}
-        
-        for grader in graders:
-            constant_dict[grader.id] = (len(graders) - 1)
-            temp_scores[grader.id] = 0
-        
-        pairs = combinations(graders, 2)
-        
-        for pair in pairs:
-            one = pair[0]
-            two = pair[1]
-            
-            if bias_correct:
-                unregularized_tau_1 = reliability[one.id]
-                unregularized_tau_2 = reliability[two.id]
-            else:
-                unregularized_tau_1 = 1/0.7
-                unregularized_tau_2 = 1/0.7
-            
-            tau_1, tau_2 = regularize_reliability(unregularized_tau_1, unregularized_tau_2)
-            
-            if bias_correct:
-                b_1 = biases[one.id]
-                b_2 = biases[two.id]
-            else:
-                b_1 = 0
-                b_2 = 0
-            
-            bonus_one_grade = one.grades[assignment][bonus]
-            bonus_two_grade = two.grades[assignment][bonus]
-            
-            penalties_one = list(one.grades[assignment].keys()) 
-            if assignment in one.penalty_tasks.keys():
-                penalties_one += list(one.penalty_tasks[assignment].keys())
-            penalties_one.remove(bonus)
-            penalties_two = list(two.grades[assignment].keys())
-            if assignment in two.penalty_tasks.keys():
-               penalties_two += list(two.penalty_tasks[assignment].keys())
-            penalties_two.remove(bonus)
-            
-            i = 0
-            found = False
-            shuffle(penalties_one)
-            while (i < len(penalties_one)) and (not found):
-                possible = penalties_one[i]
-                if possible not in penalties_two:
-                    penalty_one = possible
-                    found = True
-                elif len(penalties_two) > 1:
-                    penalty_one = possible
-                    penalties_two.remove(penalty_one)
-                    found = True
-                i += 1
-                
-            if not found:
-                #print("Pair of students without possible penalty task:", one.id, two.id)
-                constant_dict[one.id] -= 1
-                constant_dict[two.id] -= 1
-                continue
-            
-            else:
-                if penalty_one in one.grades[assignment].keys():
-                    penalty_one_grade = one.grades[assignment][penalty_one]
-                else:
-                    penalty_one_grade = one.penalty_tasks[assignment][penalty_one]
-                    
-                penalty_two = choice(penalties_two)
-                if penalty_two in two.grades[assignment].keys():
-                    penalty_two_grade = two.grades[assignment][penalty_two]
-                else:
-                    penalty_two_grade = two.penalty_tasks[assignment][penalty_two]
-            
-            if phi_divergence == "TVD":
-                conjugate = lambda b: b
-                    
-            elif phi_divergence == "KL":
-                conjugate = lambda b: exp(b - 1)
-            
-            elif phi_divergence == "CHI_SQUARED":
-                conjugate = lambda b: (b*b)/4 + 1
-                
-            elif phi_divergence == "SQUARED_HELLINGER":
-                conjugate = lambda b: (-b)/(b - 1)
-            
-            penalty_val = evaluate_K(penalty_one_grade, penalty_two_grade, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence)
-            if phi_divergence == "SQUARED_HELLINGER" and penalty_val == 1:
-                penalty_score = minsize
-            else:
-                penalty_score = conjugate(penalty_val)
-                
-            if phi_divergence == "SQUARED_HELLINGER" and np.isnan(penalty_score):
-                #Conjugate may evaluate to infty/-infty, limit as b -> -infty is -1.
-                penalty_score = -1
-                    
-            bonus_score = evaluate_K(bonus_one_grade, bonus_two_grade, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence)
+    """
+    def score_pairs(one, two, bonus, x_bonus, y_bonus, x_penalty, y_penalty):
+        if bias_correct:
+            tau_1, tau_2 = regularize_reliability(reliability[one], reliability[two])
+            b_1 = biases[one]
+            b_2 = biases[two]
             
-            score = bonus_score - penalty_score
-                
-            temp_scores[one.id] += score
-            temp_scores[two.id] += score
+            bonus_scores = parametric_K_values(x_bonus, y_bonus, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence)
+            penalty_vals = parametric_K_values(x_penalty, y_penalty, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence)
+            penalty_scores = get_phi_divergence(phi_divergence).conjugate(penalty_vals)
+        else:
+            K_table, penalty_table = shared_tables
             
-        for grader in graders:
-            constant_inv = constant_dict[grader.id]
-            if constant_inv > 0:
-                constant = 1/constant_inv
-                temp_score = temp_scores[grader.id]
-                grader.payment += constant*temp_score
-            else:
-                grader.num_graded -= 1
+            bonus_scores = K_table[x_bonus, y_bonus]
+            penalty_scores = penalty_table[x_penalty, y_penalty]
+        
+        return bonus_scores - penalty_scores
+    
+    return pairing_payments(reports, score_pairs, rng)
             
 def compute_K(J, PM, phi_divergence):
     """
@@ -515,101 +403,14 @@ def compute_K(J, PM, phi_divergence):
 
     """
     
-    K = np.zeros(shape=(11, 11))
-    
-    i = 0
-    
-    for row in PM:
-        j = 0
-        for entry in row:
-            if PM[i, j] != 0:
-                value = J[i, j] / PM[i, j]
-                
-                if phi_divergence == "TVD":
-                    K[i, j] = tvd_subdifferential(value)
-                    
-                elif phi_divergence == "KL":
-                    K[i, j] = kl_subdifferential(value)
-                    
-                elif phi_divergence == "CHI_SQUARED":
-                    subdifferential = lambda a: 2*a
-                    K[i, j] = subdifferential(value)
-                        
-                elif phi_divergence == "SQUARED_HELLINGER":
-                    K[i, j] = squared_hellinger_subdifferential(value)
-                    
-            j += 1
-        i += 1
-    return K
-
-def tvd_subdifferential(a):
-    """
-    Evaluates the subdifferential of the function phi that corresponds to phi divergence being TVD at the value a.
-
-    Parameters
-    ----------
-    a : float.
-
-    Returns
-    -------
-    ans : float.
-          1/2 if a > 1, 
-          -1/2 if a < 1, 
-          0 if a = 1.
-
-    """
-    ans = 0
-    
-    if a > 1:
-        ans = 0.5
-    elif a < 1:
-        ans = -0.5
+    subdifferential = get_phi_divergence(phi_divergence).subdifferential
     
-    return ans
-
-def kl_subdifferential(a):
-    """
-    Evaluates the subdifferential of the function phi that corresponds to phi divergence being KL at the value a.
-
-    Parameters
-    ----------
-    a : float.
-
-    Returns
-    -------
-    ans : float.
-          1 + log(a) if a > 0,
-          -inf otherwise.
-
-    """
-    ans = -np.inf
+    K = np.zeros(shape=PM.shape)
     
-    if a > 0:
-        ans = 1 + log(a)
-
-    return ans
-
-def squared_hellinger_subdifferential(a):
-    """
-    Evaluates the subdifferential of the function phi that corresponds to phi divergence being Squared Hellinger distance at the value a.
-
-    Parameters
-    ----------
-    a : float.
-
-    Returns
-    -------
-    ans : float.
-          1 - 1/sqrt(a) if a > 0,
-          -inf otherwise.
-
-    """
-    ans = -np.inf
+    defined = (PM != 0)
+    K[defined] = subdifferential(J[defined] / PM[defined])
     
-    if a > 0:
-        ans = 1 - 1/sqrt(a)
-
-    return ans
+    return K
 
 def evaluate_K(x, y, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence):
     """ 
@@ -687,21 +488,110 @@ def evaluate_K(x, y, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence):
         print("JP is nan.")
         jp = 0
                 
-    if phi_divergence == "TVD":
-        score = tvd_subdifferential(jp)
-                    
-    elif phi_divergence == "KL":
-        score = kl_subdifferential(jp)
-                    
-    elif phi_divergence == "CHI_SQUARED":
-        subdifferential = lambda a: 2*a
-        score = subdifferential(jp)
-                        
-    elif phi_divergence == "SQUARED_HELLINGER":
-        score = squared_hellinger_subdifferential(jp)
+    score = float(get_phi_divergence(phi_divergence).subdifferential(jp))
                     
     return score
 
+"""
+Decimal places to which the grader-specific parameters (reliabilities and biases) are rounded before looking up a cached pair of scoring tables.
+"""
+K_TABLE_DECIMALS = 8
+
+def parametric_K_tables(mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence, decimals=K_TABLE_DECIMALS):
+    """
+    Returns the scoring function K(x, y) (see evaluate_K) and the penalty score f*(K(x, y)) tabulated over all pairs of reports x, y in 0-10.
+    
+    Tables are cached, keyed on mu, gamma, the choice of phi_divergence and the grader-specific parameters rounded to the given number of decimal places.
+
+    Parameters
+    ----------
+    mu : float.
+        The mean of the normal approximation of the distribution of true grades.
+    gamma : float.
+        The precision (i.e. the inverse of the variance) of the normal approximation of the distribution of true grades.
+    tau_1: float. 
+           Estimated reliability of grader 1
+    tau_2: float.
+           Estimated reliability of grader 2
+    b_1: float.
+         Estimated bias of grader 1
+    b_2: float.
+         Estimated bias of grader 2
+    phi_divergence : str; one of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER".
+    decimals : int, optional.
+               The default is K_TABLE_DECIMALS.
+
+    Returns
+    -------
+    K : numpy 2D array (11x11), read-only.
+        K[x, y] is the bonus score for the pair of reports (x, y).
+    P : numpy 2D array (11x11), read-only.
+        P[x, y] is the penalty score for the pair of reports (x, y).
+
+    """
+    tau_1, tau_2, b_1, b_2 = (round(float(v), decimals) for v in (tau_1, tau_2, b_1, b_2))
+    return _parametric_K_tables(float(mu), float(gamma), tau_1, tau_2, b_1, b_2, phi_divergence)
+
+@lru_cache(maxsize=8192)
+def _parametric_K_tables(mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence):
+    """
+    Computes the tables returned by parametric_K_tables, evaluating K on the whole 11x11 grid at once.
+    """
+    x = np.arange(11, dtype=float)[:, np.newaxis]
+    y = np.arange(11, dtype=float)[np.newaxis, :]
+    
+    K = parametric_K_values(x, y, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence)
+    P = get_phi_divergence(phi_divergence).conjugate(K)
+    
+    K.flags.writeable = False
+    P.flags.writeable = False
+    
+    return K, P
+
+def parametric_K_values(x, y, mu, gamma, tau_1, tau_2, b_1, b_2, phi_divergence):
+    """
+    Vectorized version of evaluate_K: evaluates the closed form of K(x, y) elementwise (with broadcasting) over arrays of reports and grader parameters.
+
+    Parameters
+    ----------
+    x, y : np.arrays of reports.
+    mu : float.
+    gamma : float.
+    tau_1, tau_2 : floats or np.arrays.
+                   Estimated reliabilities of graders 1 and 2.
+    b_1, b_2 : floats or np.arrays.
+               Estimated biases of graders 1 and 2.
+    phi_divergence : str; one of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER".
+
+    Returns
+    -------
+    K : np.array of floats.
+
+    """
+    sig2 = 1/gamma
+    
+    val = (sig2 + (1/tau_1))*(sig2 + (1/tau_2))
+    
+    e_1 = x - (mu + b_1)
+    e_2 = y - (mu + b_2)
+    
+    #Quadratic form eps^T L eps, with L as in evaluate_K.
+    G = sig2*(sig2 + (1/tau_2))*e_1*e_1 - 2*val*e_1*e_2 + sig2*(sig2 + (1/tau_1))*e_2*e_2
+    
+    num = val
+    denom = val - (sig2**2)
+    
+    with np.errstate(invalid="ignore"):
+        coeff = np.sqrt(num/denom)
+    
+    exp_num = -0.5*sig2*tau_1*tau_2*G
+    exp_denom = (sig2*tau_1 + sig2*tau_2 + 1)*val
+    
+    jp = np.asarray(coeff*np.exp(exp_num/exp_denom), dtype=float)
+    jp = np.where(np.isnan(jp), 0.0, jp)
+    
+    return get_phi_divergence(phi_divergence).subdifferential(jp)
+
 def regularize_reliability(rel_1, rel_2):
     """
     Regularizes the reliability estimates for a pair of graders.
@@ -729,4 +619,275 @@ def regularize_reliability(rel_1, rel_2):
     t_1 = p*rel_1 + (1-p)*val
     t_2 = p*rel_2 + (1-p)*val
     
-    return t_1, t_2
\ No newline at end of file
+    return t_1, t_2
+
+def grader_pairs(reports):
+    """
+    Enumerates every pair of graders that graded the same submission, for all of the submissions in an assignment at once.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+
+    Returns
+    -------
+    one, two : np.arrays of ints.
+               Grader rows of the first and second member of each pair (one < two).
+    bonus : np.array of ints.
+            Task column of the submission (the bonus task) that the pair has in common.
+
+    """
+    indptr, indices = reports.graders_by_task()
+    degrees = np.diff(indptr)
+    
+    one = []
+    two = []
+    bonus = []
+    
+    #Submissions with the same number of graders are handled together.
+    for d in np.unique(degrees[reports.is_submission]):
+        if d < 2:
+            continue
+        tasks = np.flatnonzero((degrees == d) & reports.is_submission)
+        graders = indices[indptr[tasks][:, np.newaxis] + np.arange(d)]
+        first, second = np.triu_indices(d, 1)
+        
+        one.append(graders[:, first].ravel())
+        two.append(graders[:, second].ravel())
+        bonus.append(np.repeat(tasks, len(first)))
+        
+    if len(one) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    
+    return np.concatenate(one), np.concatenate(two), np.concatenate(bonus)
+
+class PenaltyIndex:
+    """
+    Per-assignment index of the tasks that each grader graded (including penalty tasks), used to sample penalty tasks for many pairs of graders at once.
+    
+    Penalty tasks are drawn with the same distribution as the sequential procedure that this replaces:
+        - penalty_one is uniform over the tasks graded by grader one (other than the bonus task), 
+          excluding the only other task graded by grader two when grader two graded exactly one other task;
+        - penalty_two is uniform over the tasks graded by grader two, excluding the bonus task and penalty_one.
+    A pair has no valid penalty tasks when no such choice exists.
+
+    Attributes
+    ----------
+    indptr : np.array of ints, shape (n_graders + 1,).
+    indices : np.array of ints.
+              The task columns graded by grader g are indices[indptr[g]:indptr[g + 1]], in increasing order.
+    keys : np.array of ints.
+           Sorted keys (grader row * n_tasks + task column) for membership tests.
+    """
+    
+    def __init__(self, reports):
+        """
+        Creates a PenaltyIndex object.
+
+        Parameters
+        ----------
+        reports : AssignmentReports object.
+
+        """
+        self.num_tasks = reports.num_tasks
+        self.indptr, self.indices = reports.tasks_by_grader()
+        
+        rows = np.repeat(np.arange(reports.num_graders), np.diff(self.indptr))
+        self.keys = rows * self.num_tasks + self.indices
+        
+    def degrees(self, rows):
+        """
+        Returns the number of tasks graded by each of the given grader rows.
+        """
+        return self.indptr[rows + 1] - self.indptr[rows]
+    
+    def positions(self, rows, cols):
+        """
+        Locates task columns within the rows of the index.
+
+        Parameters
+        ----------
+        rows : np.array of ints.
+        cols : np.array of ints. 
+               Negative values denote "no task".
+
+        Returns
+        -------
+        positions : np.array of ints.
+                    Position of cols[i] among the tasks of grader rows[i] (meaningless where present is False).
+        present : np.array of bools.
+                  Whether grader rows[i] graded task cols[i].
+
+        """
+        if len(self.keys) == 0:
+            return np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=bool)
+        
+        keys = rows * self.num_tasks + cols
+        idx = np.searchsorted(self.keys, keys)
+        clipped = np.minimum(idx, len(self.keys) - 1)
+        present = (cols >= 0) & (self.keys[clipped] == keys)
+        
+        return idx - self.indptr[rows], present
+    
+    def draw(self, rows, excluded, rng):
+        """
+        Draws a task uniformly at random for each grader row, excluding up to two given tasks per row.
+
+        Parameters
+        ----------
+        rows : np.array of ints.
+        excluded : list of (at most two) np.arrays of ints.
+                   Task columns to exclude for each row. Negative values (and tasks that the grader did not grade) are ignored.
+        rng : numpy.random.Generator.
+
+        Returns
+        -------
+        cols : np.array of ints.
+               The drawn task columns (-1 where there is nothing to draw).
+        valid : np.array of bools.
+                Whether there was at least one task to draw from.
+
+        """
+        big = np.iinfo(np.int64).max
+        
+        available = self.degrees(rows)
+        excluded_positions = []
+        for cols in excluded:
+            pos, present = self.positions(rows, cols)
+            available = available - present
+            excluded_positions.append(np.where(present, pos, big))
+        
+        while len(excluded_positions) < 2:
+            excluded_positions.append(np.full(len(rows), big))
+        
+        low = np.minimum(excluded_positions[0], excluded_positions[1])
+        high = np.maximum(excluded_positions[0], excluded_positions[1])
+        
+        valid = available > 0
+        
+        #Draw among the available tasks, then skip over the excluded positions.
+        k = rng.integers(0, np.maximum(available, 1))
+        k = k + (k >= low)
+        k = k + (k >= high)
+        
+        cols = np.where(valid, self.indices[np.minimum(self.indptr[rows] + k, len(self.indices) - 1)], -1)
+        
+        return cols, valid
+    
+    def sample(self, one, two, bonus, rng):
+        """
+        Samples a penalty task for each member of each pair of graders.
+
+        Parameters
+        ----------
+        one, two : np.arrays of ints.
+                   Grader rows of the pairs.
+        bonus : np.array of ints.
+                Task column of the bonus task of each pair.
+        rng : numpy.random.Generator.
+
+        Returns
+        -------
+        penalty_one, penalty_two : np.arrays of ints.
+                                   Task columns of the penalty tasks (-1 where found is False).
+        found : np.array of bools.
+                Whether the pair has valid penalty tasks.
+
+        """
+        no_task = np.full(len(one), -1)
+        
+        #When grader two has exactly one task other than the bonus task, grader one cannot also use that task.
+        single = (self.degrees(two) == 2)
+        only_two, _ = self.draw(two, [bonus, no_task], rng)
+        blocked = np.where(single, only_two, -1)
+        
+        penalty_one, found_one = self.draw(one, [bonus, blocked], rng)
+        penalty_two, found_two = self.draw(two, [bonus, penalty_one], rng)
+        
+        found = found_one & found_two
+        
+        return np.where(found, penalty_one, -1), np.where(found, penalty_two, -1), found
+
+def pairing_payments(reports, score_pairs, rng=None):
+    """
+    Computes payments for a pairing mechanism: every pair of graders of each submission is scored on the submission (the bonus task) and on a pair of penalty tasks, 
+    and each grader is paid the average of their scores on each submission.
+    
+    Pairs without valid penalty tasks are not scored. A grader with no scored pairs on a submission is not paid for it, and the submission is counted in dropped.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    score_pairs : function.
+                  score_pairs(one, two, bonus, x_bonus, y_bonus, x_penalty, y_penalty) returns an np.array of scores, given the grader rows, the bonus task column and the reports of both graders on the bonus and penalty tasks for a batch of pairs.
+    rng : numpy.random.Generator, optional.
+          The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    payments : np.array of floats, shape (n_graders,).
+    dropped : np.array of ints, shape (n_graders,).
+              The number of submissions for which each grader had no scored pairs.
+
+    """
+    rng = as_generator(rng)
+        
+    one, two, bonus = grader_pairs(reports)
+    penalty_one, penalty_two, found = PenaltyIndex(reports).sample(one, two, bonus, rng)
+    
+    scores = np.zeros(len(one))
+    f = found
+    x_bonus = reports.lookup(one[f], bonus[f]).astype(np.int64)
+    y_bonus = reports.lookup(two[f], bonus[f]).astype(np.int64)
+    x_penalty = reports.lookup(one[f], penalty_one[f]).astype(np.int64)
+    y_penalty = reports.lookup(two[f], penalty_two[f]).astype(np.int64)
+    scores[f] = score_pairs(one[f], two[f], bonus[f], x_bonus, y_bonus, x_penalty, y_penalty)
+    
+    """
+    Average the scores of each grader over the scored pairs for each submission.
+    """
+    graders = np.concatenate((one, two))
+    keys = graders * reports.num_tasks + np.concatenate((bonus, bonus))
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    
+    totals = np.bincount(inverse, weights=np.concatenate((scores, scores)), minlength=len(unique_keys))
+    counts = np.bincount(inverse, weights=np.concatenate((found, found)), minlength=len(unique_keys))
+    
+    key_graders = unique_keys // reports.num_tasks
+    scored = counts > 0
+    
+    payments = np.bincount(key_graders[scored], weights=totals[scored]/counts[scored], minlength=reports.num_graders)
+    dropped = np.bincount(key_graders[~scored], minlength=reports.num_graders)
+    
+    return payments, dropped
+
+def apply_pairing_payments(reports, grader_dict, payments, dropped):
+    """
+    Adds the payments computed by pairing_payments to the graders in grader_dict, and decrements the num_graded attribute of graders for the submissions they were not paid for.
+
+    Parameters
+    ----------
+    reports : AssignmentReports object.
+    grader_dict : dict.
+                  Maps a Submission object to a list of graders (Student objects).
+    payments : np.array of floats, shape (n_graders,).
+    dropped : np.array of ints, shape (n_graders,).
+
+    Returns
+    -------
+    None.
+
+    """
+    graders = {}
+    for grader_list in grader_dict.values():
+        for grader in grader_list:
+            graders[grader.id] = grader
+    graders = list(graders.values())
+    
+    reports.add_payments(payments, graders)
+    
+    for grader in graders:
+        num = int(dropped[reports.grader_index[grader.id]])
+        if num > 0:
+            grader.num_graded -= num
@@ -0,0 +1,161 @@
+"""
+Vectorized implementations of the phi-divergences used by the Phi-Div pairing mechanisms.
+
+Each divergence supplies phi (f), its convex conjugate (f*) and its subdifferential (df), all of which operate elementwise on numpy arrays.
+Special cases (zero arguments, infinite values) are handled with masks, so the functions can be applied to a whole scoring matrix at once.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import numpy as np
+from sys import maxsize
+
+class PhiDivergence:
+    """
+    A phi-divergence, described by three vectorized functions.
+
+    Attributes
+    ----------
+    name : str.
+           The name used to select the divergence, e.g. "TVD".
+    phi : function.
+          f(a), applied elementwise.
+    conjugate : function.
+                f*(b), applied elementwise. Used to compute penalty scores.
+    subdifferential : function.
+                      df(a), applied elementwise. Used to compute the scoring matrices.
+    """
+
+    def __init__(self, name, phi, conjugate, subdifferential):
+        """
+        Creates a PhiDivergence object.
+
+        Parameters
+        ----------
+        name : str.
+        phi : function.
+        conjugate : function.
+        subdifferential : function.
+
+        """
+        self.name = name
+        self.phi = phi
+        self.conjugate = conjugate
+        self.subdifferential = subdifferential
+
+"""
+TVD:
+    - f(a) = 1/2|a - 1|
+    - f*(b) = b if |b| <= 1/2; infty otherwise.
+    - df(a) = 1/2 if a > 1, -1/2 if a < 1, 0 if a = 1 (from the subdifferential [-1/2, 1/2]).
+"""
+
+def tvd_phi(a):
+    return 0.5*np.abs(np.asarray(a, dtype=float) - 1)
+
+def tvd_conjugate(b):
+    #Scores only ever take the values -1/2, 0, 1/2, where f*(b) = b.
+    return np.asarray(b, dtype=float)
+
+def tvd_subdifferential(a):
+    a = np.asarray(a, dtype=float)
+    return 0.5*np.sign(a - 1)
+
+"""
+KL:
+    - f(a) = a log a
+    - f*(b) = exp(b - 1)
+    - df(a) = 1 + log(a), -infty at a = 0.
+"""
+
+def kl_phi(a):
+    a = np.asarray(a, dtype=float)
+    positive = a > 0
+    return np.where(positive, a*np.log(np.where(positive, a, 1)), 0.0)
+
+def kl_conjugate(b):
+    b = np.asarray(b, dtype=float)
+    with np.errstate(over="ignore"):
+        return np.exp(b - 1)
+
+def kl_subdifferential(a):
+    a = np.asarray(a, dtype=float)
+    positive = a > 0
+    return np.where(positive, 1 + np.log(np.where(positive, a, 1)), -np.inf)
+
+"""
+CHI_SQUARED:
+    - f(a) = a^2 - 1
+    - f*(b) = b^2/4 + 1
+    - df(a) = 2a
+"""
+
+def chi_squared_phi(a):
+    a = np.asarray(a, dtype=float)
+    return a*a - 1
+
+def chi_squared_conjugate(b):
+    b = np.asarray(b, dtype=float)
+    return (b*b)/4 + 1
+
+def chi_squared_subdifferential(a):
+    return 2*np.asarray(a, dtype=float)
+
+"""
+SQUARED_HELLINGER:
+    - f(a) = (1 - sqrt(a))^2
+    - f*(b) = -b/(b - 1), b < 1; infty otherwise.
+    - df(a) = 1 - 1/sqrt(a), -infty at a = 0.
+"""
+
+def squared_hellinger_phi(a):
+    a = np.asarray(a, dtype=float)
+    root = np.sqrt(np.maximum(a, 0))
+    return (1 - root)**2
+
+def squared_hellinger_conjugate(b):
+    """
+    f*(b) = -b/(b - 1), with the limit -1 as b -> -infty, and -maxsize - 1 at b = 1 (where f* is undefined).
+    """
+    b = np.asarray(b, dtype=float)
+    minsize = -maxsize - 1
+
+    finite = np.isfinite(b)
+    singular = (b == 1)
+    regular = finite & ~singular
+
+    safe_b = np.where(regular, b, 0.0)
+    ans = np.where(regular, (-safe_b)/(safe_b - 1), -1.0)
+    ans = np.where(singular, minsize, ans)
+
+    return ans
+
+def squared_hellinger_subdifferential(a):
+    a = np.asarray(a, dtype=float)
+    positive = a > 0
+    return np.where(positive, 1 - 1/np.sqrt(np.where(positive, a, 1)), -np.inf)
+
+PHI_DIVERGENCES = {
+        "TVD": PhiDivergence("TVD", tvd_phi, tvd_conjugate, tvd_subdifferential),
+        "KL": PhiDivergence("KL", kl_phi, kl_conjugate, kl_subdifferential),
+        "CHI_SQUARED": PhiDivergence("CHI_SQUARED", chi_squared_phi, chi_squared_conjugate, chi_squared_subdifferential),
+        "SQUARED_HELLINGER": PhiDivergence("SQUARED_HELLINGER", squared_hellinger_phi, squared_hellinger_conjugate, squared_hellinger_subdifferential),
+    }
+
+def get_phi_divergence(name):
+    """
+    Looks up a PhiDivergence object by name.
+
+    Parameters
+    ----------
+    name : str.
+           One of "TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER".
+
+    Returns
+    -------
+    divergence : PhiDivergence object.
+
+    """
+    if name not in PHI_DIVERGENCES:
+        raise ValueError("Unknown phi divergence: " + str(name) + ". Options are " + ", ".join(PHI_DIVERGENCES.keys()) + ".")
+    return PHI_DIVERGENCES[name]
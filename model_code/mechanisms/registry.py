@@ -0,0 +1,284 @@
+"""
+Registry of the mechanisms, so that the experiments can run any mechanism by name instead of repeating the same dispatch code in every script.
+
+Every mechanism is registered as a Mechanism object whose score function has the same signature for all of the mechanisms:
+
+    score(reports, param, settings, state, rng) -> (payments, dropped, state)
+
+where reports is the array-backed reports for a single assignment (see reports.AssignmentReports), param is the mechanism_param string,
+settings is a MechanismSettings object and state is whatever the mechanism carries from one assignment to the next over the course of a semester
+(e.g. the histogram of reports for PTS). A new mechanism plugs into every experiment by registering it here (see register_mechanism).
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import numpy as np
+
+from .baselines import mean_squared_error_arrays
+from .dmi import dmi_mechanism_arrays
+from .output_agreement import oa_mechanism_arrays
+from .parametric_mse import EMState, mse_p_mechanism_arrays
+from .peer_truth_serum import pts_mechanism_arrays
+from .phi_divergence_pairing import apply_pairing_payments, parametric_phi_divergence_pairing_mechanism_arrays, phi_divergence_pairing_mechanism_arrays
+
+from reports import AssignmentReports
+
+class MechanismSettings:
+    """
+    The model settings shared by the mechanisms in an experiment.
+
+    Attributes
+    ----------
+    mu : float.
+         The mean of the normal approximation of the distribution of true grades (parametric mechanisms).
+    gamma : float.
+            The precision of the normal approximation of the distribution of true grades (parametric mechanisms).
+    bias : bool.
+           Indicates whether MSE_P estimates bias parameters.
+    bias_correct : bool.
+                   Indicates whether MSE_P subtracts the estimated biases from the reports.
+    pairing_bias_correct : bool.
+                           Indicates whether Phi-DIV_P estimates reliability and bias parameters and uses them in scoring.
+    num_grades : int.
+                 The number of possible reports (the size of the PTS histogram).
+    warm_start : bool.
+                 Indicates whether the EM procedure of the parametric mechanisms is warm-started from the estimates for the previous assignment (see parametric_mse.EMState).
+    accelerate : bool.
+                 Indicates whether the EM procedure of the parametric mechanisms uses SQUAREM extrapolation.
+    """
+
+    def __init__(self, mu=7, gamma=1/2.1, bias=True, bias_correct=False, pairing_bias_correct=True, num_grades=11, warm_start=False, accelerate=False):
+        """
+        Creates a MechanismSettings object. The defaults are the defaults of the mechanism functions and the parameters used in the simulations.
+        """
+        self.mu = mu
+        self.gamma = gamma
+        self.bias = bias
+        self.bias_correct = bias_correct
+        self.pairing_bias_correct = pairing_bias_correct
+        self.num_grades = num_grades
+        self.warm_start = warm_start
+        self.accelerate = accelerate
+
+class Mechanism:
+    """
+    A registered mechanism.
+
+    Attributes
+    ----------
+    name : str.
+           The name used to select the mechanism (e.g. "Phi-DIV").
+    score : function.
+            score(reports, param, settings, state, rng) -> (payments, dropped, state).
+            payments is an np.array of floats aligned with reports.grader_ids. dropped is None, or (for the pairing mechanisms) an np.array of ints
+            with the number of submissions for which each grader was not paid (see phi_divergence_pairing.apply_pairing_payments).
+    initial_state : function or None.
+                    initial_state(settings) returns the state at the start of a semester. None for mechanisms that do not carry any state.
+    parametric : bool.
+                 Indicates whether the mechanism uses the parametric model (and therefore settings.mu and settings.gamma).
+    clustered : bool.
+                Indicates whether the mechanism requires graders to be assigned in clusters of size int(param) (see grading_dmi.py) instead of the random regular assignment.
+    """
+
+    def __init__(self, name, score, initial_state=None, parametric=False, clustered=False):
+        """
+        Creates a Mechanism object (see the class docstring for the parameters).
+        """
+        self.name = name
+        self.score = score
+        self.initial_state = initial_state
+        self.parametric = parametric
+        self.clustered = clustered
+
+    def new_state(self, settings):
+        """
+        Returns the state of the mechanism at the start of a semester.
+        """
+        if self.initial_state is None:
+            return None
+        return self.initial_state(settings)
+
+"""
+Maps the name of each mechanism to its Mechanism object, in the order in which they were registered.
+"""
+MECHANISMS = {}
+
+def register_mechanism(mechanism):
+    """
+    Adds a mechanism to the registry (replacing any mechanism with the same name).
+
+    Parameters
+    ----------
+    mechanism : Mechanism object.
+
+    Returns
+    -------
+    mechanism : Mechanism object.
+
+    """
+    MECHANISMS[mechanism.name] = mechanism
+    return mechanism
+
+def get_mechanism(name):
+    """
+    Looks up a registered mechanism by name. Raises a ValueError if the name does not match any of the options.
+    """
+    if name not in MECHANISMS:
+        raise ValueError("The given mechanism name (" + str(name) + ") does not match any of the options: " + ", ".join(MECHANISMS) + ".")
+    return MECHANISMS[name]
+
+def score_assignment(name, param, grader_dict, assignment_num, settings, state=None, rng=None):
+    """
+    Computes payments for the graders of a single assignment according to a registered mechanism, and adds them to the Student objects.
+    For the pairing mechanisms, also decrements the num_graded attribute of graders for the submissions they were not paid for.
+
+    Parameters
+    ----------
+    name : str.
+           The name of the mechanism.
+    param : str.
+            Denotes different versions of the same mechanism (e.g. the cluster size for DMI or the choice of Phi-divergence).
+    grader_dict : dict.
+                  Maps a Submission object to a list of graders (Student objects).
+    assignment_num : int.
+                     Unique identifier of the assignment for which payments are being computed.
+    settings : MechanismSettings object.
+    state : optional.
+            The state of the mechanism after the previous assignment (see Mechanism.new_state). The default is None.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the mechanism. The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    state :
+            The state of the mechanism after this assignment.
+
+    """
+    mechanism = get_mechanism(name)
+
+    reports = AssignmentReports.from_grader_dict(grader_dict, assignment_num)
+
+    payments, dropped, state = mechanism.score(reports, param, settings, state, rng)
+
+    if dropped is None:
+        graders = {grader.id: grader for grader_list in grader_dict.values() for grader in grader_list}
+        reports.add_payments(payments, graders.values())
+    else:
+        apply_pairing_payments(reports, grader_dict, payments, dropped)
+
+    return state
+
+def run_mechanism(name, param, grader_dicts, settings, rng=None):
+    """
+    Computes payments for the graders of every assignment in a semester according to a registered mechanism (see score_assignment).
+
+    Parameters
+    ----------
+    name : str.
+    param : str.
+    grader_dicts : list of dicts, or dict.
+                   The grader_dict for each assignment, either as a list (assignment i is grader_dicts[i]) or as a dict { assignment_num: grader_dict }, in order.
+    settings : MechanismSettings object.
+    rng : numpy.random.Generator, optional.
+          The default is None.
+
+    Returns
+    -------
+    state :
+            The state of the mechanism at the end of the semester.
+
+    """
+    mechanism = get_mechanism(name)
+
+    assignments = grader_dicts.items() if isinstance(grader_dicts, dict) else enumerate(grader_dicts)
+
+    state = mechanism.new_state(settings)
+    for assignment_num, grader_dict in assignments:
+        state = score_assignment(name, param, grader_dict, assignment_num, settings, state, rng)
+
+    return state
+
+def run_mechanism_arrays(name, param, semester_reports, settings, rng=None):
+    """
+    Array version of run_mechanism: computes the payments for every assignment in a semester without any Student objects.
+
+    Parameters
+    ----------
+    name : str.
+    param : str.
+    semester_reports : list of AssignmentReports objects.
+                       The reports for each assignment, in order (e.g. the values of reports.semester_reports).
+    settings : MechanismSettings object.
+    rng : numpy.random.Generator, optional.
+          The default is None.
+
+    Returns
+    -------
+    payments : list of np.arrays of floats.
+               The payments for each assignment, aligned with the grader_ids of its reports.
+    dropped : list of np.arrays of ints (or None).
+              See Mechanism.score.
+
+    """
+    mechanism = get_mechanism(name)
+
+    state = mechanism.new_state(settings)
+    payments = []
+    dropped = []
+    for reports in semester_reports:
+        assignment_payments, assignment_dropped, state = mechanism.score(reports, param, settings, state, rng)
+        payments.append(assignment_payments)
+        dropped.append(assignment_dropped)
+
+    return payments, dropped
+
+"""
+Non-Parametric Mechanisms
+"""
+
+def _score_baseline(reports, param, settings, state, rng):
+    consensus_grades, payments = mean_squared_error_arrays(reports)
+    return payments, None, state
+
+def _score_dmi(reports, param, settings, state, rng):
+    return dmi_mechanism_arrays(reports, int(param), rng=rng), None, state
+
+def _score_oa(reports, param, settings, state, rng):
+    return oa_mechanism_arrays(reports), None, state
+
+def _score_phi_div(reports, param, settings, state, rng):
+    payments, dropped = phi_divergence_pairing_mechanism_arrays(reports, param, rng)
+    return payments, dropped, state
+
+def _score_pts(reports, param, settings, state, rng):
+    payments, H = pts_mechanism_arrays(reports, state)
+    return payments, None, H
+
+def _pts_histogram(settings):
+    return np.ones(settings.num_grades)
+
+"""
+Parametric Mechanisms
+"""
+
+def _score_mse_p(reports, param, settings, state, rng):
+    scores, reliability, biases, payments, iteration = mse_p_mechanism_arrays(reports, settings.mu, settings.gamma, settings.bias, settings.bias_correct, state)
+    if not iteration < 1000:
+        print("EM estimation procedure did not converge.")
+    return payments, None, state
+
+def _score_phi_div_p(reports, param, settings, state, rng):
+    payments, dropped = parametric_phi_divergence_pairing_mechanism_arrays(reports, settings.mu, settings.gamma, settings.pairing_bias_correct, param, rng, state)
+    return payments, dropped, state
+
+def _em_state(settings):
+    #The EMState also records the number of iterations of each EM run, with or without warm starts.
+    return EMState(warm_start=settings.warm_start, accelerate=settings.accelerate)
+
+register_mechanism(Mechanism("BASELINE", _score_baseline))
+register_mechanism(Mechanism("DMI", _score_dmi, clustered=True))
+register_mechanism(Mechanism("OA", _score_oa))
+register_mechanism(Mechanism("Phi-DIV", _score_phi_div))
+register_mechanism(Mechanism("PTS", _score_pts, initial_state=_pts_histogram))
+register_mechanism(Mechanism("MSE_P", _score_mse_p, initial_state=_em_state, parametric=True))
+register_mechanism(Mechanism("Phi-DIV_P", _score_phi_div_p, initial_state=_em_state, parametric=True))
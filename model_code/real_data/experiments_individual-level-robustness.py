@@ -4,28 +4,23 @@ Script for running experiments to examine the potential for individual students
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from numpy import ones
+from numpy.random import default_rng
 from statistics import mean, median, variance
 import json
-from random import randint, seed
-from sys import maxsize
 
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
 from grading import get_grading_dict
 
-from mechanisms.baselines import mean_squared_error
-from mechanisms.phi_divergence_pairing import phi_divergence_pairing_mechanism, parametric_phi_divergence_pairing_mechanism
-from mechanisms.output_agreement import oa_mechanism
-from mechanisms.parametric_mse import mse_p_mechanism
-from mechanisms.peer_truth_serum import pts_mechanism
+from mechanisms.registry import MechanismSettings, run_mechanism
+from seeding import as_generator
 
-from load import load17, load19
+from preprocess import load_cached
 
 import warnings
 
-def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen): 
+def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen, rng=None): 
     """
     Iteratively simulates semesters, scoring students according to a single mechanism, and recording the values of the relevant evaluation metrics.
 
@@ -51,6 +46,9 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
               One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
     coarsen : bool
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the mechanism and the deviators' strategic reports. The default is None, which uses numpy's global random state.
+          For each deviator, both scorings use the same randomness in the mechanism, so the gain in rank only reflects the deviation.
 
     Returns
     -------
@@ -74,7 +72,7 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
     
     if semester == "Spring 17":
         assignment_list = list(range(1, 17))
-        all_students, all_submissions = load17("Spring", coarsen, False)
+        all_students, all_submissions = load_cached(17, "Spring", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -88,7 +86,7 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
             
     elif semester == "Fall 17":
         assignment_list = list(range(1, 17))
-        all_students, all_submissions = load17("Fall", coarsen, False)
+        all_students, all_submissions = load_cached(17, "Fall", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -102,7 +100,7 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
             
     elif semester == "Spring 19":
         assignment_list = list(range(1, 12)) + [13, 14]
-        all_students, all_submissions = load19("Spring", coarsen, False)
+        all_students, all_submissions = load_cached(19, "Spring", coarsen, False)
         #include_q = True
         if coarsen:
             possible_grades = 11
@@ -117,7 +115,7 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
             
     elif semester == "Fall 19":
         assignment_list = list(range(1, 15))
-        all_students, all_submissions = load19("Fall", coarsen, False)
+        all_students, all_submissions = load_cached(19, "Fall", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -134,6 +132,10 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
         
     prior = mu
     
+    settings = MechanismSettings(mu, gamma, bias=True, bias_correct=False, pairing_bias_correct=False, num_grades=possible_grades)
+    
+    rng = as_generator(rng)
+    
     #Records the number of payments each student receives.
     for student in all_students:
         student.num_graded = 0
@@ -171,16 +173,17 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
     for deviator in all_students:
         
         deviator_ranks = []
-        random_seed = randint(~maxsize, maxsize)
+        mechanism_seed, report_seed = rng.integers(2**63, size=2)
             
         for iteration in range(2):
-            seed(random_seed)
+            mechanism_rng = default_rng(mechanism_seed)
             if iteration == 1:
                 """
                 Change deviator reports to strategic reports for every submission on every assignment
                 """
                 deviator.truthful_grades = deviator.grades.copy()
                 deviator.strategy = strategy
+                report_rng = default_rng(report_seed)
                 
                 for assignment_num in nonempty_assignments:
                     grading_dict = grading_dicts[assignment_num]
@@ -190,51 +193,12 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
                         
                         for submission in deviator_submissions:
                             signal = deviator.grades[assignment_num][submission.student_id]
-                            grade = deviator.report(signal, prior)
+                            grade = deviator.report(signal, prior, report_rng)
                         
                             deviator.grades[assignment_num][submission.student_id] = grade
                             submission.grades[deviator.id] = grade
                             
-            #necessary for PTS
-            H = ones(possible_grades)
-            
-            for assignment in nonempty_assignments:
-                """
-                Run the Mechanism
-                """
-                students = [student for student in all_students if assignment in student.grades.keys()]
-                
-                grader_dict = grader_dicts[assignment]
-                grading_dict = grading_dicts[assignment]
-                
-                """
-                Non-Parametric Mechanisms
-                """
-                    
-                if mechanism == "BASELINE":
-                    mean_squared_error(grader_dict)
-                        
-                elif mechanism == "OA":
-                    oa_mechanism(grader_dict)
-                        
-                elif mechanism == "Phi-DIV":
-                    phi_divergence_pairing_mechanism(grader_dict, mechanism_param)
-                    
-                elif mechanism == "PTS":
-                    H = pts_mechanism(grader_dict, H)
-                    
-                    """
-                Parametric Mechanisms
-                """
-                
-                elif mechanism == "MSE_P":
-                    mse_p_mechanism(grader_dict, students, assignment, mu, gamma, True)
-                    
-                elif mechanism == "Phi-DIV_P":
-                    parametric_phi_divergence_pairing_mechanism(grader_dict, students, assignment, mu, gamma, False, mechanism_param)
-                    
-                else:
-                    print("Error: The given mechanism name does not match any of the options.")
+            run_mechanism(mechanism, mechanism_param, grader_dicts, settings, mechanism_rng)
             
             for stu in all_students:
                 num = stu.num_graded
@@ -256,11 +220,6 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
             for student in all_students:
                 student.num_graded = student.num_graded_initial
                 student.payment = 0
-                    
-        '''
-        Reseed the randomness for initializing next semester
-        '''        
-        seed()
               
         deviator_gain = deviator_ranks[0] - deviator_ranks[1]
         deviator_gains.append(deviator_gain)
@@ -280,7 +239,7 @@ def run_simulation(strategy, mechanism, mechanism_param, semester, coarsen):
     return score_dict
 
 
-def compare_mechanisms(strategy, mechanisms, semester, coarsen):
+def compare_mechanisms(strategy, mechanisms, semester, coarsen, rng=None):
     """
     Iterates over a list of mechanisms, calling run_simulation for each one.
 
@@ -297,6 +256,8 @@ def compare_mechanisms(strategy, mechanisms, semester, coarsen):
               One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
     coarsen : bool
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
+    rng : numpy.random.Generator, optional.
+          See run_simulation. The default is None.
 
     Returns
     -------
@@ -308,14 +269,14 @@ def compare_mechanisms(strategy, mechanisms, semester, coarsen):
     
     for mechanism, param in mechanisms:
         
-        score_dict = run_simulation(strategy, mechanism, param, semester, coarsen)
+        score_dict = run_simulation(strategy, mechanism, param, semester, coarsen, rng)
         
         key = mechanism + ": " + param 
         eval_dict[key] = score_dict
     
     return eval_dict
 
-def simulate(strategies, mechanisms, filename, semester, coarsen):
+def simulate(strategies, mechanisms, filename, semester, coarsen, seed=None):
     """
     Calls compare_mechanisms iteravely for each strategy, varying the number of strategic graders.
     
@@ -338,6 +299,8 @@ def simulate(strategies, mechanisms, filename, semester, coarsen):
               One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
     coarsen : bool
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
+    seed : int or None, optional.
+           Seeds the numpy.random.Generator used for the experiment, so that it can be replayed. The default is None, which draws fresh entropy.
     
     Returns
     -------
@@ -345,12 +308,13 @@ def simulate(strategies, mechanisms, filename, semester, coarsen):
 
     """
     results = {}
+    rng = default_rng(seed)
     
     for strategy in strategies:
         result = {}
         print("Working on experiments for the following strategy:", strategy)
         
-        evals = compare_mechanisms(strategy, mechanisms, semester, coarsen)
+        evals = compare_mechanisms(strategy, mechanisms, semester, coarsen, rng)
         result[1] = evals
         
         results[strategy] = result
@@ -4,26 +4,105 @@ Script for running experiments quantifying measurement integrity using real grad
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from numpy import ones
+from numpy import array, zeros
+from numpy.random import default_rng
 import json
 from statistics import mean
 
 import os, sys
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-from mechanisms.baselines import mean_squared_error
-from mechanisms.phi_divergence_pairing import phi_divergence_pairing_mechanism, parametric_phi_divergence_pairing_mechanism
-from mechanisms.output_agreement import oa_mechanism
-from mechanisms.parametric_mse import mse_p_mechanism
-from mechanisms.peer_truth_serum import pts_mechanism
+from mechanisms.registry import MechanismSettings, get_mechanism, score_assignment
 
-from evaluation import aucs_mse, correlation_mse, kendall_tau_mse
+from evaluation import mse_metrics
+from reports import AssignmentReports
 
-from load import load17, load19
+from preprocess import load_cached
 
 import warnings
 
-def run_simulation(assignment_partition, mechanism, mechanism_param, semester, coarsen=True):
+SEMESTERS = {
+        "Spring 17": (17, "Spring"),
+        "Fall 17": (17, "Fall"),
+        "Spring 19": (19, "Spring"),
+        "Fall 19": (19, "Fall"),
+    }
+
+def load_semester(semester, coarsen=True):
+    """
+    Loads the data for a semester and indexes it by assignment (see index_assignments).
+
+    Parameters
+    ----------
+    semester : str
+              One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
+    coarsen : bool, optional
+             See run_simulation. Default is True.
+
+    Returns
+    -------
+    semester_data : triple
+        (list of StrategicStudent objects, list of Submission objects, dict returned by index_assignments).
+
+    """
+    year, season = SEMESTERS[semester]
+    all_students, all_submissions = load_cached(year, season, coarsen, False)
+    
+    return all_students, all_submissions, index_assignments(all_students, all_submissions)
+
+def index_assignments(all_students, all_submissions):
+    """
+    Builds the grader_dict for each assignment, along with the squared errors of each grader's reports, once per semester.
+    Neither depends on the mechanism or the repetition, so they are reused across all of the repetitions and mechanisms.
+
+    Parameters
+    ----------
+    all_students : list of StrategicStudent objects.
+    all_submissions : list of Submission objects.
+
+    Returns
+    -------
+    assignment_index : dict.
+        { 
+            assignment_number (int): 
+                {
+                    "grader_dict": grader_dict for the assignment (graders are listed in the same order as in all_students),
+                    "students": [ StrategicStudent objects that graded the assignment ],
+                    "positions": np.array of the positions (in all_students) of the graders of the assignment,
+                    "errors": np.array of the sum of squared errors of the reports of each grader (aligned with positions),
+                    "counts": [ number of submissions graded by each grader (aligned with positions) ]
+                }
+        }
+
+    """
+    position = {student.id: idx for idx, student in enumerate(all_students)}
+    
+    submission_lists = {}
+    for submission in all_submissions:
+        submission_lists.setdefault(submission.assignment_number, []).append(submission)
+    
+    assignment_index = {}
+    for assignment, submission_list in submission_lists.items():
+        grader_dict = {}
+        for submission in submission_list:
+            grader_positions = sorted(position[g] for g in submission.grades.keys() if g in position)
+            grader_dict[submission] = [all_students[idx] for idx in grader_positions]
+        
+        students = [student for student in all_students if assignment in student.grades.keys()]
+        
+        reports = AssignmentReports.from_students(students, submission_list, assignment)
+        
+        assignment_index[assignment] = {
+                "grader_dict": grader_dict,
+                "students": students,
+                "positions": array([position[g] for g in reports.grader_ids.tolist()], dtype=int),
+                "errors": reports.squared_errors(),
+                "counts": reports.submissions_per_grader().tolist(),
+            }
+    
+    return assignment_index
+
+def run_simulation(assignment_partition, mechanism, mechanism_param, semester, coarsen=True, semester_data=None, rng=None):
     """
     Iteratively simulates semesters, scoring students according to a single mechanism, and recording the values of the relevant evaluation metrics.
 
@@ -49,6 +128,12 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
     coarsen : bool, optional
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
              Default is True.
+    semester_data : triple, optional
+             The output of load_semester(semester, coarsen), which can be shared by runs with different mechanisms.
+             Default is None, in which case the data is loaded here.
+    rng : numpy.random.Generator, optional
+             Source of randomness for the Phi-divergence pairing mechanisms.
+             Default is None, which uses numpy's global random state.
 
     Returns
     -------
@@ -81,7 +166,6 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
     include_q = True
     
     if semester == "Spring 17":
-        all_students, all_submissions = load17("Spring", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -94,7 +178,6 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
             return
             
     elif semester == "Fall 17":
-        all_students, all_submissions = load17("Fall", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -107,8 +190,6 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
             return
             
     elif semester == "Spring 19":
-        all_students, all_submissions = load19("Spring", coarsen, False)
-        
         if coarsen:
             possible_grades = 11
             
@@ -121,7 +202,6 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
             return
             
     elif semester == "Fall 19":
-        all_students, all_submissions = load19("Fall", coarsen, False)
         if coarsen:
             possible_grades = 11
             
@@ -135,6 +215,13 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
         
     else:
         print("Error -- Semester is specified incorrectly.")
+    
+    settings = MechanismSettings(mu, gamma, bias=True, bias_correct=False, pairing_bias_correct=False, num_grades=possible_grades)
+    new_state = get_mechanism(mechanism).new_state
+    
+    if semester_data is None:
+        semester_data = load_semester(semester, coarsen)
+    all_students, all_submissions, assignment_index = semester_data
         
     #Records the number of payments each student receives.
     for student in all_students:
@@ -142,61 +229,33 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
         
     for _ in range(50):
         
-        #necessary for PTS
-        H = ones(possible_grades)
+        #e.g. the histogram of reports for PTS
+        state = new_state(settings)
+        
+        #Sum of squared errors of each student's reports (aligned with all_students).
+        mse = zeros(len(all_students))
     
         for idx, part in enumerate(assignment_partition):
             for assignment in part:
                 """
                 Considering a single assignment at a time.
                 """
-                submission_list = [sub for sub in all_submissions if sub.assignment_number == assignment]
-                students = [student for student in all_students if assignment in student.grades.keys()]
-                
-                if len(submission_list) < 1:
+                if assignment not in assignment_index:
                     # Skip over empty assignments
                     continue
                 
-                grader_dict = {}
-                for submission in submission_list:
-                    graders = []
-                    grader_ids = list(submission.grades.keys())
-                    for stu in all_students:
-                        if stu.id in grader_ids:
-                            report = stu.grades[assignment][submission.student_id]
-                            stu.update_mse(submission.true_grade, report)
-                            graders.append(stu)
-                            stu.num_graded += 1
-                    grader_dict[submission] = graders
+                indexed = assignment_index[assignment]
+                grader_dict = indexed["grader_dict"]
+                students = indexed["students"]
                 
-                """
-                Non-Parametric Mechanisms
-                """
-                    
-                if mechanism == "BASELINE":
-                    mean_squared_error(grader_dict)
-                        
-                elif mechanism == "OA":
-                    oa_mechanism(grader_dict)
-                        
-                elif mechanism == "Phi-DIV":
-                    phi_divergence_pairing_mechanism(grader_dict, mechanism_param)
-                    
-                elif mechanism == "PTS":
-                    H = pts_mechanism(grader_dict, H)
-                    
-                    """
-                Parametric Mechanisms
-                """
+                mse[indexed["positions"]] += indexed["errors"]
+                for stu, count in zip(students, indexed["counts"]):
+                    stu.num_graded += count
                 
-                elif mechanism == "MSE_P":
-                    mse_p_mechanism(grader_dict, students, assignment, mu, gamma, True)
-                    
-                elif mechanism == "Phi-DIV_P":
-                    parametric_phi_divergence_pairing_mechanism(grader_dict, students, assignment, mu, gamma, False, mechanism_param)
-                    
-                else:
-                    print("Error: The given mechanism name does not match any of the options.")
+                state = score_assignment(mechanism, mechanism_param, grader_dict, assignment, settings, state, rng)
+            
+            for stu, val in zip(all_students, mse.tolist()):
+                stu.mse = val
             
             included_students = [student for student in all_students if student.included]
         
@@ -207,9 +266,7 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
                 stu.mse *= (1/num)
                 stu.payment *= (1/num) 
         
-            b, q = aucs_mse(included_students, include_q)
-            kt = kendall_tau_mse(included_students)
-            rho = correlation_mse(included_students)
+            b, q, kt, rho = mse_metrics(included_students, include_q)
             
             for stu in included_students:
                 stu.mse = stu.raw_mse
@@ -228,7 +285,7 @@ def run_simulation(assignment_partition, mechanism, mechanism_param, semester, c
             
     return score_dict
 
-def compare_mechanisms_varying_num_assignments(assignment_partition, mechanisms, semester, coarsen):
+def compare_mechanisms_varying_num_assignments(assignment_partition, mechanisms, semester, coarsen, rng=None):
     """
     Iterates over a list of mechanisms and a range of num_assignments, calling run_simulation for each one.
 
@@ -244,6 +301,8 @@ def compare_mechanisms_varying_num_assignments(assignment_partition, mechanisms,
               One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
     coarsen : bool
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
+    rng : numpy.random.Generator, optional
+             See run_simulation. Default is None.
 
     Returns
     -------
@@ -253,15 +312,17 @@ def compare_mechanisms_varying_num_assignments(assignment_partition, mechanisms,
     """
     eval_dict = {}
     
+    semester_data = load_semester(semester, coarsen)
+    
     for mechanism, param in mechanisms:
-        mechanism_dict = run_simulation(assignment_partition, mechanism, param, semester, coarsen)
+        mechanism_dict = run_simulation(assignment_partition, mechanism, param, semester, coarsen, semester_data, rng)
         
         key = mechanism + ": " + param 
         eval_dict[key] = mechanism_dict
     
     return eval_dict
 
-def simulate(mechanisms, filename, semester, coarsen):
+def simulate(mechanisms, filename, semester, coarsen, seed=None):
     """
     Calls compare_mechanisms.
     
@@ -281,6 +342,8 @@ def simulate(mechanisms, filename, semester, coarsen):
               One of: "Spring 17", "Fall 17", "Spring 19", "Fall 19"
     coarsen : bool
              Set to true if data should be coarsened so that grades fall in the standard integer [0, 10] range.
+    seed : int or None, optional
+             Seeds the numpy.random.Generator used for the experiment, so that it can be replayed. Default is None, which draws fresh entropy.
     
     Returns
     -------
@@ -318,7 +381,7 @@ def simulate(mechanisms, filename, semester, coarsen):
     
     assignments = assignments_dict[semester]
     
-    results = compare_mechanisms_varying_num_assignments(assignments, mechanisms, semester, coarsen) 
+    results = compare_mechanisms_varying_num_assignments(assignments, mechanisms, semester, coarsen, default_rng(seed)) 
     
     json_file = "../results/" + filename + ".json"
     
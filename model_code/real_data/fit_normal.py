@@ -8,7 +8,7 @@ from scipy.optimize import fmin
 from scipy.stats import norm, entropy
 from statistics import mean, stdev
 
-from load import load_all
+from preprocess import load_all_cached
 
 def discretize_normal(mu, sigma, lower, upper):
     """
@@ -134,7 +134,7 @@ def fit_data(kl_div=False, coarsened=False):
 
     """
     
-    all_semesters = load_all(coarsened)
+    all_semesters = load_all_cached(coarsened)
     
     opt_params = []
     
@@ -10,6 +10,7 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 import numpy as np
 
 from classes import StrategicStudent, Submission
+from reports import semester_reports
 
 def round_grade(raw_grade, maximum):
     """
@@ -66,254 +67,10 @@ def load17(semester, coarsen_grades=False, drop_TA_grades=False):
         array = np.load("336Spring17.npy", allow_pickle=1)
     else: 
         array = np.load("336Fall17.npy", allow_pickle=1)
-        
-    submission_map = {}
-    submission_id_map = {}
-    assignment_num_map = {}
-    
-    count = 0
-    dropped_grades = 0
-    
-    for idx, weeks in enumerate(array):
-        for j, week in enumerate(weeks):
-            submitted = week[0]
-            for submission in submitted:
-                assignment_num = submission[0]
-                s_id = submission[1]
-                
-                sub = Submission(s_id, assignment_num)
-                sub.true_grade = submission[2]
-                sub.TA = bool(submission[3])
-                grades = submission[4]
-                sub.ta_grades = []
-                
-                if sub.true_grade == -1:
-                    dropped_grades += 1
-                    continue
-                
-                assignment_num_map[s_id] = assignment_num
-                
-                if drop_TA_grades and sub.TA:
-                    continue
-                
-                for grade in grades:
-                    score = grade[0]
-                    if grade[3] == 1:
-                        sub.ta_grades.append(score)
-                    else:
-                        count += 1
-                        student = grade[2]
-                        sub.grades[student] = score
-                   
-                match = False  
-                i = 0
-                submissions_list = list(submission_map.values())
-                while match == False and i < len(submissions_list):
-                    s = submissions_list[i]
-                    if s.assignment_number == sub.assignment_number and s.true_grade == sub.true_grade and s.TA == sub.TA and s.grades == sub.grades and len(sub.grades) > 0:
-                        match = True
-                        count -= len(s.grades)
-                        first = s.student_id
-                        joint_id = (first, s_id)
-                        s.student_id = joint_id
-                        submission_map.pop(first)
-                        submission_map[joint_id] = s
-                        submission_id_map[first] = joint_id
-                        submission_id_map[s_id] = joint_id
-                    else:
-                        i += 1
-                if match == False:
-                    submission_map[s_id] = sub
-                    submission_id_map[s_id] = s_id
-                    
-    retained_grades = 0 
-    
-    #print(count)
-    
-    student_map = {}
-    for sub_id, submission in submission_map.items():
-        s_id = submission.student_id
-        assignment = submission.assignment_number
-        for grader, score in submission.grades.items():
-                
-            if grader not in student_map.keys():
-                new_student_obj = StrategicStudent(grader)
-                new_student_obj.penalty_tasks = {}
-                student_map[grader] = new_student_obj
-                
-            student_obj = student_map[grader]
-            
-            if assignment not in student_obj.grades.keys():
-                student_obj.grades[assignment] = {}
-                
-            student_obj.grades[assignment][s_id] = score
-            
-            retained_grades += 1
     
-    for idx, weeks in enumerate(array):
-        if idx not in student_map.keys():
-            new_student = StrategicStudent(idx)
-            student_map[idx] = new_student
-        match = student_map[idx]
-        for j, week in enumerate(weeks):
-            graded = week[1]
-            for submission in graded:
-                raw_submission_id = submission[1]
-                if raw_submission_id not in assignment_num_map.keys() or raw_submission_id not in submission_id_map.keys():
-                    continue
-                assignment_num = assignment_num_map[raw_submission_id]
-                submission_id = submission_id_map[raw_submission_id]
-                grade = submission[2]
-               
-                if assignment_num not in match.grades.keys():
-                    match.grades[assignment_num] = {}
-                if submission_id not in match.grades[assignment_num].keys():
-                    match.grades[assignment_num][submission_id] = grade
-                    retained_grades += 1
-                if match.grades[assignment_num][submission_id] != grade:
-                    print("Matching Error...")
-                    print(idx, assignment_num, submission_id, grade)
-                else:
-                    submission_obj = submission_map[submission_id]
-                    if match.id not in submission_obj.grades.keys():
-                        submission_obj.grades[match.id] = grade
-    
-    students = list(student_map.values())
-    submissions = list(submission_map.values())
+    partition = [{1, 2, 3, 4}, {5, 6, 7, 8}, {9, 10, 11, 12}, {13, 14, 15, 16}]
     
-    no_updates = False
-    
-    while not no_updates:
-        no_updates = True
-        subs_with_enough_grades = []
-        students_with_enough_grades = []
-        
-        for student in students:
-            g_dict = student.grades
-            to_pop = []
-            for assignment in g_dict.keys():
-                if len(g_dict[assignment]) < 2:
-                    to_pop.append(assignment)
-            if len(to_pop) > 0:
-                for key in to_pop:
-                    graded = g_dict[key]
-                    for graded_id in graded.keys():
-                        graded_subs = [sub for sub in submissions if sub.assignment_number == key and sub.student_id == graded_id] 
-                        graded_sub = graded_subs[0]
-                        graded_sub.grades.pop(student.id)
-                        dropped_grades += 1
-                        retained_grades -= 1
-                    g_dict.pop(key)
-                no_updates = False
-            if len(student.grades) != 0:
-                students_with_enough_grades.append(student)
-                
-        students = students_with_enough_grades[:]
-                
-        for submission in submissions:
-            g_dict = submission.grades 
-            if len(g_dict) < 2:
-                possible_graders = [stud for stud in students if submission.assignment_number in stud.grades.keys()]
-                graders = [g for g in possible_graders if submission.student_id in g.grades[submission.assignment_number].keys()]
-                for grader in graders:
-                    grade = grader.grades[submission.assignment_number].pop(submission.student_id)
-                    if submission.assignment_number not in grader.penalty_tasks.keys():
-                        grader.penalty_tasks[submission.assignment_number] = {}
-                    grader.penalty_tasks[submission.assignment_number][submission.student_id] = grade
-                    dropped_grades += 1
-                    retained_grades -= 1
-                no_updates = False
-            else:
-                subs_with_enough_grades.append(submission)    
-        
-        submissions = subs_with_enough_grades[:]
-    
-    mismatched = 0
-    for submission in submissions:
-        
-        for grader, grade in submission.grades.items():
-            student_matches = [stu for stu in students if stu.id == grader]
-            if len(student_matches) != 1:
-                mismatched += 1
-                print("Sub matching error.")
-            else:
-                match = student_matches[0]
-                if match.grades[submission.assignment_number][submission.student_id] != grade:
-                    mismatched += 1
-                    print("Sub grade error.")
-    #print("Submission Mismatches:", mismatched)
-                  
-    max_assignment = -1
-    mismatched = 0
-    for student in students:
-        for assignment, grades in student.grades.items():
-            if assignment > max_assignment:
-                max_assignment = assignment
-            for graded, grade in grades.items():
-                sub_matches = [s for s in submissions if s.assignment_number == assignment and s.student_id == graded]
-                if len(sub_matches) != 1:
-                    mismatched += 1
-                    print("Student matching error.")
-                    print(student.id)
-                    print(assignment, grades)
-                    print()
-                else:
-                    match = sub_matches[0]
-                    if match.grades[student.id] != grade:
-                        mismatched += 1
-                        print("Student grade error.")
-    #print("Student Mismatches:", mismatched)
-    
-    for student in students:
-        student.included = False
-        assignments = set(student.grades.keys())
-        
-        i1 = assignments.intersection({1, 2, 3, 4})
-        i2 = assignments.intersection({5, 6, 7, 8})
-        i3 = assignments.intersection({9, 10, 11, 12})
-        i4 = assignments.intersection({13, 14, 15, 16})
-        
-        if len(i1) > 0 and len(i2) > 0 and len(i3) > 0 and len(i4) > 0: 
-            student.included = True
-    
-    '''
-    assignment_numbers = [sub.assignment_number for sub in submissions]
-    all_nums =  set(assignment_numbers)
-    unique_assignments = len(set(assignment_numbers))
-    included_students = [stu for stu in students if stu.included]
-    
-    print()
-    print(semester, "2017")
-    print("=====================")
-    print("Number of Students:", len(students))
-    print("Number of Included Students in Evaluation:", len(included_students))
-    print("Number of Submissions:", len(submissions))
-    print("Number of Assignments:", unique_assignments)
-    print("Number of grades dropped:", dropped_grades)
-    print("Number of grades retained:", retained_grades)
-    print("Assignment Numbers:", str(all_nums))
-    '''
-    
-    if coarsen_grades:
-        # Map all the grades into the integer range [0, 10].
-        max_val = 100
-        for student in students:
-            for assignment, grade_dict in student.grades.items():
-                for submission_id in grade_dict.keys():
-                    grade = grade_dict[submission_id]
-                    grade_dict[submission_id] = round_grade(grade, max_val)
-            for assignment, grade_dict in student.penalty_tasks.items():
-                for submission_id in grade_dict.keys():
-                    grade = grade_dict[submission_id]
-                    grade_dict[submission_id] = round_grade(grade, max_val)
-        for submission in submissions:
-            g = submission.true_grade
-            submission.true_grade = round_grade(g, max_val)
-            for grader in submission.grades.keys():
-                grade = submission.grades[grader]
-                submission.grades[grader] = round_grade(grade, max_val)
-    
-    return students, submissions
+    return load_semester(array, 0, False, partition, 100, coarsen_grades, drop_TA_grades)
 
 def load19(semester, coarsen_grades=False, drop_TA_grades=False):
     """
@@ -340,13 +97,58 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
     
     if semester == "Spring":
         array = np.load("336Spring19.npy", allow_pickle=1)
+        partition = [{1, 2, 3}, {4, 5, 6}, {7, 8, 9}, {10, 11, 13, 14}]
     else: 
         array = np.load("336Fall19.npy", allow_pickle=1)
+        partition = [{1, 2, 3}, {4, 5, 6}, {7, 8, 9, 10}, {11, 12, 13, 14}]
+    
+    return load_semester(array, 1, True, partition, 30, coarsen_grades, drop_TA_grades)
+
+def load_semester(array, assignment_offset, sum_grades, partition, max_val, coarsen_grades=False, drop_TA_grades=False):
+    """
+    Creates StrategicStudent and Submission objects from the grading data for a single semester (the contents of one of the .npy files).
+    
+    Duplicate submissions are found with a hash index keyed on (assignment, true grade, TA flag, peer grades), 
+    and the pruning steps look submissions and students up by id, so the running time is linear in the number of grades.
+
+    Parameters
+    ----------
+    array : np.array of objects
+        The grading data. array[student][week] = (submitted, graded).
+    assignment_offset : int
+        Added to the assignment numbers in the data (0 for 2017, 1 for 2019).
+    sum_grades : bool
+        True if each grade in the data is a list of rubric scores that should be summed (2019), False if it is a single number (2017).
+    partition : list of sets of ints
+        Students that graded at least one assignment from each set are included in the evaluation.
+    max_val : float
+        The maximum possible grade for a submission in the semester.
+    coarsen_grades : bool, optional
+        See load17 and load19. The default is False.
+    drop_TA_grades : bool, optional
+        See load17 and load19. The default is False.
+
+    Returns
+    -------
+    students : list of StrategicStudent objects
+        Contains all the students from the course in the given semester.
+    submissions : list of Submission objects
+        Contains all the submissions from the course in the given semester.
+
+    """
+    
+    def value(raw_grade):
+        if sum_grades:
+            return sum(raw_grade)
+        return raw_grade
         
     submission_map = {}
     submission_id_map = {}
     assignment_num_map = {}
     
+    #Maps (assignment, true grade, TA, frozenset of peer grades) to the submission (in submission_map) with those values.
+    duplicate_index = {}
+    
     count = 0
     dropped_grades = 0
     
@@ -354,7 +156,7 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
         for j, week in enumerate(weeks):
             submitted = week[0]
             for submission in submitted:
-                assignment_num = submission[0] + 1
+                assignment_num = submission[0] + assignment_offset
                 s_id = submission[1]
                 
                 sub = Submission(s_id, assignment_num)
@@ -373,34 +175,34 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
                     continue
                 
                 for grade in grades:
-                    score = sum(grade[0])
+                    score = value(grade[0])
                     if grade[3] == 1:
                         sub.ta_grades.append(score)
                     else:
                         count += 1
                         student = grade[2]
                         sub.grades[student] = score
-                   
-                match = False  
-                i = 0
-                submissions_list = list(submission_map.values())
-                while match == False and i < len(submissions_list):
-                    s = submissions_list[i]
-                    if s.assignment_number == sub.assignment_number and s.true_grade == sub.true_grade and s.TA == sub.TA and s.grades == sub.grades and len(sub.grades) > 0:
-                        match = True
-                        count -= len(s.grades)
-                        first = s.student_id
-                        joint_id = (first, s_id)
-                        s.student_id = joint_id
-                        submission_map.pop(first)
-                        submission_map[joint_id] = s
-                        submission_id_map[first] = joint_id
-                        submission_id_map[s_id] = joint_id
-                    else:
-                        i += 1
-                if match == False:
+                
+                key = (sub.assignment_number, sub.true_grade, sub.TA, frozenset(sub.grades.items()))
+                s = duplicate_index.get(key) if len(sub.grades) > 0 else None
+                if s is not None and submission_map.get(s.student_id) is not s:
+                    #The indexed submission was replaced in submission_map by a later submission with the same id.
+                    s = None
+                
+                if s is not None:
+                    count -= len(s.grades)
+                    first = s.student_id
+                    joint_id = (first, s_id)
+                    s.student_id = joint_id
+                    submission_map.pop(first)
+                    submission_map[joint_id] = s
+                    submission_id_map[first] = joint_id
+                    submission_id_map[s_id] = joint_id
+                else:
                     submission_map[s_id] = sub
                     submission_id_map[s_id] = s_id
+                    if len(sub.grades) > 0:
+                        duplicate_index[key] = sub
                     
     retained_grades = 0 
     
@@ -412,14 +214,14 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
         assignment = submission.assignment_number
         for grader, score in submission.grades.items():
                 
-            if grader not in student_map.keys():
+            if grader not in student_map:
                 new_student_obj = StrategicStudent(grader)
                 new_student_obj.penalty_tasks = {}
                 student_map[grader] = new_student_obj
                 
             student_obj = student_map[grader]
             
-            if assignment not in student_obj.grades.keys():
+            if assignment not in student_obj.grades:
                 student_obj.grades[assignment] = {}
                 
             student_obj.grades[assignment][s_id] = score
@@ -427,7 +229,7 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
             retained_grades += 1
     
     for idx, weeks in enumerate(array):
-        if idx not in student_map.keys():
+        if idx not in student_map:
             new_student = StrategicStudent(idx)
             student_map[idx] = new_student
         match = student_map[idx]
@@ -435,15 +237,15 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
             graded = week[1]
             for submission in graded:
                 raw_submission_id = submission[1]
-                if raw_submission_id not in assignment_num_map.keys() or raw_submission_id not in submission_id_map.keys():
+                if raw_submission_id not in assignment_num_map or raw_submission_id not in submission_id_map:
                     continue
                 assignment_num = assignment_num_map[raw_submission_id]
                 submission_id = submission_id_map[raw_submission_id]
-                grade = sum(submission[2])
+                grade = value(submission[2])
                
-                if assignment_num not in match.grades.keys():
+                if assignment_num not in match.grades:
                     match.grades[assignment_num] = {}
-                if submission_id not in match.grades[assignment_num].keys():
+                if submission_id not in match.grades[assignment_num]:
                     match.grades[assignment_num][submission_id] = grade
                     retained_grades += 1
                 if match.grades[assignment_num][submission_id] != grade:
@@ -451,12 +253,21 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
                     print(idx, assignment_num, submission_id, grade)
                 else:
                     submission_obj = submission_map[submission_id]
-                    if match.id not in submission_obj.grades.keys():
+                    if match.id not in submission_obj.grades:
                         submission_obj.grades[match.id] = grade
     
     students = list(student_map.values())
     submissions = list(submission_map.values())
     
+    """
+    Pruning: repeatedly drop the grades of students that graded fewer than 2 submissions for an assignment, 
+    and turn submissions with fewer than 2 grades into penalty tasks for their graders.
+    
+    A student holds a grade for a submission exactly when the submission holds the grade from that student, 
+    so the graders of a submission are looked up from submission.grades (rather than by scanning every student).
+    """
+    submission_index = {(sub.assignment_number, sub.student_id): sub for sub in submissions}
+    
     no_updates = False
     
     while not no_updates:
@@ -474,8 +285,7 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
                 for key in to_pop:
                     graded = g_dict[key]
                     for graded_id in graded.keys():
-                        graded_subs = [sub for sub in submissions if sub.assignment_number == key and sub.student_id == graded_id] 
-                        graded_sub = graded_subs[0]
+                        graded_sub = submission_index[(key, graded_id)]
                         graded_sub.grades.pop(student.id)
                         dropped_grades += 1
                         retained_grades -= 1
@@ -485,17 +295,19 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
                 students_with_enough_grades.append(student)
                 
         students = students_with_enough_grades[:]
+        student_index = {student.id: student for student in students}
                 
         for submission in submissions:
             g_dict = submission.grades 
             if len(g_dict) < 2:
-                possible_graders = [stud for stud in students if submission.assignment_number in stud.grades.keys()]
-                graders = [g for g in possible_graders if submission.student_id in g.grades[submission.assignment_number].keys()]
+                assignment = submission.assignment_number
+                possible_graders = [student_index[g] for g in g_dict.keys() if g in student_index]
+                graders = [g for g in possible_graders if submission.student_id in g.grades.get(assignment, {})]
                 for grader in graders:
-                    grade = grader.grades[submission.assignment_number].pop(submission.student_id)
-                    if submission.assignment_number not in grader.penalty_tasks.keys():
-                        grader.penalty_tasks[submission.assignment_number] = {}
-                    grader.penalty_tasks[submission.assignment_number][submission.student_id] = grade
+                    grade = grader.grades[assignment].pop(submission.student_id)
+                    if assignment not in grader.penalty_tasks:
+                        grader.penalty_tasks[assignment] = {}
+                    grader.penalty_tasks[assignment][submission.student_id] = grade
                     dropped_grades += 1
                     retained_grades -= 1
                 no_updates = False
@@ -504,16 +316,18 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
         
         submissions = subs_with_enough_grades[:]
     
+    student_index = {student.id: student for student in students}
+    submission_index = {(sub.assignment_number, sub.student_id): sub for sub in submissions}
+    
     mismatched = 0
     for submission in submissions:
         
         for grader, grade in submission.grades.items():
-            student_matches = [stu for stu in students if stu.id == grader]
-            if len(student_matches) != 1:
+            match = student_index.get(grader)
+            if match is None:
                 mismatched += 1
                 print("Sub matching error.")
             else:
-                match = student_matches[0]
                 if match.grades[submission.assignment_number][submission.student_id] != grade:
                     mismatched += 1
                     print("Sub grade error.")
@@ -526,15 +340,14 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
             if assignment > max_assignment:
                 max_assignment = assignment
             for graded, grade in grades.items():
-                sub_matches = [s for s in submissions if s.assignment_number == assignment and s.student_id == graded]
-                if len(sub_matches) != 1:
+                match = submission_index.get((assignment, graded))
+                if match is None:
                     mismatched += 1
                     print("Student matching error.")
                     print(student.id)
                     print(assignment, grades)
                     print()
                 else:
-                    match = sub_matches[0]
                     if match.grades[student.id] != grade:
                         mismatched += 1
                         print("Student grade error.")
@@ -543,17 +356,8 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
     for student in students:
         student.included = False
         assignments = set(student.grades.keys())
-        if semester == "Spring":
-            i1 = assignments.intersection({1, 2, 3})
-            i2 = assignments.intersection({4, 5, 6})
-            i3 = assignments.intersection({7, 8, 9})
-            i4 = assignments.intersection({10, 11, 13, 14})
-        else:
-            i1 = assignments.intersection({1, 2, 3})
-            i2 = assignments.intersection({4, 5, 6})
-            i3 = assignments.intersection({7, 8, 9, 10})
-            i4 = assignments.intersection({11, 12, 13, 14})
-        if len(i1) > 0 and len(i2) > 0 and len(i3) > 0 and len(i4) > 0: 
+        
+        if all(len(assignments.intersection(part)) > 0 for part in partition): 
             student.included = True
     
     '''
@@ -563,8 +367,6 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
     included_students = [stu for stu in students if stu.included]
     
     print()
-    print(semester, "2019")
-    print("=====================")
     print("Number of Students:", len(students))
     print("Number of Included Students in Evaluation:", len(included_students))
     print("Number of Submissions:", len(submissions))
@@ -576,7 +378,6 @@ def load19(semester, coarsen_grades=False, drop_TA_grades=False):
     
     if coarsen_grades:
         # Map all the grades into the integer range [0, 10].
-        max_val = 30
         for student in students:
             for assignment, grade_dict in student.grades.items():
                 for submission_id in grade_dict.keys():
@@ -623,4 +424,35 @@ def load_all(coarsen_grades=False):
     s19 = load19("Spring", coarsen_grades)
     f19 = load19("Fall", coarsen_grades)
     
-    return s17, f17, s19, f19
\ No newline at end of file
+    return s17, f17, s19, f19
+
+def load_reports(year, semester, coarsen_grades=False, drop_TA_grades=False):
+    """
+    Loads grading data for a single semester along with the array-backed reports for each assignment (see reports.py).
+
+    Parameters
+    ----------
+    year : int, 17 or 19
+    semester : str, "Spring" or "Fall"
+    coarsen_grades : bool, optional
+        See load17 and load19. The default is False.
+    drop_TA_grades : bool, optional
+        See load17 and load19. The default is False.
+
+    Returns
+    -------
+    students : list of StrategicStudent objects
+    submissions : list of Submission objects
+    reports : dict
+        { assignment_number (int): AssignmentReports object }
+
+    """
+    
+    if year == 17:
+        students, submissions = load17(semester, coarsen_grades, drop_TA_grades)
+    else:
+        students, submissions = load19(semester, coarsen_grades, drop_TA_grades)
+    
+    reports = semester_reports(students, submissions)
+    
+    return students, submissions, reports
@@ -0,0 +1,309 @@
+"""
+Caches the cleaned (de-duplicated, pruned and optionally coarsened) grading data for each semester on disk, so that the experiments do not re-run load17/load19 every time.
+
+A cached semester is a directory of .npy arrays in columnar form (one entry per report, one row per task, one row per student) plus a metadata.json file with the ids.
+The directory name encodes the semester, the coarsen_grades and drop_TA_grades flags and a hash of the contents of the source .npy file, so a cached semester is
+rebuilt automatically whenever the source data changes. The arrays are memory-mapped when a cached semester is read.
+
+Running this file as a script preprocesses every semester.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import hashlib
+import json
+import os, sys
+import shutil
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from classes import StrategicStudent, Submission
+from load import load17, load19
+
+CACHE_DIR = "cache"
+FORMAT_VERSION = 1
+
+def source_file(year, semester):
+    """
+    Returns the name of the .npy file with the grading data for a semester (as used by load17 and load19).
+    """
+    return "336" + semester + str(year) + ".npy"
+
+def file_hash(filename):
+    """
+    Returns the SHA-256 hash of the contents of a file, as a hex string.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_path(year, semester, coarsen_grades, drop_TA_grades, source_hash, cache_dir=CACHE_DIR):
+    """
+    Returns the path of the directory that holds a cached semester.
+    """
+    name = "{}{}_coarsen-{}_dropTA-{}_{}".format(semester, year, int(coarsen_grades), int(drop_TA_grades), source_hash[:16])
+    return os.path.join(cache_dir, name)
+
+def load_cached(year, semester, coarsen_grades=False, drop_TA_grades=False, cache_dir=CACHE_DIR):
+    """
+    Loads grading data for a single semester, from the cache if possible.
+    Equivalent to load17/load19 (same students, submissions, grades and penalty tasks, in the same order).
+
+    Parameters
+    ----------
+    year : int, 17 or 19
+    semester : str, "Spring" or "Fall"
+    coarsen_grades : bool, optional
+        See load17 and load19. The default is False.
+    drop_TA_grades : bool, optional
+        See load17 and load19. The default is False.
+    cache_dir : str, optional
+        The directory that holds the cached semesters. The default is CACHE_DIR.
+
+    Returns
+    -------
+    students : list of StrategicStudent objects
+    submissions : list of Submission objects
+
+    """
+    path = cache_path(year, semester, coarsen_grades, drop_TA_grades, file_hash(source_file(year, semester)), cache_dir)
+
+    if not os.path.isdir(path):
+        if year == 17:
+            students, submissions = load17(semester, coarsen_grades, drop_TA_grades)
+        else:
+            students, submissions = load19(semester, coarsen_grades, drop_TA_grades)
+        write_semester(path, students, submissions)
+        return students, submissions
+
+    return read_semester(path)
+
+def load_all_cached(coarsen_grades=False, cache_dir=CACHE_DIR):
+    """
+    Cached version of load.load_all.
+
+    Parameters
+    ----------
+    coarsen_grades : bool, optional
+        See load.load_all. The default is False.
+    cache_dir : str, optional
+        The default is CACHE_DIR.
+
+    Returns
+    -------
+    s17, f17, s19, f19 : doubles of lists
+        (list of StrategicStudent objects, list of Submission objects).
+
+    """
+    s17 = load_cached(17, "Spring", coarsen_grades, cache_dir=cache_dir)
+    f17 = load_cached(17, "Fall", coarsen_grades, cache_dir=cache_dir)
+    s19 = load_cached(19, "Spring", coarsen_grades, cache_dir=cache_dir)
+    f19 = load_cached(19, "Fall", coarsen_grades, cache_dir=cache_dir)
+
+    return s17, f17, s19, f19
+
+def write_semester(path, students, submissions):
+    """
+    Writes a cleaned semester (the output of load17 or load19) to a cache directory.
+
+    The directory is written under a temporary name and then renamed, so an interrupted write never leaves a partial cache behind.
+
+    Parameters
+    ----------
+    path : str
+        The cache directory (see cache_path).
+    students : list of StrategicStudent objects
+    submissions : list of Submission objects
+
+    Returns
+    -------
+    None.
+
+    """
+    task_ids = [sub.student_id for sub in submissions]
+    task_index = {(sub.assignment_number, sub.student_id): idx for idx, sub in enumerate(submissions)}
+    task_assignment = [sub.assignment_number for sub in submissions]
+
+    def task(assignment, task_id):
+        #Penalty tasks are not in the list of submissions, so they get their own rows.
+        key = (assignment, task_id)
+        if key not in task_index:
+            task_index[key] = len(task_ids)
+            task_ids.append(task_id)
+            task_assignment.append(assignment)
+        return task_index[key]
+
+    entry_grader = []
+    entry_task = []
+    entry_report = []
+    entry_penalty = []
+    entry_index = {}
+
+    for g_idx, student in enumerate(students):
+        for is_penalty, grades in ((False, student.grades), (True, student.penalty_tasks)):
+            for assignment, grade_dict in grades.items():
+                for task_id, grade in grade_dict.items():
+                    t_idx = task(assignment, task_id)
+                    if not is_penalty:
+                        entry_index[(student.id, t_idx)] = len(entry_grader)
+                    entry_grader.append(g_idx)
+                    entry_task.append(t_idx)
+                    entry_report.append(grade)
+                    entry_penalty.append(is_penalty)
+
+    #The order of the grades in each submission.grades dict, as indices of entries.
+    submission_entries = []
+    submission_indptr = [0]
+    ta_grades = []
+    ta_indptr = [0]
+    for s_idx, sub in enumerate(submissions):
+        submission_entries.extend(entry_index[(grader, s_idx)] for grader in sub.grades.keys())
+        submission_indptr.append(len(submission_entries))
+        ta_grades.extend(sub.ta_grades)
+        ta_indptr.append(len(ta_grades))
+
+    arrays = {
+            "entry_grader": np.array(entry_grader, dtype=np.int64),
+            "entry_task": np.array(entry_task, dtype=np.int64),
+            "entry_report": np.array(entry_report),
+            "entry_penalty": np.array(entry_penalty, dtype=bool),
+            "task_assignment": np.array(task_assignment, dtype=np.int64),
+            "submission_true_grade": np.array([sub.true_grade for sub in submissions]),
+            "submission_TA": np.array([sub.TA for sub in submissions], dtype=bool),
+            "submission_entries": np.array(submission_entries, dtype=np.int64),
+            "submission_indptr": np.array(submission_indptr, dtype=np.int64),
+            "ta_grades": np.array(ta_grades),
+            "ta_indptr": np.array(ta_indptr, dtype=np.int64),
+            "student_included": np.array([student.included for student in students], dtype=bool),
+        }
+
+    metadata = {
+            "version": FORMAT_VERSION,
+            "student_ids": [_to_json(student.id) for student in students],
+            "task_ids": [_to_json(task_id) for task_id in task_ids],
+            "num_submissions": len(submissions),
+        }
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), array)
+
+    with open(os.path.join(tmp_path, "metadata.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+
+    os.replace(tmp_path, path)
+
+def read_semester(path):
+    """
+    Reads a cached semester (see write_semester), memory-mapping the arrays, and rebuilds the StrategicStudent and Submission objects.
+
+    Parameters
+    ----------
+    path : str
+        The cache directory.
+
+    Returns
+    -------
+    students : list of StrategicStudent objects
+    submissions : list of Submission objects
+
+    """
+    arrays = read_arrays(path)
+
+    with open(os.path.join(path, "metadata.json"), encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    student_ids = [_from_json(s_id) for s_id in metadata["student_ids"]]
+    task_ids = [_from_json(t_id) for t_id in metadata["task_ids"]]
+    num_submissions = metadata["num_submissions"]
+
+    task_assignment = arrays["task_assignment"].tolist()
+
+    students = []
+    for s_id, included in zip(student_ids, arrays["student_included"].tolist()):
+        student = StrategicStudent(s_id)
+        student.penalty_tasks = {}
+        student.included = included
+        students.append(student)
+
+    entry_grader = arrays["entry_grader"].tolist()
+    entry_task = arrays["entry_task"].tolist()
+    entry_report = arrays["entry_report"].tolist()
+    entry_penalty = arrays["entry_penalty"].tolist()
+
+    for g_idx, t_idx, report, is_penalty in zip(entry_grader, entry_task, entry_report, entry_penalty):
+        student = students[g_idx]
+        grades = student.penalty_tasks if is_penalty else student.grades
+        grades.setdefault(task_assignment[t_idx], {})[task_ids[t_idx]] = report
+
+    true_grades = arrays["submission_true_grade"].tolist()
+    TA = arrays["submission_TA"].tolist()
+    submission_entries = arrays["submission_entries"].tolist()
+    submission_indptr = arrays["submission_indptr"].tolist()
+    ta_grades = arrays["ta_grades"].tolist()
+    ta_indptr = arrays["ta_indptr"].tolist()
+
+    submissions = []
+    for s_idx in range(num_submissions):
+        sub = Submission(task_ids[s_idx], task_assignment[s_idx])
+        sub.true_grade = true_grades[s_idx]
+        sub.TA = TA[s_idx]
+        sub.ta_grades = ta_grades[ta_indptr[s_idx]:ta_indptr[s_idx + 1]]
+        for e_idx in submission_entries[submission_indptr[s_idx]:submission_indptr[s_idx + 1]]:
+            sub.grades[student_ids[entry_grader[e_idx]]] = entry_report[e_idx]
+        submissions.append(sub)
+
+    return students, submissions
+
+def read_arrays(path):
+    """
+    Memory-maps the arrays of a cached semester, without building any objects.
+
+    Parameters
+    ----------
+    path : str
+        The cache directory.
+
+    Returns
+    -------
+    arrays : dict
+        Maps the name of each array (see write_semester) to a read-only memory-mapped np.array.
+
+    """
+    arrays = {}
+    for filename in os.listdir(path):
+        if filename.endswith(".npy"):
+            arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode='r')
+    return arrays
+
+def _to_json(task_id):
+    """
+    Converts an id (an int, or a nested tuple of ints for the joint ids of duplicate submissions) into a JSON-compatible value.
+    """
+    if isinstance(task_id, tuple):
+        return [_to_json(t) for t in task_id]
+    return int(task_id)
+
+def _from_json(value):
+    """
+    Inverse of _to_json.
+    """
+    if isinstance(value, list):
+        return tuple(_from_json(v) for v in value)
+    return value
+
+if __name__ == "__main__":
+
+    """
+    Preprocesses every semester, with and without coarsening.
+    """
+    for coarsen in (True, False):
+        for year in (17, 19):
+            for semester in ("Spring", "Fall"):
+                load_cached(year, semester, coarsen)
@@ -0,0 +1,496 @@
+"""
+Array-backed representation of the reports collected for the assignments in a semester.
+
+The Student and Submission objects store reports in nested dicts, which is convenient for small simulations but slow for the mechanisms to traverse.
+An AssignmentReports object stores the same information in coordinate form (grader index, task index, report), sorted by grader, along with the index arrays that map graders and tasks back to the original objects.
+The memory used is proportional to the number of reports, so semesters of 100,000 students (with a few reports per student) fit easily; a dense (graders x tasks) view is only built on demand (see to_dense).
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import numpy as np
+
+from topology import AssignmentTopology
+
+class AssignmentReports:
+    """
+    The reports for a single assignment, stored as arrays.
+
+    Attributes
+    ----------
+    assignment_number : int.
+                        Assignment identifier.
+    grader_ids : np.array, shape (n_graders,).
+                 The id of the Student corresponding to each grader index (row).
+    task_ids : np.array, shape (n_tasks,).
+               The id of the task (submission.student_id) corresponding to each task index (column).
+               Integer dtype when all ids are ints, object dtype otherwise (e.g. the joint ids used for the real data).
+    rows : np.array of ints, shape (n_reports,).
+           Grader index of each report.
+    cols : np.array of ints, shape (n_reports,).
+           Task index of each report.
+    values : np.array, shape (n_reports,).
+             The reports, sorted by grader and then by task, so that the reports of grader g are values[topology.tasks_indptr[g]:topology.tasks_indptr[g + 1]].
+    topology : AssignmentTopology object.
+               The tasks graded by each grader and the graders of each task, in CSR form (the "submissions" of the topology are all of the tasks, including penalty tasks).
+    is_submission : np.array of bools, shape (n_tasks,).
+                    False for "penalty tasks" (tasks that were graded but are not Submission objects in the experiment; see Student.penalty_tasks).
+    true_grades : np.array of floats, shape (n_tasks,).
+                  Ground truth score for each task; nan for penalty tasks.
+    grader_index : dict.
+                   Maps a grader id to its grader index (row).
+    task_index : dict.
+                 Maps a task id to its task index (column).
+    """
+
+    def __init__(self, assignment_number, grader_ids, task_ids, rows, cols, values, is_submission=None, true_grades=None):
+        """
+        Creates an AssignmentReports object from the reports in coordinate form, in any order.
+
+        Parameters
+        ----------
+        assignment_number : int.
+        grader_ids : list or np.array of grader ids.
+        task_ids : list or np.array of task ids.
+        rows : np.array of ints.
+               Grader index (into grader_ids) of each report.
+        cols : np.array of ints.
+               Task index (into task_ids) of each report. Each (row, col) pair should appear at most once.
+        values : np.array.
+                 The reports.
+        is_submission : np.array of bools, optional.
+                        The default is None, meaning that every task is a submission.
+        true_grades : np.array of floats, optional.
+                      The default is None, meaning that the ground truth is unknown (all nan).
+
+        """
+        self.assignment_number = assignment_number
+        self.grader_ids = _id_array(grader_ids)
+        self.task_ids = _id_array(task_ids)
+
+        n_tasks = len(self.task_ids)
+
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        cols = np.asarray(cols, dtype=np.int64).reshape(-1)
+        order = np.lexsort((cols, rows))
+
+        self.topology = AssignmentTopology(cols[order], rows[order], n_tasks, len(self.grader_ids))
+        self.rows = rows[order]
+        self.cols = self.topology.tasks_indices
+        self.values = np.asarray(values).reshape(-1)[order]
+
+        #Sorted keys for looking up the report of a (grader, task) pair (see lookup).
+        self._keys = self.rows * n_tasks + self.cols
+
+        for array in (self.rows, self.values, self._keys):
+            array.setflags(write=False)
+
+        if is_submission is None:
+            is_submission = np.ones(n_tasks, dtype=bool)
+        self.is_submission = is_submission
+
+        if true_grades is None:
+            true_grades = np.full(n_tasks, np.nan)
+        self.true_grades = true_grades
+
+        self.grader_index = {g: idx for idx, g in enumerate(self.grader_ids.tolist())}
+        self.task_index = {t: idx for idx, t in enumerate(self.task_ids.tolist())}
+
+    @property
+    def num_graders(self):
+        return len(self.grader_ids)
+
+    @property
+    def num_tasks(self):
+        return len(self.task_ids)
+
+    @classmethod
+    def from_dense(cls, assignment_number, grader_ids, task_ids, reports, mask, is_submission=None, true_grades=None):
+        """
+        Creates an AssignmentReports object from a dense report matrix and mask (e.g. for small, hand-built examples).
+
+        Parameters
+        ----------
+        assignment_number : int.
+        grader_ids : list or np.array of grader ids.
+        task_ids : list or np.array of task ids.
+        reports : np.array, shape (len(grader_ids), len(task_ids)).
+        mask : np.array of bools, shape (len(grader_ids), len(task_ids)).
+               mask[g, t] is True when grader g graded task t.
+        is_submission : np.array of bools, optional.
+                        See AssignmentReports. The default is None.
+        true_grades : np.array of floats, optional.
+                      See AssignmentReports. The default is None.
+
+        Returns
+        -------
+        reports : AssignmentReports object.
+
+        """
+        rows, cols = np.nonzero(mask)
+        return cls(assignment_number, grader_ids, task_ids, rows, cols, reports[rows, cols], is_submission, true_grades)
+
+    @classmethod
+    def from_grader_dict(cls, grader_dict, assignment_num=None, dtype=np.int8):
+        """
+        Creates an AssignmentReports object from a grader_dict, reading the reports from the "grades" (and "penalty_tasks") attributes of the graders.
+
+        Parameters
+        ----------
+        grader_dict : dict.
+                      Maps a Submission object to a list of graders (Student objects).
+        assignment_num : int, optional.
+                         The default is None, in which case the assignment_number of the Submission objects is used.
+        dtype : numpy dtype, optional.
+                The dtype of the reports. The default is np.int8, which is sufficient for all of the grade ranges in the experiments.
+
+        Returns
+        -------
+        reports : AssignmentReports object.
+
+        """
+        submissions = list(grader_dict.keys())
+        if assignment_num is None:
+            assignment_num = submissions[0].assignment_number if len(submissions) > 0 else None
+
+        graders = {}
+        for grader_list in grader_dict.values():
+            for grader in grader_list:
+                graders[grader.id] = grader
+
+        return cls._from_objects(assignment_num, list(graders.values()), submissions, dtype)
+
+    @classmethod
+    def from_grading_dict(cls, grading_dict, assignment_num, dtype=np.int8):
+        """
+        Creates an AssignmentReports object from a grading_dict (see grading.get_grading_dict).
+
+        Parameters
+        ----------
+        grading_dict : dict.
+                       Maps a grader (Student object) to a list of Submission objects.
+        assignment_num : int.
+        dtype : numpy dtype, optional.
+                The default is np.int8.
+
+        Returns
+        -------
+        reports : AssignmentReports object.
+
+        """
+        submissions = {}
+        for submission_list in grading_dict.values():
+            for submission in submission_list:
+                submissions[submission.student_id] = submission
+        submissions = [submissions[key] for key in sorted(submissions.keys(), key=_sort_key)]
+
+        return cls._from_objects(assignment_num, list(grading_dict.keys()), submissions, dtype)
+
+    @classmethod
+    def from_students(cls, student_list, submission_list, assignment_num, dtype=np.int8):
+        """
+        Creates an AssignmentReports object for one assignment from lists of Student and Submission objects that may span a whole semester (e.g. the output of load17 or load19).
+
+        Parameters
+        ----------
+        student_list : list of Student objects.
+        submission_list : list of Submission objects.
+        assignment_num : int.
+        dtype : numpy dtype, optional.
+                The default is np.int8.
+
+        Returns
+        -------
+        reports : AssignmentReports object.
+
+        """
+        submissions = [sub for sub in submission_list if sub.assignment_number == assignment_num]
+        graders = [stu for stu in student_list if assignment_num in stu.grades.keys()]
+
+        return cls._from_objects(assignment_num, graders, submissions, dtype)
+
+    @classmethod
+    def _from_objects(cls, assignment_num, graders, submissions, dtype):
+        task_ids = [submission.student_id for submission in submissions]
+        true_grades = [submission.true_grade for submission in submissions]
+        task_index = {t: idx for idx, t in enumerate(task_ids)}
+
+        #Penalty tasks are appended after the submissions.
+        for grader in graders:
+            for task in grader.penalty_tasks.get(assignment_num, {}).keys():
+                if task not in task_index:
+                    task_index[task] = len(task_ids)
+                    task_ids.append(task)
+                    true_grades.append(np.nan)
+
+        num_submissions = len(submissions)
+        rows = []
+        cols = []
+        values = []
+
+        for g_idx, grader in enumerate(graders):
+            for task, report in grader.grades.get(assignment_num, {}).items():
+                rows.append(g_idx)
+                cols.append(task_index[task])
+                values.append(report)
+            for task, report in grader.penalty_tasks.get(assignment_num, {}).items():
+                rows.append(g_idx)
+                cols.append(task_index[task])
+                values.append(report)
+
+        is_submission = np.zeros(len(task_ids), dtype=bool)
+        is_submission[:num_submissions] = True
+
+        grader_ids = [grader.id for grader in graders]
+
+        return cls(assignment_num, grader_ids, task_ids, rows, cols, np.array(values, dtype=dtype), is_submission, np.array(true_grades, dtype=float))
+
+    @property
+    def num_reports(self):
+        return len(self.values)
+
+    def entries(self):
+        """
+        Returns the reports in coordinate form, sorted by grader and then by task.
+
+        Returns
+        -------
+        rows : np.array of ints.
+               Grader (row) index of each report.
+        cols : np.array of ints.
+               Task (column) index of each report.
+        values : np.array.
+                 The reports.
+
+        """
+        return self.rows, self.cols, self.values
+
+    def lookup(self, rows, cols):
+        """
+        Returns the reports of the given (grader, task) pairs, or 0 for pairs in which the grader did not grade the task.
+
+        Parameters
+        ----------
+        rows : np.array of ints.
+               Grader indices.
+        cols : np.array of ints.
+               Task indices (broadcast against rows).
+
+        Returns
+        -------
+        values : np.array, with the broadcast shape of rows and cols.
+
+        """
+        rows, cols = np.broadcast_arrays(np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))
+        keys = rows * self.num_tasks + cols
+        if len(self._keys) == 0:
+            return np.zeros(keys.shape, dtype=self.values.dtype)
+
+        idx = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return np.where(self._keys[idx] == keys, self.values[idx], 0)
+
+    def to_dense(self):
+        """
+        Returns the reports as a dense (graders x tasks) matrix with a mask.
+        This uses memory proportional to n_graders * n_tasks, so it is only meant for small semesters (e.g. for inspecting the reports).
+
+        Returns
+        -------
+        reports : np.array, shape (n_graders, n_tasks).
+                  reports[g, t] is the report that grader g gave for task t. Entries are 0 where mask is False.
+        mask : np.array of bools, shape (n_graders, n_tasks).
+               mask[g, t] is True when grader g graded task t.
+
+        """
+        reports = np.zeros((self.num_graders, self.num_tasks), dtype=self.values.dtype)
+        mask = np.zeros((self.num_graders, self.num_tasks), dtype=bool)
+        reports[self.rows, self.cols] = self.values
+        mask[self.rows, self.cols] = True
+        return reports, mask
+
+    def graders_per_task(self):
+        """
+        Returns the number of reports for each task, as an np.array of shape (n_tasks,).
+        """
+        return self.topology.graders_per_submission()
+
+    def submissions_per_grader(self):
+        """
+        Returns the number of submission tasks (i.e. not counting penalty tasks) graded by each grader, as an np.array of shape (n_graders,).
+        """
+        return np.bincount(self.rows[self.is_submission[self.cols]], minlength=self.num_graders)
+
+    def tasks_by_grader(self):
+        """
+        Returns, in compressed sparse row form, the task columns that each grader graded (including penalty tasks).
+
+        Returns
+        -------
+        indptr : np.array of ints, shape (n_graders + 1,).
+        indices : np.array of ints.
+                  The task columns graded by grader g are indices[indptr[g]:indptr[g + 1]], in increasing order.
+
+        """
+        return self.topology.tasks_indptr, self.topology.tasks_indices
+
+    def graders_by_task(self):
+        """
+        Returns, in compressed sparse column form, the grader rows that graded each task.
+
+        Returns
+        -------
+        indptr : np.array of ints, shape (n_tasks + 1,).
+        indices : np.array of ints.
+                  The grader rows for task t are indices[indptr[t]:indptr[t + 1]], in increasing order.
+
+        """
+        return self.topology.graders_indptr, self.topology.graders_indices
+
+    def report_counts(self, num_values=11):
+        """
+        Counts the reports of each value for each submission task (penalty tasks have all-zero counts).
+
+        Parameters
+        ----------
+        num_values : int, optional.
+                     Reports are assumed to be ints in [0, num_values). The default is 11.
+
+        Returns
+        -------
+        counts : np.array of ints, shape (n_tasks, num_values).
+
+        """
+        rows, cols, values = self.entries()
+        keep = self.is_submission[cols]
+        flat = cols[keep] * num_values + values[keep].astype(np.int64)
+        counts = np.bincount(flat, minlength=self.num_tasks * num_values)
+        return counts.reshape(self.num_tasks, num_values)
+
+    def squared_errors(self):
+        """
+        Computes the sum of squared errors of each grader's reports from the ground truth, over the submission tasks.
+
+        Returns
+        -------
+        errors : np.array of floats, shape (n_graders,).
+
+        """
+        rows, cols, values = self.entries()
+        keep = self.is_submission[cols]
+        rows, cols = rows[keep], cols[keep]
+        diff = values[keep] - np.nan_to_num(self.true_grades[cols])
+        return np.bincount(rows, weights=diff * diff, minlength=self.num_graders)
+
+    def write_to_objects(self, student_list, submission_list):
+        """
+        Writes the reports back into the "grades" (and "penalty_tasks") attributes of the Student and Submission objects.
+
+        Parameters
+        ----------
+        student_list : list of Student objects.
+                       Students whose id is not in grader_ids are ignored.
+        submission_list : list of Submission objects.
+                          Submissions whose student_id is not in task_ids, or that are for a different assignment, are ignored.
+
+        Returns
+        -------
+        None.
+
+        """
+        assignment = self.assignment_number
+        grader_ids = self.grader_ids.tolist()
+        task_ids = self.task_ids.tolist()
+        is_submission = self.is_submission.tolist()
+
+        indptr = self.topology.tasks_indptr.tolist()
+        cols = self.cols.tolist()
+        values = self.values.tolist()
+
+        for student in student_list:
+            g_idx = self.grader_index.get(student.id)
+            if g_idx is None:
+                continue
+            start, end = indptr[g_idx], indptr[g_idx + 1]
+            grades = {}
+            penalties = {}
+            for t_idx, report in zip(cols[start:end], values[start:end]):
+                if is_submission[t_idx]:
+                    grades[task_ids[t_idx]] = report
+                else:
+                    penalties[task_ids[t_idx]] = report
+            student.grades[assignment] = grades
+            if len(penalties) > 0:
+                student.penalty_tasks[assignment] = penalties
+
+        #The reports in task-major order (graders_indices lists the graders of each task in increasing order, like rows within a task).
+        order = np.argsort(self.cols, kind="stable")
+        indptr = self.topology.graders_indptr.tolist()
+        rows = self.rows[order].tolist()
+        values = self.values[order].tolist()
+
+        for submission in submission_list:
+            if submission.assignment_number != assignment:
+                continue
+            t_idx = self.task_index.get(submission.student_id)
+            if t_idx is None:
+                continue
+            start, end = indptr[t_idx], indptr[t_idx + 1]
+            for g_idx, report in zip(rows[start:end], values[start:end]):
+                submission.grades[grader_ids[g_idx]] = report
+
+    def add_payments(self, payments, student_list):
+        """
+        Adds a vector of payments (aligned with grader_ids) to the "payment" attribute of the corresponding Student objects.
+
+        Parameters
+        ----------
+        payments : np.array of floats, shape (n_graders,).
+        student_list : list of Student objects.
+                       Students whose id is not in grader_ids are ignored.
+
+        Returns
+        -------
+        None.
+
+        """
+        payments = np.asarray(payments, dtype=float).tolist()
+        for student in student_list:
+            g_idx = self.grader_index.get(student.id)
+            if g_idx is not None:
+                student.payment += payments[g_idx]
+
+def semester_reports(student_list, submission_list, dtype=np.int8):
+    """
+    Creates an AssignmentReports object for every assignment in a semester.
+
+    Parameters
+    ----------
+    student_list : list of Student objects.
+    submission_list : list of Submission objects.
+    dtype : numpy dtype, optional.
+            The default is np.int8.
+
+    Returns
+    -------
+    reports : dict.
+              { assignment_number (int): AssignmentReports object }
+
+    """
+    assignments = sorted({sub.assignment_number for sub in submission_list})
+    return {a: AssignmentReports.from_students(student_list, submission_list, a, dtype) for a in assignments}
+
+def _id_array(ids):
+    """
+    Stores a sequence of ids as an np.array, falling back to object dtype for non-integer ids (e.g. tuples).
+    """
+    ids = list(ids)
+    if all(isinstance(i, (int, np.integer)) for i in ids):
+        return np.array(ids, dtype=np.int64)
+    array = np.empty(len(ids), dtype=object)
+    array[:] = ids
+    return array
+
+def _sort_key(task_id):
+    if isinstance(task_id, tuple):
+        return task_id
+    return (task_id,)
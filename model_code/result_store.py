@@ -0,0 +1,199 @@
+"""
+Append-only store for the results of completed jobs, so that an interrupted experiment resumes where it stopped instead of starting over.
+
+The store is a JSON-lines file. Every line is a record of the results of one batch of consecutive semesters (see runner.run_jobs), keyed by
+
+    - a hash of the configuration of the experiment (see config_hash),
+    - the point of the sweep (e.g. the number of active graders) and its root seed (a numpy SeedSequence),
+    - the batch: the mechanism (or "CRN", for a batch of semesters scored with every mechanism) and the range of jobs (semesters) of the point that it holds.
+
+Records are only ever appended (and flushed to disk as soon as a batch is completed), so a crash loses at most the batches that were running.
+When the experiment is run again, every batch that is already in the store is read back instead of being simulated, and the results of the experiment are
+assembled ("merged") in the usual layout from the store. Because every semester is seeded from the root seed and its position (see runner.py), the merged results
+are the same as the results of an uninterrupted run.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+"""
+The default number of semesters in a batch (the unit of work that is saved to the store).
+"""
+BATCH_SIZE = 10
+
+def config_hash(config):
+    """
+    Returns a hash (hex string) of a JSON-compatible description of the configuration of an experiment.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+def _to_json(value):
+    """
+    Converts numpy scalars (e.g. the metrics of a semester) into Python numbers, for json.dumps.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Object of type " + type(value).__name__ + " is not JSON serializable.")
+
+class ResultStore:
+    """
+    The store of the results of an experiment.
+
+    Attributes
+    ----------
+    filename : str.
+               The JSON-lines file that holds the records.
+    config_hash : str.
+                  The hash of the configuration of the experiment. Records with a different hash in the same file are ignored.
+    batch_size : int.
+                 The number of semesters in a batch.
+    records : dict.
+              Maps the key of each record (see PointStore) to its results.
+    entropy : int or None.
+              The root entropy of the experiment when it was run without a seed (see root_seed).
+    read_only : bool.
+                Indicates whether the store only serves the batches it already has (see PointStore.load), e.g. to merge the results of an experiment without running it.
+    partial_line : bool.
+                   Indicates whether the file ends in the partial line of an interrupted write.
+    """
+
+    def __init__(self, filename, config, batch_size=BATCH_SIZE, read_only=False):
+        """
+        Creates a ResultStore object, reading the records that are already in the file (if it exists).
+
+        Parameters
+        ----------
+        filename : str.
+        config : JSON-compatible object.
+                 Describes the configuration of the experiment (everything that determines the results, other than the seed).
+        batch_size : int, optional.
+                     The default is BATCH_SIZE.
+        read_only : bool, optional.
+                    The default is False.
+
+        """
+        self.filename = filename
+        self.config_hash = config_hash(config)
+        self.batch_size = batch_size
+        self.records = {}
+        self.entropy = None
+        self.read_only = read_only
+        self.partial_line = False
+
+        if not os.path.exists(filename):
+            return
+
+        with open(filename, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    #The last line of an interrupted write. The next record starts on a new line (see _append).
+                    self.partial_line = not line.endswith("\n")
+                    continue
+
+                if record["config"] != self.config_hash:
+                    continue
+
+                if "entropy" in record:
+                    if self.entropy is None:
+                        self.entropy = record["entropy"]
+                else:
+                    self.records[record["key"]] = record["results"]
+
+    def root_seed(self, seed):
+        """
+        Returns the root seed of the experiment: seed itself, or, if seed is None, fresh entropy that is recorded in the store (or the entropy recorded by a previous run),
+        so that a restarted experiment continues with the same seed.
+        """
+        if seed is not None:
+            return seed
+
+        if self.entropy is None:
+            if self.read_only:
+                raise ValueError(self.filename + " does not hold any results of this experiment.")
+            self.entropy = np.random.SeedSequence().entropy
+            self._append({"config": self.config_hash, "entropy": self.entropy})
+
+        return self.entropy
+
+    def point(self, path, seed):
+        """
+        Returns the PointStore for a point of the sweep.
+
+        Parameters
+        ----------
+        path : tuple.
+               Identifies the point (e.g. (strategy, number of strategic graders)).
+        seed : int or numpy.random.SeedSequence.
+               The root seed of the point.
+
+        Returns
+        -------
+        store : PointStore object.
+
+        """
+        return PointStore(self, path, seed)
+
+    def _append(self, record):
+        """
+        Appends a record to the file, and flushes it to disk.
+        """
+        line = json.dumps(record, default=_to_json)
+        if self.partial_line:
+            line = "\n" + line
+            self.partial_line = False
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class PointStore:
+    """
+    The part of a ResultStore that holds the batches of a single point of the sweep. This is the store that is passed to runner.run_semesters and runner.run_common_semesters.
+
+    Attributes
+    ----------
+    batch_size : int.
+    """
+
+    def __init__(self, store, path, seed):
+        """
+        Creates a PointStore object (see ResultStore.point).
+        """
+        seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.store = store
+        self.batch_size = store.batch_size
+        self.prefix = [list(path), [seed.entropy, list(seed.spawn_key)]]
+
+    def _key(self, batch):
+        return json.dumps(self.prefix + [list(batch)], default=_to_json)
+
+    def load(self, batch):
+        """
+        Returns the results of a batch (a list with the return value of each job), or None if the batch has not been completed.
+        Raises a ValueError instead of returning None if the store is read-only.
+
+        Parameters
+        ----------
+        batch : tuple.
+                (name, start, stop): the jobs start, ..., stop - 1 of the point, which simulate semesters for the mechanism with key name (or "CRN").
+
+        """
+        results = self.store.records.get(self._key(batch))
+        if results is None and self.store.read_only:
+            raise ValueError(self.store.filename + " does not hold the results of the batch " + str(batch) + " of the point " + str(self.prefix[0]) + ".")
+        return results
+
+    def save(self, batch, results):
+        """
+        Adds the results of a completed batch to the store.
+        """
+        key = self._key(batch)
+        self.store._append({"config": self.store.config_hash, "key": key, "results": results})
+        self.store.records[key] = json.loads(json.dumps(results, default=_to_json))
@@ -0,0 +1,581 @@
+"""
+Shared experiment runner for the simulation scripts.
+
+Semesters are independent, so the simulations can be fanned out over a pool of worker processes (concurrent.futures.ProcessPoolExecutor).
+Each job (one semester, simulated for one mechanism, or for every mechanism in common random numbers mode) is given its own child of a single numpy SeedSequence,
+from which it gets a numpy.random.Generator (passed to the job as rng) that is the only source of randomness in the job: the Generator is passed explicitly through setup, grading and the mechanisms.
+The results of an experiment therefore depend only on the seed and the list of jobs, not on the number of workers, the order in which the jobs finish, or any global random state,
+and any single job can be replayed bit-for-bit from its SeedSequence (see job_rng).
+For the same reason, the results of completed batches of jobs can be saved as they come in and read back when an interrupted experiment is run again (see result_store.py).
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import copy, deepcopy
+import os
+
+import numpy as np
+
+from grading import assign_grades, assign_graders, get_grading_dict
+from grading_dmi import assign_graders_dmi_clusters
+from mechanisms.parametric_mse import EMState
+from mechanisms.registry import get_mechanism
+from setup import initialize_submission_list, shuffle_students
+
+def job_rng(seed, job):
+    """
+    Returns the Generator that job number job of an experiment with the given root seed is run with (see run_jobs), e.g. to replay a single semester.
+
+    Parameters
+    ----------
+    seed : int or numpy.random.SeedSequence.
+           The root seed of the experiment.
+    job : int.
+          The index of the job in the list of jobs.
+
+    Returns
+    -------
+    rng : numpy.random.Generator.
+
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.default_rng(root.spawn(job + 1)[job])
+
+def _run_job(function, args, seed_sequence):
+    """
+    Runs a single job in a worker process (or in the main process, when there is only one worker).
+    """
+    return function(*args, rng=np.random.default_rng(seed_sequence))
+
+def _run_batch(function, jobs, seed_sequences):
+    """
+    Runs a batch of jobs, one after the other, in a single worker process.
+    """
+    return [_run_job(function, args, ss) for args, ss in zip(jobs, seed_sequences)]
+
+def run_jobs(function, jobs, workers=1, seed=None, batches=None, store=None):
+    """
+    Calls function(*args, rng=rng) for each tuple of args in jobs, in parallel, where rng is a numpy.random.Generator seeded deterministically for each job.
+
+    Parameters
+    ----------
+    function : function.
+               Must be defined at the top level of a module (or script), so that it can be sent to the worker processes, and must take the keyword argument rng.
+    jobs : list of tuples.
+           The arguments for each call.
+    workers : int, optional.
+              The number of worker processes. The default is 1, which runs the jobs one at a time in the current process.
+              None uses every available core.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           The root of the seeds for the jobs (job i is seeded with the i-th child of the root SeedSequence). The default is None, which draws fresh entropy.
+    batches : list of 3-tuples, optional.
+              Splits the jobs into batches (name, start, stop) of the consecutive jobs start, ..., stop - 1, each of which is run in a single worker process.
+              The default is None, which runs each job as its own batch.
+    store : optional.
+            Checkpoint for the results of the batches (e.g. a result_store.PointStore object): store.load(batch) returns the results of a completed batch (or None),
+            and store.save(batch, results) is called as soon as a batch is completed. Completed batches are not run again. The default is None.
+
+    Returns
+    -------
+    results : list.
+              The return values of the calls, in the same order as jobs.
+
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    seed_sequences = root.spawn(len(jobs))
+
+    if batches is None:
+        batches = [("", idx, idx + 1) for idx in range(len(jobs))]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    results = [None]*len(jobs)
+
+    def complete(batch, batch_results):
+        if store is not None:
+            store.save(batch, batch_results)
+            batch_results = store.load(batch)
+        name, start, stop = batch
+        results[start:stop] = batch_results
+
+    pending = []
+    for batch in batches:
+        batch_results = store.load(batch) if store is not None else None
+        if batch_results is None:
+            pending.append(batch)
+        else:
+            name, start, stop = batch
+            results[start:stop] = batch_results
+
+    if workers == 1 or len(pending) <= 1:
+        for batch in pending:
+            name, start, stop = batch
+            complete(batch, _run_batch(function, jobs[start:stop], seed_sequences[start:stop]))
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+        futures = {executor.submit(_run_batch, function, jobs[start:stop], seed_sequences[start:stop]): (name, start, stop) for name, start, stop in pending}
+        for future in as_completed(futures):
+            complete(futures[future], future.result())
+
+    return results
+
+def _batches(name, offset, num_jobs, store):
+    """
+    Splits the jobs offset, ..., offset + num_jobs - 1 into batches (name, start, stop) of store.batch_size jobs (or of one job, without a store).
+    """
+    batch_size = store.batch_size if store is not None else 1
+    return [(name, offset + start, offset + min(start + batch_size, num_jobs)) for start in range(0, num_jobs, batch_size)]
+
+def run_semesters(simulate_semester, num_iterations, mechanisms, args=(), workers=1, seed=None, store=None):
+    """
+    Fans semesters x mechanisms out over the worker processes.
+
+    Each job calls simulate_semester(*args, mechanism, mechanism_param, rng=rng) once, i.e. simulates and evaluates one semester for one mechanism.
+
+    Parameters
+    ----------
+    simulate_semester : function.
+                        Returns the evaluation metric(s) for a single simulated semester.
+    num_iterations : int.
+                     The number of semesters to simulate for each mechanism.
+    mechanisms : list of 2-tuples of strings.
+                 Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
+    args : tuple, optional.
+           The arguments to simulate_semester that precede the mechanism name and param. The default is ().
+    workers : int, optional.
+              See run_jobs. The default is 1.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           See run_jobs. The default is None.
+    store : optional.
+            See run_jobs. The semesters of each mechanism are saved in batches of store.batch_size, labelled with "mechanism_name: mechanism_param". The default is None.
+
+    Returns
+    -------
+    semester_results : dict.
+                       Maps the string "mechanism_name: mechanism_param" to the list of values returned by simulate_semester (one per semester, in order).
+
+    """
+    jobs = []
+    batches = []
+    for mechanism, param in mechanisms:
+        batches.extend(_batches(mechanism + ": " + param, len(jobs), num_iterations, store))
+        for _ in range(num_iterations):
+            jobs.append(tuple(args) + (mechanism, param))
+
+    results = run_jobs(simulate_semester, jobs, workers, seed, batches, store)
+
+    semester_results = {}
+    for idx, (mechanism, param) in enumerate(mechanisms):
+        key = mechanism + ": " + param
+        semester_results[key] = results[idx*num_iterations:(idx + 1)*num_iterations]
+
+    return semester_results
+
+def run_common_semesters(simulate_semester_crn, num_iterations, mechanisms, args=(), workers=1, seed=None, store=None):
+    """
+    Common random numbers version of run_semesters: each semester is simulated once and scored with every mechanism, so the comparisons between mechanisms are paired.
+
+    Each job calls simulate_semester_crn(*args, mechanisms, rng=rng) once, which returns a dict that maps "mechanism_name: mechanism_param" to the evaluation metric(s) for that semester.
+
+    Parameters
+    ----------
+    simulate_semester_crn : function.
+    num_iterations : int.
+                     The number of semesters to simulate.
+    mechanisms : list of 2-tuples of strings.
+                 Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
+    args : tuple, optional.
+           The arguments to simulate_semester_crn that precede the list of mechanisms. The default is ().
+    workers : int, optional.
+              See run_jobs. The default is 1.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           See run_jobs. The default is None.
+    store : optional.
+            See run_jobs. The semesters are saved in batches of store.batch_size, labelled with "CRN". The default is None.
+
+    Returns
+    -------
+    semester_results : dict.
+                       Same format as run_semesters.
+
+    """
+    jobs = [tuple(args) + (mechanisms,) for _ in range(num_iterations)]
+
+    results = run_jobs(simulate_semester_crn, jobs, workers, seed, _batches("CRN", 0, num_iterations, store), store)
+
+    semester_results = {}
+    for mechanism, param in mechanisms:
+        key = mechanism + ": " + param
+        semester_results[key] = [result[key] for result in results]
+
+    return semester_results
+
+def evaluate_mechanisms(setting, num_iterations, num_assignments, student_args, mechanisms, score_args=(), workers=1, seed=None, common_random_numbers=False, store=None, warm_start=False, accelerate=False):
+    """
+    Simulates num_iterations semesters for each mechanism in a list of mechanisms (see run_semesters, or run_common_semesters in common random numbers mode),
+    and collects the results of each mechanism into a score_dict. This is the body of the compare_mechanisms function of every simulation script.
+
+    Parameters
+    ----------
+    setting : SimulationSetting object.
+              The simulation setting of the script.
+    num_iterations : int.
+                     The number of semesters to simulate.
+    num_assignments : int.
+                      The number of assignments to include in each simulated semester.
+    student_args : tuple.
+                   The arguments to setting.initialize_students that describe the population of students of each semester.
+    mechanisms : list of 2-tuples of strings.
+                 Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
+    score_args : tuple, optional.
+                 The arguments to setting.score_semester that precede the mechanism. The default is ().
+    workers : int, optional.
+              See run_jobs. The default is 1.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           See run_jobs. The default is None.
+    common_random_numbers : bool, optional.
+                            If True, each semester is graded once and scored with every mechanism (see score_common_semester). The default is False.
+    store : optional.
+            See run_jobs. The default is None.
+    warm_start : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms is warm-started (see mechanisms.registry.MechanismSettings). The default is False.
+    accelerate : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms uses SQUAREM extrapolation. The default is False.
+
+    Returns
+    -------
+    eval_dict : dict.
+                Maps the string "mechanism_name: mechanism_param" to a score_dict (see setting.summarize).
+                The score_dict of a parametric mechanism also has the key "EM Iterations", for the mean number of iterations per EM run in each semester.
+
+    """
+    setting = setting.with_em_options(warm_start, accelerate)
+    args = (setting, num_assignments, tuple(student_args), tuple(score_args))
+
+    if common_random_numbers:
+        semester_results = run_common_semesters(simulate_semester_crn, num_iterations, mechanisms, args, workers, seed, store)
+    else:
+        semester_results = run_semesters(simulate_semester, num_iterations, mechanisms, args, workers, seed, store)
+
+    eval_dict = {}
+    for key, results in semester_results.items():
+        score_dict = setting.summarize([value for value, iterations in results])
+
+        em_iterations = [iterations for value, iterations in results]
+        if any(iterations is not None for iterations in em_iterations):
+            score_dict["EM Iterations"] = em_iterations
+
+        eval_dict[key] = score_dict
+
+    return eval_dict
+
+class SimulationSetting:
+    """
+    The parts of a simulation setting that differ between the simulation scripts. The semesters themselves are simulated in the same way by every script (see simulate_semester).
+
+    Attributes
+    ----------
+    initialize_students : function.
+                          initialize_students(*student_args, rng=rng) returns the population of students for a semester (e.g. setup.initialize_student_list).
+    score_semester : function.
+                     score_semester(students, grader_dicts, *score_args, mechanism, mechanism_param, settings=settings, rng=rng) scores a graded semester according to a single mechanism
+                     and returns the value of the relevant evaluation metric(s) and the state of the mechanism at the end of the semester (see mechanisms.registry.run_mechanism).
+    summarize : function.
+                summarize(values) returns the score_dict for the list of evaluation metric(s) returned by score_semester (one per semester).
+    mechanism_settings : mechanisms.registry.MechanismSettings object.
+                         The settings that the mechanisms are run with.
+    continuous_effort : bool.
+                        Indicates whether the graders exert continuous effort (see grade_semester).
+    bias : bool.
+           Indicates whether the graders are biased (see grade_semester).
+    """
+
+    def __init__(self, initialize_students, score_semester, summarize, mechanism_settings, continuous_effort=True, bias=True):
+        """
+        Creates a SimulationSetting object. Every function must be defined at the top level of a module (or script), so that the setting can be sent to the worker processes.
+        """
+        self.initialize_students = initialize_students
+        self.score_semester = score_semester
+        self.summarize = summarize
+        self.mechanism_settings = mechanism_settings
+        self.continuous_effort = continuous_effort
+        self.bias = bias
+
+    def with_em_options(self, warm_start, accelerate):
+        """
+        Returns a copy of the setting whose parametric mechanisms run the EM procedure with the given options (see mechanisms.registry.MechanismSettings).
+        """
+        mechanism_settings = copy(self.mechanism_settings)
+        mechanism_settings.warm_start = warm_start
+        mechanism_settings.accelerate = accelerate
+
+        return SimulationSetting(self.initialize_students, self.score_semester, self.summarize, mechanism_settings, self.continuous_effort, self.bias)
+
+def em_iterations(state):
+    """
+    Returns the mean number of iterations per EM run of a semester, given the state of a mechanism at the end of the semester, or None if the mechanism did not run EM.
+    """
+    if isinstance(state, EMState) and state.iterations:
+        return state.mean_iterations()
+    return None
+
+def initialize_semester(setting, num_assignments, student_args, rng=None):
+    """
+    Creates the (shuffled) population of students and the submissions for each assignment of a semester.
+
+    Parameters
+    ----------
+    setting : SimulationSetting object.
+    num_assignments : int.
+                      The number of assignments to include in the semester.
+    student_args : tuple.
+                   The arguments to setting.initialize_students.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the students and the submissions. The default is None, which uses numpy's global random state.
+
+    Returns
+    -------
+    students : list of Student objects.
+    submission_lists : list of lists of Submission objects.
+                       The submissions for each assignment.
+
+    """
+    students = setting.initialize_students(*student_args, rng=rng)
+    shuffle_students(students, rng)
+    submission_lists = [initialize_submission_list(students, assignment, rng) for assignment in range(num_assignments)]
+
+    return students, submission_lists
+
+def simulate_semester(setting, num_assignments, student_args, score_args, mechanism, mechanism_param, rng=None):
+    """
+    Simulates a single "semester", scoring students according to a single mechanism, and returns the value of the relevant evaluation metric(s).
+
+    Parameters
+    ----------
+    setting : SimulationSetting object.
+    num_assignments : int.
+                      The number of assignments to include in the semester.
+    student_args : tuple.
+                   The arguments to setting.initialize_students.
+    score_args : tuple.
+                 The arguments to setting.score_semester that precede the mechanism.
+    mechanism : str.
+                The name of the mechanism to be used to score the students performance in the grading task.
+    mechanism_param : str.
+                      Denotes different versions of the same mechanism.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the semester (the students, the submissions, grading and the mechanism). The default is None, which uses numpy's global random state.
+
+    Returns
+    -------
+    value :
+            The evaluation metric(s) returned by setting.score_semester.
+    iterations : float or None.
+                 The mean number of iterations per EM run (see em_iterations).
+
+    """
+    students, submission_lists = initialize_semester(setting, num_assignments, student_args, rng)
+
+    grader_dicts = grade_semester(students, submission_lists, mechanism, mechanism_param, setting.continuous_effort, setting.bias, rng)
+
+    value, state = setting.score_semester(students, grader_dicts, *score_args, mechanism, mechanism_param, settings=setting.mechanism_settings, rng=rng)
+
+    return value, em_iterations(state)
+
+def simulate_semester_crn(setting, num_assignments, student_args, score_args, mechanisms, rng=None):
+    """
+    Simulates a single "semester" and scores it with every mechanism in a list of mechanisms (common random numbers mode, see score_common_semester).
+
+    Parameters
+    ----------
+    setting : SimulationSetting object.
+    num_assignments : int.
+                      The number of assignments to include in the semester.
+    student_args : tuple.
+                   The arguments to setting.initialize_students.
+    score_args : tuple.
+                 The arguments to setting.score_semester that precede the mechanism.
+    mechanisms : list of 2-tuples of strings.
+                 Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the semester (the students, the submissions, grading and the mechanisms). The default is None, which uses numpy's global random state.
+
+    Returns
+    -------
+    results : dict.
+              Maps the string "mechanism_name: mechanism_param" to the 2-tuple (value, iterations) (see simulate_semester).
+
+    """
+    students, submission_lists = initialize_semester(setting, num_assignments, student_args, rng)
+
+    return score_common_semester(students, submission_lists, mechanisms, setting, score_args, rng)
+
+def grader_assignment(mechanism, mechanism_param):
+    """
+    Identifies the assignment of graders that a mechanism is simulated with.
+    Clustered mechanisms (DMI) assign graders in clusters (of size mechanism_param); every other mechanism uses the same random regular assignment (4 graders per submission).
+
+    Parameters
+    ----------
+    mechanism : str.
+    mechanism_param : str.
+
+    Returns
+    -------
+    assignment : 2-tuple of strings.
+
+    """
+    if get_mechanism(mechanism).clustered:
+        return (mechanism, mechanism_param)
+    return ("REGULAR", "")
+
+def grade_semester(students, submission_lists, mechanism, mechanism_param, continuous_effort=True, bias=True, rng=None):
+    """
+    Simulates the grading of every assignment in a semester, using the assignment of graders required by a given mechanism (see grader_assignment).
+
+    Parameters
+    ----------
+    students : list of Student objects.
+               The population of students/graders.
+    submission_lists : list of lists of Submission objects.
+                       The submissions for each assignment.
+    mechanism : str.
+                The name of the mechanism that will be used to score the students.
+    mechanism_param : str.
+                      Denotes different versions of the same mechanism.
+    continuous_effort : bool, optional.
+                        Indicates whether the graders exert continuous effort (see grading.assign_grades). The default is True.
+    bias : bool, optional.
+           Indicates whether the graders are biased (see grading.assign_grades). The default is True.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the assignment of graders and the signals. The default is None, which uses a Generator seeded from numpy's global random state.
+
+    Returns
+    -------
+    grader_dicts : list of dicts.
+                   The grader_dict for each assignment.
+
+    """
+    grader_dicts = []
+
+    for assignment, submissions in enumerate(submission_lists):
+        if get_mechanism(mechanism).clustered:
+            cluster_size = int(mechanism_param)
+            grader_dict = assign_graders_dmi_clusters(students, submissions, cluster_size)
+        else:
+            grader_dict = assign_graders(students, submissions, 4, rng)
+        grading_dict = get_grading_dict(grader_dict)
+
+        #Here is where you can change the number of draws an active grader gets
+        assign_grades(grading_dict, 3, assignment, continuous_effort, bias, rng=rng)
+
+        grader_dicts.append(grader_dict)
+
+    return grader_dicts
+
+def score_common_semester(students, submission_lists, mechanisms, setting, score_args=(), rng=None):
+    """
+    Grades a simulated semester once for each assignment of graders needed by a list of mechanisms, and scores it with every mechanism.
+
+    All of the mechanisms see the same students and submissions, and mechanisms that use the same assignment of graders (see grader_assignment) also see the same reports.
+    Each additional assignment of graders grades its own copy of the (not yet graded) semester.
+    Payments are reset to 0 before each mechanism, which is the only state that the mechanisms change.
+
+    Parameters
+    ----------
+    students : list of Student objects.
+               The population of students, before grading.
+    submission_lists : list of lists of Submission objects.
+                       The submissions for each assignment, before grading.
+    mechanisms : list of 2-tuples of strings.
+                 Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
+    setting : SimulationSetting object.
+              Gives the effort model and bias of the graders, the settings of the mechanisms, and setting.score_semester, which applies a mechanism and returns the evaluation metric(s).
+    score_args : tuple, optional.
+                 The arguments to setting.score_semester that precede the mechanism. The default is ().
+    rng : numpy.random.Generator, optional.
+          Source of randomness for grading and for the mechanisms. The default is None, which leaves the choice to grade_semester and setting.score_semester.
+
+    Returns
+    -------
+    results : dict.
+              Maps "mechanism_name: mechanism_param" to the 2-tuple (value, iterations) of the evaluation metric(s) returned by setting.score_semester and the mean number of iterations per EM run (see em_iterations).
+
+    """
+    groups = {}
+    for mechanism, param in mechanisms:
+        groups.setdefault(grader_assignment(mechanism, param), []).append((mechanism, param))
+
+    semesters = [(students, submission_lists)]
+    for _ in range(len(groups) - 1):
+        semesters.append(deepcopy((students, submission_lists)))
+
+    results = {}
+
+    for (students, submission_lists), group in zip(semesters, groups.values()):
+        mechanism, param = group[0]
+        grader_dicts = grade_semester(students, submission_lists, mechanism, param, setting.continuous_effort, setting.bias, rng)
+
+        for mechanism, param in group:
+            for student in students:
+                student.payment = 0
+
+            value, state = setting.score_semester(students, grader_dicts, *score_args, mechanism, param, settings=setting.mechanism_settings, rng=rng)
+            results[mechanism + ": " + param] = (value, em_iterations(state))
+
+    return results
+
+def spawn_seeds(seed, n):
+    """
+    Splits a seed into n independent seeds, e.g. one for each setting in a sweep, so that every setting simulates different semesters.
+
+    Parameters
+    ----------
+    seed : int, numpy.random.SeedSequence, or None.
+    n : int.
+
+    Returns
+    -------
+    seeds : list of numpy.random.SeedSequence objects.
+
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return root.spawn(n)
+
+def parse_args(description=None):
+    """
+    Parses the command line options shared by the simulation scripts.
+
+        --workers N : number of worker processes (0 uses every available core; default 1).
+        --seed S : root seed for the experiment (default: fresh entropy).
+        --crn : common random numbers mode (grade each semester once and score it with every mechanism).
+        --warm-start : warm-start the EM procedure of the parametric mechanisms from the estimates for the previous assignment.
+        --accelerate : use SQUAREM extrapolation in the EM procedure of the parametric mechanisms.
+
+    Parameters
+    ----------
+    description : str, optional.
+                  Shown in the --help message. The default is None.
+
+    Returns
+    -------
+    args : argparse.Namespace.
+           args.workers is an int, or None for every available core. args.seed is an int or None. args.crn, args.warm_start and args.accelerate are bools.
+
+    """
+    parser = ArgumentParser(description=description)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (0 uses every available core)")
+    parser.add_argument("--seed", type=int, default=None, help="root seed for the experiment")
+    parser.add_argument("--crn", action="store_true", help="grade each semester once and score it with every mechanism (common random numbers)")
+    parser.add_argument("--warm-start", action="store_true", help="warm-start the EM procedure of the parametric mechanisms from the previous assignment")
+    parser.add_argument("--accelerate", action="store_true", help="use SQUAREM extrapolation in the EM procedure of the parametric mechanisms")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        args.workers = None
+
+    return args
@@ -0,0 +1,28 @@
+"""
+The fallback source of randomness for the functions that take an optional numpy.random.Generator (rng=None).
+
+The experiments pass a Generator explicitly everywhere (see runner.py). A function that is called without one gets a Generator seeded from numpy's global random state,
+so that seeding the global state (np.random.seed) still makes the results of a standalone call reproducible.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import numpy as np
+
+def as_generator(rng=None):
+    """
+    Returns rng itself, or, if rng is None, a new Generator seeded from numpy's global random state.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator or None, optional.
+          The default is None.
+
+    Returns
+    -------
+    rng : numpy.random.Generator.
+
+    """
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(2**32, dtype=np.int64))
+    return rng
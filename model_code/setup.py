@@ -8,7 +8,7 @@ from classes import Student, Submission, StrategicStudent
 
 from random import shuffle
 
-def initialize_student_list(num_students, num_active):
+def initialize_student_list(num_students, num_active, rng=None):
     """
     Create a list of Student objects, with a specified number of active graders.
     
@@ -20,6 +20,8 @@ def initialize_student_list(num_students, num_active):
                    Number of Student objects to create.
     num_active : int 
                  Number of Students who should have type="active".
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the Students' parameters. The default is None, which uses numpy's global random state.
 
     Returns
     -------
@@ -27,12 +29,12 @@ def initialize_student_list(num_students, num_active):
 
     """
     num_passive = num_students - num_active
-    active_list = [Student(i, "active") for i in range(num_active)]
-    passive_list = [Student(i + num_active, "passive") for i in range(num_passive)]
+    active_list = [Student(i, "active", rng) for i in range(num_active)]
+    passive_list = [Student(i + num_active, "passive", rng) for i in range(num_passive)]
     student_list = active_list + passive_list
     return student_list
 
-def initialize_strategic_student_list(strategy_map):
+def initialize_strategic_student_list(strategy_map, rng=None):
     """
     Creates a list of StrategicStudent objects, according to a given description of which strategies should be included in the population and how many agents should adopt each such strategy. 
 
@@ -51,6 +53,8 @@ def initialize_strategic_student_list(strategy_map):
                             "ALL10": 0,
                             "HEDGE": 0
                         }
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the StrategicStudents' parameters. The default is None, which uses numpy's global random state.
 
     Returns
     -------
@@ -61,30 +65,35 @@ def initialize_strategic_student_list(strategy_map):
     i = 0
     for strat, num in strategy_map.items():
         for _ in range(num):
-            s = StrategicStudent(i, strat)
+            s = StrategicStudent(i, strat, rng)
             student_list.append(s)
             i += 1
     return student_list
 
-def shuffle_students(student_list):
+def shuffle_students(student_list, rng=None):
     """
     Removes the structure from an existing list of Student objects by shuffling and then re-numbering accordingly.
 
     Parameters
     ----------
     student_list : list of Student objects.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the shuffle. The default is None, which uses the global state of the random module.
 
     Returns
     -------
     None.
 
     """
-    shuffle(student_list)
+    if rng is None:
+        shuffle(student_list)
+    else:
+        student_list[:] = [student_list[i] for i in rng.permutation(len(student_list))]
     for i in range(len(student_list)):
         student = student_list[i]
         student.id = i
         
-def initialize_submission_list(student_list, assignment_number):
+def initialize_submission_list(student_list, assignment_number, rng=None):
     """
     Creates a Submission object for each Student in student_list for the given assignment.
 
@@ -93,13 +102,15 @@ def initialize_submission_list(student_list, assignment_number):
     student_list : list of Student objects.
     assignment_number : int.
                         Unique identifier for a specific assignment.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the ground truth scores. The default is None, which uses numpy's global random state.
 
     Returns
     -------
     submission_list : list of Submission objects.
 
     """
-    submission_list = [Submission(student.id, assignment_number) for student in student_list]
+    submission_list = [Submission(student.id, assignment_number, rng) for student in student_list]
     return submission_list
     
         
@@ -4,37 +4,39 @@ Script for running simulations in the continuous effort, biased agents setting.
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from numpy import ones
 import json
 
-from setup import initialize_student_list, shuffle_students, initialize_submission_list
-from grading import assign_grades, assign_graders, get_grading_dict
-from grading_dmi import assign_graders_dmi_clusters
+from setup import initialize_student_list
 
-from mechanisms.baselines import mean_squared_error
-from mechanisms.dmi import dmi_mechanism
-from mechanisms.phi_divergence_pairing import phi_divergence_pairing_mechanism, parametric_phi_divergence_pairing_mechanism
-from mechanisms.output_agreement import oa_mechanism
-from mechanisms.parametric_mse import mse_p_mechanism
-from mechanisms.peer_truth_serum import pts_mechanism
+from mechanisms.registry import MechanismSettings, run_mechanism
 
 from evaluation import kendall_tau
-from graphing import plot_kendall_tau
+from result_store import ResultStore
+from runner import SimulationSetting, evaluate_mechanisms, parse_args, spawn_seeds
 
 import warnings
 
-def run_simulation(num_iterations, num_assignments, num_students, mechanism, mechanism_param):
+"""
+The parameters of the normal approximation of the distribution of true grades used by the parametric mechanisms, and whether they estimate and correct for bias in this setting.
+"""
+MECHANISM_SETTINGS = MechanismSettings(mu=7, gamma=1/2.1, bias=True, bias_correct=True, pairing_bias_correct=True)
+
+"""
+The effort model of the graders (continuous or binary) and whether they are biased in this setting (see runner.grade_semester).
+"""
+CONTINUOUS_EFFORT = True
+BIAS = True
+
+def score_semester(students, grader_dicts, mechanism, mechanism_param, settings=MECHANISM_SETTINGS, rng=None):
     """
-    Iteratively simulates semesters, scoring students according to a single mechanism, and recording the values of the relevant evaluation metrics.
+    Scores the students in a graded semester according to a single mechanism, and returns the value of the relevant evaluation metric(s).
 
     Parameters
     ----------
-    num_iterations : int.
-                     The number of semesters to simulate.
-    num_assignments : int.
-                      The number of assignments to include in each simulated semester.
-    num_students : int.
-                   The size of the student population that should be created for each semester.
+    students : list of Student objects.
+               The population of students/graders.
+    grader_dicts : list of dicts.
+                   The grader_dict for each assignment (returned by runner.grade_semester).
     mechanism : str.
                 The name of the mechanism to be used to score the students performance in the grading task.
                 One of the following:
@@ -48,94 +50,54 @@ def run_simulation(num_iterations, num_assignments, num_students, mechanism, mec
     mechanism_param : str.
                       Denotes different versions of the same mechanism, e.g. the choice of Phi-divergence used in the Phi-divergence pairing mechanism.
                       "0" for mechanisms that do not require such a parameter.
+    settings : MechanismSettings object, optional.
+               The settings that the mechanism is run with (see runner.SimulationSetting). The default is MECHANISM_SETTINGS.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the mechanism. The default is None, which uses numpy's global random state.
+
+    Returns
+    -------
+    kt : float.
+         The Kendall tau score for the semester.
+    state :
+            The state of the mechanism at the end of the semester (see mechanisms.registry.run_mechanism).
+    """
+    state = run_mechanism(mechanism, mechanism_param, grader_dicts, settings, rng)
+    
+    kt = kendall_tau(students)
+    
+    return kt, state
+
+def summarize(kt_scores):
+    """
+    Collects the evaluation metrics for a list of simulated semesters into a score_dict.
+
+    Parameters
+    ----------
+    kt_scores : list of floats.
+                The Kendall tau score for each semester.
 
     Returns
     -------
     score_dict : dict.
-                score_dict maps the names of evaluation metrics to scores for those metrics.
+                 score_dict maps the names of evaluation metrics to scores for those metrics.
                  { 
                      "Tau Scores": [ score (float)],
                 }
     """
     score_dict = {}
-    kt_scores = []
-    
-    print("    ", mechanism, mechanism_param)
-    
-    for i in range(num_iterations):
-        """
-        Simulating a "semester"
-        """
-        students = initialize_student_list(num_students, num_students)
-        shuffle_students(students)
-        
-        #necessary for PTS
-        H = ones(11)
-            
-        for assignment in range(num_assignments):
-            """
-            Simulating a single assignment
-            """
-            submissions = initialize_submission_list(students, assignment)
-            if mechanism == "DMI":
-                cluster_size = int(mechanism_param)
-                grader_dict = assign_graders_dmi_clusters(students, submissions, cluster_size)
-            else:
-                grader_dict = assign_graders(students, submissions, 4)
-            grading_dict = get_grading_dict(grader_dict)
-            
-            #Here is where you can change the number of draws an active grader gets
-            assign_grades(grading_dict, 3, assignment, True, True)
-            
-            """
-            Non-Parametric Mechanisms
-            """
-                
-            if mechanism == "BASELINE":
-                mean_squared_error(grader_dict)
-                    
-            elif mechanism == "DMI":
-                cluster_size = int(mechanism_param)
-                dmi_mechanism(grader_dict, assignment, cluster_size)
-                    
-            elif mechanism == "OA":
-                oa_mechanism(grader_dict)
-                    
-            elif mechanism == "Phi-DIV":
-                phi_divergence_pairing_mechanism(grader_dict, mechanism_param)
-                
-            elif mechanism == "PTS":
-                H = pts_mechanism(grader_dict, H)
-                
-                """
-            Parametric Mechanisms
-            """
-            
-            elif mechanism == "MSE_P":
-                mu = 7
-                gamma = 1/2.1
-                
-                mse_p_mechanism(grader_dict, students, assignment, mu, gamma, True, True)
-                
-            elif mechanism == "Phi-DIV_P":
-                mu = 7
-                gamma = 1/2.1
-                
-                parametric_phi_divergence_pairing_mechanism(grader_dict, students, assignment, mu, gamma, True, mechanism_param)
-                
-            else:
-                print("Error: The given mechanism name does not match any of the options.")
-    
-        kt = kendall_tau(students)
-        kt_scores.append(kt)
-        
     score_dict["Tau Scores"] = kt_scores
     
     return score_dict
 
-def compare_mechanisms(num_iterations, num_assignments, num_students, mechanisms):
+"""
+The simulation setting (see runner.SimulationSetting): how the students are created, how the graders behave, and how each semester is scored and summarized.
+"""
+SETTING = SimulationSetting(initialize_student_list, score_semester, summarize, MECHANISM_SETTINGS, CONTINUOUS_EFFORT, BIAS)
+
+def compare_mechanisms(num_iterations, num_assignments, num_students, mechanisms, workers=1, seed=None, common_random_numbers=False, store=None, warm_start=False, accelerate=False):
     """
-    Iterates over a list of mechanisms, calling run_simulation for each one.
+    Simulates num_iterations semesters for each mechanism in a list of mechanisms, fanning the semesters out over worker processes (see runner.py).
 
     Parameters
     ----------
@@ -148,30 +110,38 @@ def compare_mechanisms(num_iterations, num_assignments, num_students, mechanisms
     mechanisms : list of 2-tuples of strings. 
                  Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
                  The complete list of possible mechanisms and associated params can be found below in the code for running simulations.
+    workers : int, optional.
+              The number of worker processes (None uses every available core). The default is 1.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           The root seed for the simulated semesters. The default is None.
+    common_random_numbers : bool, optional.
+                            If True, each semester is graded once and scored with every mechanism (see runner.score_common_semester). The default is False.
+    store : result_store.PointStore object, optional.
+            Saves the results of each batch of semesters as it is completed and skips the batches that are already in the store (see runner.run_jobs). The default is None.
+    warm_start : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms is warm-started from the estimates for the previous assignment (see runner.evaluate_mechanisms). The default is False.
+    accelerate : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms uses SQUAREM extrapolation. The default is False.
 
     Returns
     -------
     eval_dict : dict.
-                Maps the string "mechanism_name: mechanism_param" to a score_dict (returned from the call to run_simulation).
+                Maps the string "mechanism_name: mechanism_param" to a score_dict (see summarize).
 
     """
-    eval_dict = {}
-    
     for mechanism, param in mechanisms:
-        
-        score_dict = run_simulation(num_iterations, num_assignments, num_students, mechanism, param)
-        
-        key = mechanism + ": " + param 
-        eval_dict[key] = score_dict
+        print("    ", mechanism, param)
     
-    return eval_dict
+    return evaluate_mechanisms(SETTING, num_iterations, num_assignments, (num_students, num_students), mechanisms, (), workers, seed, common_random_numbers, store, warm_start, accelerate)
 
-def simulate(mechanisms, filename):
+def simulate(mechanisms, filename, workers=1, seed=None, common_random_numbers=False, warm_start=False, accelerate=False):
     """
     Calls compare_mechanisms iteratively, varying the number of active graders from 10 to 90.
     
     Saves a file containing the results of the experiment and generates and saves a plot of those results.
     Results are saved as filename.json in the ./results directory.
+    The results of each batch of semesters are saved to filename.jobs.jsonl in the ./results directory as they come in (see result_store.py),
+    so an interrupted experiment resumes where it stopped when it is run again with the same arguments.
     Plots are saved as filename.pdf in the ./figures directory.
 
     Parameters
@@ -181,6 +151,16 @@ def simulate(mechanisms, filename):
                  The complete list of possible mechanisms and associated params can be found below in the code for running simulations.
     filename : str.
                The filename used to save the .json file and .pdf plot associated with the experiment.
+    workers : int, optional.
+              The number of worker processes (None uses every available core). The default is 1.
+    seed : int or None, optional.
+           The root seed for the experiment. The default is None.
+    common_random_numbers : bool, optional.
+                            See compare_mechanisms. The default is False.
+    warm_start : bool, optional.
+                 See compare_mechanisms. The default is False.
+    accelerate : bool, optional.
+                 See compare_mechanisms. The default is False.
 
     Returns
     -------
@@ -188,11 +168,16 @@ def simulate(mechanisms, filename):
 
     """
     results = {}
+    
+    store = ResultStore("results/" + filename + ".jobs.jsonl", ("simulate", mechanisms, common_random_numbers, warm_start, accelerate))
+    seed = store.root_seed(seed)
+    
+    seeds = spawn_seeds(seed, 15)
 
     for num_assignments in range(1, 16):
         print("Working on simulations for", num_assignments, "assignments.")
         
-        evals = compare_mechanisms(100, num_assignments, 100, mechanisms)
+        evals = compare_mechanisms(100, num_assignments, 100, mechanisms, workers, seeds[num_assignments - 1], common_random_numbers, store.point((100, num_assignments, 100), seeds[num_assignments - 1]), warm_start, accelerate)
         results[num_assignments] = evals
         
     json_file = "results/" + filename + ".json"
@@ -207,6 +192,7 @@ def simulate(mechanisms, filename):
     """
     Graphing the results in the figures directory
     """
+    from graphing import plot_kendall_tau
     plot_kendall_tau(results, filename)
 
 if __name__ == "__main__":
@@ -215,6 +201,9 @@ if __name__ == "__main__":
     Simulations are controlled and run from here.
     """
     
+    #Number of worker processes and root seed, e.g. --workers 8 --seed 0
+    args = parse_args(__doc__)
+    
     #Supress Warnings in console
     warnings.filterwarnings("ignore")
     
@@ -252,4 +241,4 @@ if __name__ == "__main__":
     """
     The function below runs the experiment.
     """
-    simulate(mechanisms, filename)
+    simulate(mechanisms, filename, args.workers, args.seed, args.crn, args.warm_start, args.accelerate)
\ No newline at end of file
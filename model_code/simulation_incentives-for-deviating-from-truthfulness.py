@@ -4,39 +4,45 @@ Script for running simulations to examine the potential for one agent to gain by
 @author: Noah Burrell <burrelln@umich.edu>
 """
 
-from numpy import ones
+from numpy.random import default_rng
 from statistics import mean, median, variance
 import json
-from random import randint, seed
-from sys import maxsize
 
-from setup import initialize_strategic_student_list, shuffle_students, initialize_submission_list
-from grading import assign_grades, assign_graders, get_grading_dict
-from grading_dmi import assign_graders_dmi_clusters
+from setup import initialize_strategic_student_list
+from grading import get_grading_dict
 
-from mechanisms.baselines import mean_squared_error
-from mechanisms.dmi import dmi_mechanism
-from mechanisms.phi_divergence_pairing import phi_divergence_pairing_mechanism, parametric_phi_divergence_pairing_mechanism
-from mechanisms.output_agreement import oa_mechanism
-from mechanisms.parametric_mse import mse_p_mechanism
-from mechanisms.peer_truth_serum import pts_mechanism
+from mechanisms.registry import MechanismSettings, run_mechanism
 
-from graphing import plot_mean_rank_changes, plot_variance_rank_changes
+from result_store import ResultStore
+from runner import SimulationSetting, evaluate_mechanisms, parse_args, spawn_seeds
+from seeding import as_generator
 
 import warnings
 
-def run_simulation(num_semesters, num_assignments, strategy_map, strat, mechanism, mechanism_param): 
+"""
+The parameters of the normal approximation of the distribution of true grades used by the parametric mechanisms, and whether they estimate and correct for bias in this setting.
+"""
+MECHANISM_SETTINGS = MechanismSettings(mu=7, gamma=1/2.1, bias=True, bias_correct=False, pairing_bias_correct=False)
+
+"""
+The effort model of the graders (continuous or binary) and whether they are biased in this setting (see runner.grade_semester).
+"""
+CONTINUOUS_EFFORT = True
+BIAS = True
+
+def score_semester(students, grader_dicts, strat, mechanism, mechanism_param, settings=MECHANISM_SETTINGS, rng=None):
     """
-    Iteratively simulates semesters, scoring students according to a single mechanism, and recording the values of the relevant evaluation metrics.
+    Scores the students in a graded semester according to a single mechanism twice, once with a truthful agent and once with that agent deviating to a strategy.
+    Returns the gain in rank from deviating.
+    
+    The deviator's truthful reports are restored afterwards, so the graded semester can be scored again with another mechanism.
 
     Parameters
     ----------
-    num_semesters : int.
-                     The number of semesters to simulate.
-    num_assignments : int.
-                      The number of assignments to include in each simulated semester.
-    strategy_map: dict.
-                  Maps the name of a strategy to a number of students who should adopt that strategy in each simulated semester.
+    students : list of Student objects.
+               The population of students/graders.
+    grader_dicts : list of dicts.
+                   The grader_dict for each assignment (returned by runner.grade_semester).
     strat: str.
            The name of the strategy that the deviator will adopt.
     mechanism : str.
@@ -52,184 +58,137 @@ def run_simulation(num_semesters, num_assignments, strategy_map, strat, mechanis
     mechanism_param : str.
                       Denotes different versions of the same mechanism, e.g. the choice phi divergence used in the phi divergence pairing mechanism.
                       "0" for mechanisms that do not require such a parameter.
+    settings : MechanismSettings object, optional.
+               The settings that the mechanism is run with (see runner.SimulationSetting). The default is MECHANISM_SETTINGS.
+    rng : numpy.random.Generator, optional.
+          Source of randomness for the mechanism and the deviator's strategic reports. The default is None, which uses numpy's global random state.
+          Both scorings use the same randomness in the mechanism, so the gain in rank only reflects the deviation.
 
     Returns
     -------
-    score_dict : dict.
-                score_dict maps the names of evaluation metrics to scores for those metrics.
-                 { 
-                    "Mean Gain": mean_gain (float),
-                    "Median Gain": median_gain (float),
-                    "Variance Gain": variance_gain (float)
-                }
+    deviator_gain : int.
+                    The rank of the deviator when truthful minus the rank of the deviator when deviating.
+    state :
+            The state of the mechanism at the end of the truthful semester (see mechanisms.registry.run_mechanism).
     """
-    score_dict = {}
-    
-    deviator_gains = []
     avg_truthful_payments = []
     avg_strategic_payments = []
     
-    print("        ", mechanism, mechanism_param)
+    """
+    Select a deviator.
+    """
+    
+    found_deviator = False
     
-    for _ in range(num_semesters):
-        """
-        Simulating a "semester"
-        """
-        students = initialize_strategic_student_list(strategy_map)
-        shuffle_students(students)
-        submission_lists = [initialize_submission_list(students, i) for i in range(num_assignments)]
-        
-        """
-        Select a deviator.
-        """
+    i = 0
+    while((i < len(students)) and (not found_deviator)):
+        s = students[i]
+        if s.strategy == "TRUTH":
+            deviator = s
+            found_deviator = True
+        i += 1
         
-        found_deviator = False
+    grading_dicts = [get_grading_dict(grader_dict) for grader_dict in grader_dicts]
+    
+    deviator_ranks = []
+    states = []
+    truthful_reports = []
+    
+    rng = as_generator(rng)
+    mechanism_seed, report_seed = rng.integers(2**63, size=2)
         
-        i = 0
-        while((i < len(students)) and (not found_deviator)):
-            s = students[i]
-            if s.strategy == "TRUTH":
-                deviator = s
-                found_deviator = True
-            i += 1
-            
-        grader_dicts = []
-        grading_dicts = []
-            
-        for assignment in range(len(submission_lists)):
+    for iteration in range(2):
+        mechanism_rng = default_rng(mechanism_seed)
+        if iteration == 1:
             """
-            Simulating a grading a single assignment
+            Change deviator reports to strategic reports for every submission on every assignment
             """
-            submissions = submission_lists[assignment]
-            
-            if mechanism == "DMI":
-                cluster_size = int(mechanism_param)
-                grader_dict = assign_graders_dmi_clusters(students, submissions, cluster_size)
-            
-            else:
-                grader_dict = assign_graders(students, submissions, 4)
-            
-            grading_dict = get_grading_dict(grader_dict)
-            
-            #Here is where you can change the number of draws an active grader gets
-            assign_grades(grading_dict, 3, assignment, True, True)
-            
-            grader_dicts.append(grader_dict)
-            grading_dicts.append(grading_dict)
-        
-        deviator_ranks = []
-        random_seed = randint(~maxsize, maxsize)
+            deviator.strategy = strat
+            report_rng = default_rng(report_seed)
             
-        for iteration in range(2):
-            seed(random_seed)
-            if iteration == 1:
-                """
-                Change deviator reports to strategic reports for every submission on every assignment
-                """
-                deviator.strategy = strat
-                
-                for assignment_num in range(len(grading_dicts)):
-                    grading_dict = grading_dicts[assignment_num]
-                    
-                    deviator_submissions = grading_dict[deviator]
-                    
-                    for submission in deviator_submissions:
-                        signal = deviator.grades[assignment_num][submission.student_id]
-                        grade = deviator.report(signal)
-                    
-                        deviator.grades[assignment_num][submission.student_id] = grade
-                        submission.grades[deviator.id] = grade
+            for assignment_num in range(len(grading_dicts)):
+                grading_dict = grading_dicts[assignment_num]
                 
-            #necessary for PTS
-            H = ones(11)
-            
-            for assignment in range(len(submission_lists)):
-                """
-                Run the Mechanism
-                """
-                grader_dict = grader_dicts[assignment]
-                grading_dict = grading_dicts[assignment]
+                deviator_submissions = grading_dict[deviator]
                 
-                """
-                Non-Parametric Mechanisms
-                """
-                    
-                if mechanism == "BASELINE":
-                    mean_squared_error(grader_dict)
-                        
-                elif mechanism == "DMI":
-                    cluster_size = int(mechanism_param)
-                    dmi_mechanism(grader_dict, assignment, cluster_size)
-                        
-                elif mechanism == "OA":
-                    oa_mechanism(grader_dict)
-                        
-                elif mechanism == "Phi-DIV":
-                    phi_divergence_pairing_mechanism(grader_dict, mechanism_param)
-                    
-                elif mechanism == "PTS":
-                    H = pts_mechanism(grader_dict, H)
+                for submission in deviator_submissions:
+                    signal = deviator.grades[assignment_num][submission.student_id]
+                    grade = deviator.report(signal, rng=report_rng)
                     
-                    """
-                Parametric Mechanisms
-                """
+                    truthful_reports.append((assignment_num, submission, signal))
                 
-                elif mechanism == "MSE_P":
-                    mu = 7
-                    gamma = 1/2.1
-                    
-                    mse_p_mechanism(grader_dict, students, assignment, mu, gamma, True, False)
-                    
-                elif mechanism == "Phi-DIV_P":
-                    mu = 7
-                    gamma = 1/2.1
-                    
-                    parametric_phi_divergence_pairing_mechanism(grader_dict, students, assignment, mu, gamma, False, mechanism_param)
-                    
-                else:
-                    print("Error: The given mechanism name does not match any of the options.")
+                    deviator.grades[assignment_num][submission.student_id] = grade
+                    submission.grades[deviator.id] = grade
             
+        states.append(run_mechanism(mechanism, mechanism_param, grader_dicts, settings, mechanism_rng))
+        
+        '''
+        Calculate the rank of the deviator (according to the number of payments that are >= than hers)
+        '''
+        val = deviator.payment
+        rank = 0
+        for student in students:
+            if student.payment >= val:
+                rank += 1
+        deviator_ranks.append(rank)
+        
+        if iteration == 0:
             '''
-            Calculate the rank of the deviator (according to the number of payments that are >= than hers)
+            Calculate the average payments for the truthful and strategic agents
             '''
-            val = deviator.payment
-            rank = 0
+            truthful_payments = []
+            strategic_payments = []
             for student in students:
-                if student.payment >= val:
-                    rank += 1
-            deviator_ranks.append(rank)
+                pay = student.payment
+                if student.strategy == "TRUTH":
+                    truthful_payments.append(pay)
+                else:
+                    strategic_payments.append(pay)
+            avg_truthful_payment = mean(truthful_payments)
+            avg_strategic_payment = mean(strategic_payments)
+            avg_truthful_payments.append(avg_truthful_payment)
+            avg_strategic_payments.append(avg_strategic_payment)
             
-            if iteration == 0:
-                '''
-                Calculate the average payments for the truthful and strategic agents
-                '''
-                truthful_payments = []
-                strategic_payments = []
-                for student in students:
-                    pay = student.payment
-                    if student.strategy == "TRUTH":
-                        truthful_payments.append(pay)
-                    else:
-                        strategic_payments.append(pay)
-                avg_truthful_payment = mean(truthful_payments)
-                avg_strategic_payment = mean(strategic_payments)
-                avg_truthful_payments.append(avg_truthful_payment)
-                avg_strategic_payments.append(avg_strategic_payment)
+            '''
+            Reset the payments for all students.
+            '''
+            for student in students:
+                student.payment = 0
                 
-                '''
-                Reset the payments for all students.
-                '''
-                for student in students:
-                    student.payment = 0
-                    
-        '''
-        Reseed the randomness for initializing next semester
-        '''        
-        seed()
-              
-        deviator_gain = deviator_ranks[0] - deviator_ranks[1]
-        deviator_gains.append(deviator_gain)
-        
+    '''
+    Restore the deviator's truthful reports
+    '''
+    deviator.strategy = "TRUTH"
+    
+    for assignment_num, submission, signal in truthful_reports:
+        deviator.grades[assignment_num][submission.student_id] = signal
+        submission.grades[deviator.id] = signal
+          
+    deviator_gain = deviator_ranks[0] - deviator_ranks[1]
+    
+    return deviator_gain, states[0]
+
+def summarize(deviator_gains):
+    """
+    Collects the evaluation metrics for a list of simulated semesters into a score_dict.
+
+    Parameters
+    ----------
+    deviator_gains : list of ints.
+                     The gain in rank from deviating for each semester.
+
+    Returns
+    -------
+    score_dict : dict.
+                 score_dict maps the names of evaluation metrics to scores for those metrics.
+                 { 
+                    "Mean Gain": mean_gain (float),
+                    "Median Gain": median_gain (float),
+                    "Variance Gain": variance_gain (float)
+                }
+    """
+    score_dict = {}
+    
     mean_gain = mean(deviator_gains)
     score_dict["Mean Gain"] = mean_gain
     
@@ -241,10 +200,14 @@ def run_simulation(num_semesters, num_assignments, strategy_map, strat, mechanis
     
     return score_dict
 
+"""
+The simulation setting (see runner.SimulationSetting): how the students are created, how the graders behave, and how each semester is scored and summarized.
+"""
+SETTING = SimulationSetting(initialize_strategic_student_list, score_semester, summarize, MECHANISM_SETTINGS, CONTINUOUS_EFFORT, BIAS)
 
-def compare_mechanisms(num_semesters, num_assignments, strategy_map, strategy, mechanisms):
+def compare_mechanisms(num_semesters, num_assignments, strategy_map, strategy, mechanisms, workers=1, seed=None, common_random_numbers=False, store=None, warm_start=False, accelerate=False):
     """
-    Iterates over a list of mechanisms, calling run_simulation for each one.
+    Simulates num_semesters semesters for each mechanism in a list of mechanisms, fanning the semesters out over worker processes (see runner.py).
 
     Parameters
     ----------
@@ -259,30 +222,38 @@ def compare_mechanisms(num_semesters, num_assignments, strategy_map, strategy, m
     mechanisms : list of 2-tuples of strings. 
                  Describes the mechanisms to be included in the form ("mechanism_name", "mechanism_param").
                  The complete list of possible mechanisms and associated params can be found below in the code for running simulations.
+    workers : int, optional.
+              The number of worker processes (None uses every available core). The default is 1.
+    seed : int, numpy.random.SeedSequence, or None, optional.
+           The root seed for the simulated semesters. The default is None.
+    common_random_numbers : bool, optional.
+                            If True, each semester is graded once and scored with every mechanism (see runner.score_common_semester). The default is False.
+    store : result_store.PointStore object, optional.
+            Saves the results of each batch of semesters as it is completed and skips the batches that are already in the store (see runner.run_jobs). The default is None.
+    warm_start : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms is warm-started from the estimates for the previous assignment (see runner.evaluate_mechanisms). The default is False.
+    accelerate : bool, optional.
+                 Indicates whether the EM procedure of the parametric mechanisms uses SQUAREM extrapolation. The default is False.
 
     Returns
     -------
     eval_dict : dict.
-                Maps the string "mechanism_name: mechanism_param" to a score_dict (returned from the call to run_simulation).
+                Maps the string "mechanism_name: mechanism_param" to a score_dict (see summarize).
 
     """
-    eval_dict = {}
-    
     for mechanism, param in mechanisms:
-        
-        score_dict = run_simulation(num_semesters, num_assignments, strategy_map, strategy, mechanism, param)
-        
-        key = mechanism + ": " + param 
-        eval_dict[key] = score_dict
+        print("        ", mechanism, param)
     
-    return eval_dict
+    return evaluate_mechanisms(SETTING, num_semesters, num_assignments, (strategy_map,), mechanisms, (strategy,), workers, seed, common_random_numbers, store, warm_start, accelerate)
 
-def simulate(strategies, mechanisms, filename):
+def simulate(strategies, mechanisms, filename, workers=1, seed=None, common_random_numbers=False, warm_start=False, accelerate=False):
     """
     Calls compare_mechanisms iteravely for each strategy, varying the number of strategic graders.
     
     Saves a file containing the results of the experiment and generates and saves a plot of those results.
     Results are saved as filename.json in the ./results directory.
+    The results of each batch of semesters are saved to filename.jobs.jsonl in the ./results directory as they come in (see result_store.py),
+    so an interrupted experiment resumes where it stopped when it is run again with the same arguments.
     Plots are saved as filename-mean_gain-*MECHANISM*.pdf and filename-variance_gain-*MECHANISM*.pdf in the ./figures directory.
 
     Parameters
@@ -295,6 +266,16 @@ def simulate(strategies, mechanisms, filename):
                  The complete list of possible mechanisms and associated params can be found below in the code for running simulations.
     filename : str.
                The filename used to save the .json file and .pdf plot associated with the experiment.
+    workers : int, optional.
+              The number of worker processes (None uses every available core). The default is 1.
+    seed : int or None, optional.
+           The root seed for the experiment. The default is None.
+    common_random_numbers : bool, optional.
+                            See compare_mechanisms. The default is False.
+    warm_start : bool, optional.
+                 See compare_mechanisms. The default is False.
+    accelerate : bool, optional.
+                 See compare_mechanisms. The default is False.
 
     Returns
     -------
@@ -303,18 +284,26 @@ def simulate(strategies, mechanisms, filename):
     """
     results = {}
     
-    for strategy in strategies:
+    store = ResultStore("results/" + filename + ".jobs.jsonl", ("simulate", mechanisms, common_random_numbers, warm_start, accelerate))
+    seed = store.root_seed(seed)
+    
+    strategy_seeds = spawn_seeds(seed, len(strategies))
+    
+    for strategy, strategy_seed in zip(strategies, strategy_seeds):
         result = {}
         print("Working on simulations for the following strategy:", strategy)
         
-        for strat in [10, 20, 30, 40, 50, 60, 70, 80, 90]:
+        strat_counts = [10, 20, 30, 40, 50, 60, 70, 80, 90]
+        strat_seeds = spawn_seeds(strategy_seed, len(strat_counts))
+        
+        for strat, strat_seed in zip(strat_counts, strat_seeds):
             strategy_map = {}
             print("    Working on simulations for", strat, "strategic students.")
         
             strategy_map[strategy] = strat
             strategy_map["TRUTH"] = 100 - strat
         
-            evals = compare_mechanisms(100, 10, strategy_map, strategy, mechanisms)
+            evals = compare_mechanisms(100, 10, strategy_map, strategy, mechanisms, workers, strat_seed, common_random_numbers, store.point((100, 10, strategy_map, strategy), strat_seed), warm_start, accelerate)
             result[strat] = evals
         
         results[strategy] = result
@@ -331,6 +320,7 @@ def simulate(strategies, mechanisms, filename):
     """
     Graphing the results in the figures directory
     """
+    from graphing import plot_mean_rank_changes, plot_variance_rank_changes
     mean_gain_filename = filename + "-mean_gain"
     plot_mean_rank_changes(results, mean_gain_filename)
     
@@ -343,6 +333,9 @@ if __name__ == "__main__":
     Simulations are controlled and run from here.
     """
     
+    #Number of worker processes and root seed, e.g. --workers 8 --seed 0
+    args = parse_args(__doc__)
+    
     #Supress Warnings in console
     warnings.filterwarnings("ignore")
     
@@ -394,4 +387,4 @@ if __name__ == "__main__":
     """
     The function below runs the experiment.
     """
-    simulate(strategies, mechanisms, filename)
\ No newline at end of file
+    simulate(strategies, mechanisms, filename, args.workers, args.seed, args.crn, args.warm_start, args.accelerate)
\ No newline at end of file
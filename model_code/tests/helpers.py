@@ -0,0 +1,80 @@
+"""
+Simulated assignments shared by the tests of the mechanisms, and synthetic grading data shared by the tests of the real-data loader.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from setup import initialize_student_list, initialize_submission_list
+from runner import grade_semester
+from reports import AssignmentReports
+
+def graded_assignment(mechanism, param="", num_students=40, seed=0):
+    """
+    Simulates one graded assignment (continuous effort, biased graders) with the assignment of graders used by a mechanism.
+
+    Returns
+    -------
+    students : list of Student objects.
+    grader_dict : dict.
+                  Maps a Submission object to a list of graders (Student objects).
+    reports : AssignmentReports object.
+    """
+    rng = np.random.default_rng(seed)
+    students = initialize_student_list(num_students, num_students, rng)
+    submissions = initialize_submission_list(students, 0, rng)
+    grader_dict, = grade_semester(students, [submissions], mechanism, param, True, True, rng)
+
+    return students, grader_dict, AssignmentReports.from_grader_dict(grader_dict)
+
+def student_payments(students, reports):
+    """
+    Returns the payments of the students, aligned with the rows of reports.
+    """
+    by_id = {student.id: student.payment for student in students}
+    return np.array([by_id[grader_id] for grader_id in reports.grader_ids.tolist()])
+
+def real_data_array(num_students, num_assignments, rng, sum_grades=False):
+    """
+    Creates grading data in the format of the .npy files read by load17 and load19: array[student][week] = [submitted, graded].
+
+    Most submissions are peer graded by 3 other students (on a 0-100 scale, or as 3 rubric scores if sum_grades is True), and some are also graded by a TA.
+    The data has the irregularities that load_semester cleans up: submissions without a true grade, submissions with a single peer grade,
+    peer grades that only one side of the data records and duplicate (group) submissions under a second id.
+    """
+    array = np.empty(num_students, dtype=object)
+    for student in range(num_students):
+        array[student] = [[[], []] for _ in range(num_assignments)]
+
+    s_id = 0
+    for assignment in range(num_assignments):
+        for author in range(num_students):
+            others = np.delete(np.arange(num_students), author)
+            graders = rng.choice(others, rng.choice([1, 3, 3, 3]), replace=False).tolist()
+            true_grade = -1 if rng.random() < 0.05 else int(rng.integers(0, 101))
+            ta = bool(rng.random() < 0.15)
+
+            grades = []
+            for grader in graders:
+                score = rng.integers(0, 34, 3).tolist() if sum_grades else int(rng.integers(0, 101))
+                in_submission, in_graded = rng.random(2) > 0.1
+                if in_submission:
+                    grades.append([score, 0, grader, 0])
+                if in_graded or not in_submission:
+                    array[grader][assignment][1].append([0, s_id, score])
+            if ta:
+                grades.append([[true_grade, 0, 0] if sum_grades else true_grade, 0, -1, 1])
+
+            array[author][assignment][0].append([assignment, s_id, true_grade, int(ta), grades])
+            s_id += 1
+
+            if rng.random() < 0.1:
+                partner = int(rng.choice(others))
+                array[partner][assignment][0].append([assignment, s_id, true_grade, int(ta), grades])
+                s_id += 1
+
+    return array
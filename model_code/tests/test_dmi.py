@@ -0,0 +1,59 @@
+"""
+Seeded equivalence check between the batched DMI mechanism (dmi.dmi_mechanism_arrays) and the pairwise loop that it replaced.
+
+The reference loop is given the (shuffled) task order that dmi_mechanism_arrays draws from the same seed.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from itertools import combinations
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from helpers import graded_assignment
+from mechanisms.dmi import GRADE_MAP, dmi_mechanism_arrays
+
+def dmi_loop(grader_dict, reports, clusters, cluster_size):
+    """
+    The pairwise DMI loop, with the (shuffled) task order of each cluster given as rows of task ids.
+    """
+    submission_dict = {submission.student_id: submission for submission in grader_dict.keys()}
+    payments = {}
+
+    for tasks in clusters:
+        graders = grader_dict[submission_dict[tasks[0]]]
+
+        for (j, k) in combinations(graders, 2):
+            M_1 = np.zeros((2, 2), dtype=np.uint8)
+            M_2 = np.zeros((2, 2), dtype=np.uint8)
+
+            for t in range(cluster_size):
+                j_grade = GRADE_MAP[j.grades[0][tasks[t]]]
+                k_grade = GRADE_MAP[k.grades[0][tasks[t]]]
+
+                if t < cluster_size/2:
+                    M_1[j_grade, k_grade] += 1
+                else:
+                    M_2[j_grade, k_grade] += 1
+
+            score = np.linalg.det(M_1)*np.linalg.det(M_2)
+
+            payments[j.id] = payments.get(j.id, 0) + score
+            payments[k.id] = payments.get(k.id, 0) + score
+
+    return np.array([payments.get(grader_id, 0) for grader_id in reports.grader_ids.tolist()])
+
+@pytest.mark.parametrize("seed, cluster_size", [(0, 4), (1, 5), (2, 8)])
+def test_dmi_arrays_match_loop(seed, cluster_size):
+    students, grader_dict, reports = graded_assignment("DMI", str(cluster_size), seed=seed)
+
+    payments = dmi_mechanism_arrays(reports, cluster_size, rng=np.random.default_rng(seed))
+
+    #The task order that dmi_mechanism_arrays draws from the same seed.
+    order = np.argsort(reports.task_ids, kind="stable").reshape(-1, cluster_size)
+    clusters = reports.task_ids[np.random.default_rng(seed).permuted(order, axis=1)].tolist()
+
+    assert np.allclose(payments, dmi_loop(grader_dict, reports, clusters, cluster_size), rtol=1e-9, atol=1e-9)
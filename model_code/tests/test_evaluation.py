@@ -0,0 +1,186 @@
+"""
+Seeded equivalence checks between the evaluation metrics (the array versions, and the functions of Student lists that wrap them) and the pandas/sklearn/scipy computations that they replaced.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from itertools import combinations
+import os, sys
+from statistics import mean
+from sys import maxsize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+from scipy.stats import kendalltau, pearsonr
+
+from classes import StrategicStudent
+import evaluation
+from evaluation import aucs_mse, batch_metrics_arrays, batch_roc_auc_arrays, correlation_mse, kendall_tau, kendall_tau_mse, mse_metrics, mse_metrics_arrays, quantile_bins, roc_auc, roc_auc_strategic
+
+pd = pytest.importorskip("pandas")
+metrics = pytest.importorskip("sklearn.metrics")
+
+def random_semester(rng, n=60):
+    """
+    Random payments (with ties, nan and infinite values) and MSEs for n students.
+    """
+    payments = rng.integers(-5, 6, size=n).astype(float)
+    payments[rng.choice(n, 3, replace=False)] = [np.nan, np.inf, -np.inf]
+    mses = rng.gamma(2.0, 1.0, size=n)
+
+    return payments, mses
+
+def random_students(rng, n=60):
+    """
+    StrategicStudent objects with the payments and MSEs of random_semester, and random types and strategies.
+    """
+    payments, mses = random_semester(rng, n)
+    types = rng.choice(["active", "passive"], n)
+    strategies = rng.choice(["TRUTH", "NOISE", "MERGE"], n)
+
+    students = []
+    for i in range(n):
+        student = StrategicStudent(i, strategies[i], rng)
+        student.payment, student.mse, student.type = payments[i], mses[i], types[i]
+        students.append(student)
+
+    return students
+
+def metrics_reference(payments, mses):
+    """
+    Binary AUC, quinary AUC, Kendall's tau and Pearson's rho computed as in aucs_mse, kendall_tau_mse and correlation_mse before they were vectorized.
+    """
+    minsize = -maxsize - 1
+    payments = [0 if np.isnan(p) else min(max(p, minsize), maxsize) for p in payments]
+
+    df = pd.DataFrame(data={"Payment": payments, "MSE": -1*mses})
+    df["Binary"] = pd.qcut(df["MSE"], 2, labels=False)
+    df["Quinary"] = pd.qcut(df["MSE"], 5, labels=False)
+
+    binary_score = metrics.roc_auc_score(df["Binary"], df["Payment"])
+
+    quinary_aucs = []
+    for (i, j) in combinations(range(5), 2):
+        q_df = df.loc[((df["Quinary"] == i) | (df["Quinary"] == j)), ["Payment", "Quinary"]]
+        quinary_aucs.append(metrics.roc_auc_score(q_df["Quinary"], q_df["Payment"]))
+    quinary_score = mean(quinary_aucs)
+
+    tau, p_value = kendalltau(-1*mses, payments)
+    rho, p_value = pearsonr(-1*mses, payments)
+
+    return binary_score, quinary_score, tau, rho
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mse_metrics_match_reference(seed):
+    payments, mses = random_semester(np.random.default_rng(seed))
+
+    assert np.allclose(mse_metrics_arrays(payments, mses), metrics_reference(payments, mses), rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_student_metrics_match_reference(seed):
+    students = random_students(np.random.default_rng(seed))
+    payments = np.array([student.payment for student in students])
+    mses = np.array([student.mse for student in students])
+
+    binary_score, quinary_score, tau, rho = metrics_reference(payments, mses)
+    assert np.allclose(mse_metrics(students), (binary_score, quinary_score, tau, rho), rtol=1e-12, atol=1e-12)
+    assert np.allclose(aucs_mse(students), (binary_score, quinary_score), rtol=1e-12, atol=1e-12)
+    assert np.allclose(aucs_mse(students, include_q=False), (binary_score, 0), rtol=1e-12, atol=1e-12)
+    assert np.isclose(kendall_tau_mse(students), tau, rtol=1e-12, atol=1e-12)
+    assert np.isclose(correlation_mse(students), rho, rtol=1e-12, atol=1e-12)
+
+    #Formatted as in roc_auc, roc_auc_strategic and kendall_tau before they were computed on arrays.
+    minsize = -maxsize - 1
+    formatted = [0 if np.isnan(p) else min(max(p, minsize), maxsize) for p in payments]
+    assert np.isclose(roc_auc(students), metrics.roc_auc_score([student.type == "active" for student in students], formatted), rtol=1e-12, atol=1e-12)
+    assert np.isclose(roc_auc_strategic(students), metrics.roc_auc_score([student.strategy == "TRUTH" for student in students], formatted), rtol=1e-12, atol=1e-12)
+    assert np.isclose(kendall_tau(students), kendalltau([student.lam for student in students], formatted)[0], rtol=1e-12, atol=1e-12)
+
+def test_batch_metrics_match_reference():
+    rng = np.random.default_rng(0)
+    semesters = [random_semester(rng) for _ in range(20)]
+    payments = np.array([p for p, m in semesters])
+    mses = np.array([m for p, m in semesters])
+
+    batch = np.array(batch_metrics_arrays(payments, -1*mses)).T
+
+    for row, (p, m) in zip(batch, semesters):
+        assert np.allclose(row, metrics_reference(p, m), rtol=1e-12, atol=1e-12)
+
+@pytest.mark.parametrize("q", [2, 5])
+def test_quantile_bins_match_qcut(q):
+    values = np.random.default_rng(q).integers(0, 40, size=101).astype(float)
+
+    assert np.array_equal(quantile_bins(values, q), pd.qcut(values, q, labels=False))
+
+def test_quantile_bins_duplicate_edges():
+    values = np.zeros(20)
+    values[-1] = 1
+
+    with pytest.raises(ValueError):
+        pd.qcut(values, 5, labels=False)
+    with pytest.raises(ValueError):
+        quantile_bins(values, 5)
+
+def test_batch_metrics_edge_rows():
+    rng = np.random.default_rng(0)
+    payments, mses = random_semester(rng)
+
+    #Row 1 has duplicate quantile bin edges, row 2 constant payments.
+    duplicate_mses = np.zeros_like(mses)
+    duplicate_mses[:5] = rng.gamma(2.0, 1.0, size=5)
+    batch = np.array(batch_metrics_arrays([payments, payments, np.ones_like(payments)], -1*np.array([mses, duplicate_mses, mses]))).T
+
+    assert np.allclose(batch[0], metrics_reference(payments, mses), rtol=1e-12, atol=1e-12)
+
+    with pytest.raises(ValueError):
+        mse_metrics_arrays(payments, duplicate_mses)
+    assert np.all(np.isnan(batch[1, :2]))
+    minsize = -maxsize - 1
+    formatted = [0 if np.isnan(p) else min(max(p, minsize), maxsize) for p in payments]
+    assert np.isclose(batch[1, 2], kendalltau(-1*duplicate_mses, formatted)[0], rtol=1e-12, atol=1e-12)
+    assert np.isclose(batch[1, 3], pearsonr(-1*duplicate_mses, formatted)[0], rtol=1e-12, atol=1e-12)
+
+    with pytest.warns(Warning):
+        assert np.isnan(pearsonr(-1*mses, np.ones_like(payments))[0])
+    assert np.isnan(kendalltau(-1*mses, np.ones_like(payments))[0])
+    assert np.allclose(batch[2, :2], 0.5)
+    assert np.all(np.isnan(batch[2, 2:]))
+
+def test_batch_metrics_single_row_and_no_quinary():
+    payments, mses = random_semester(np.random.default_rng(1))
+
+    binary_scores, quinary_scores, taus, rhos = batch_metrics_arrays(payments, -1*mses, include_q=False)
+
+    binary_score, quinary_score, tau, rho = metrics_reference(payments, mses)
+    assert np.allclose([binary_scores[0], taus[0], rhos[0]], [binary_score, tau, rho], rtol=1e-12, atol=1e-12)
+    assert np.array_equal(quinary_scores, [0])
+
+@pytest.mark.parametrize("max_entries", [1, 1000, 5000])
+def test_batch_metrics_chunks(monkeypatch, max_entries):
+    rng = np.random.default_rng(2)
+    semesters = [random_semester(rng) for _ in range(7)]
+    payments = np.array([p for p, m in semesters])
+    true = -1*np.array([m for p, m in semesters])
+
+    expected = np.array(batch_metrics_arrays(payments, true))
+
+    #Smaller chunks, down to one row at a time and the per-row scipy.stats.kendalltau fallback.
+    monkeypatch.setattr(evaluation, "MAX_BATCH_ENTRIES", max_entries)
+    assert np.allclose(batch_metrics_arrays(payments, true), expected, rtol=1e-12, atol=1e-12)
+
+def test_batch_roc_auc_match_sklearn():
+    rng = np.random.default_rng(3)
+    payments = np.array([random_semester(rng)[0] for _ in range(10)])
+    labels = rng.random(payments.shape) < 0.4
+    labels[-1] = True
+
+    minsize = -maxsize - 1
+    scores = batch_roc_auc_arrays(labels, payments)
+    for row in range(9):
+        formatted = [0 if np.isnan(p) else min(max(p, minsize), maxsize) for p in payments[row]]
+        assert np.isclose(scores[row], metrics.roc_auc_score(labels[row], formatted), rtol=1e-12, atol=1e-12)
+
+    #Only one class.
+    assert np.isnan(scores[-1])
@@ -0,0 +1,91 @@
+"""
+Checks of the random assignment of graders (grading.random_regular_graph, grading.random_regular_assignment and grading.assign_graders).
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from setup import initialize_student_list, initialize_submission_list
+from grading import assign_graders, random_regular_assignment, random_regular_graph
+
+def check_assignment(assignment, num_submissions, d, authors):
+    """
+    Checks that every submission has d distinct graders, none of which is its author.
+    """
+    assert assignment.shape == (num_submissions, d)
+    assert np.all(np.sort(assignment, axis=1)[:, 1:] != np.sort(assignment, axis=1)[:, :-1])
+    assert not np.any(assignment == authors[:, None])
+
+@pytest.mark.parametrize("n, d", [(10, 4), (101, 4), (1000, 3), (50, 9)])
+def test_regular_assignment(n, d):
+    assignment = random_regular_assignment(n, n, d, rng=np.random.default_rng(n))
+
+    check_assignment(assignment, n, d, np.arange(n))
+    assert np.array_equal(np.bincount(assignment.ravel(), minlength=n), np.full(n, d))
+
+@pytest.mark.parametrize("num_submissions, num_graders, d", [(100, 30, 4), (30, 100, 4), (7, 5, 3)])
+def test_uneven_assignment(num_submissions, num_graders, d):
+    assignment = random_regular_assignment(num_submissions, num_graders, d, rng=np.random.default_rng(0))
+
+    authors = np.arange(num_submissions)
+    authors[authors >= num_graders] = -1
+    check_assignment(assignment, num_submissions, d, authors)
+
+    #Loads are as even as possible: every grader gets the floor or the ceiling of the average load.
+    loads = np.bincount(assignment.ravel(), minlength=num_graders)
+    assert loads.sum() == d*num_submissions
+    assert loads.max() - loads.min() <= 1
+
+def test_given_loads_and_authors():
+    rng = np.random.default_rng(0)
+    loads = np.repeat([2, 6], 10)
+    authors = rng.permutation(40) % 20
+
+    assignment = random_regular_assignment(40, 20, 2, loads=loads, authors=authors, rng=rng)
+
+    check_assignment(assignment, 40, 2, authors)
+    assert np.array_equal(np.bincount(assignment.ravel(), minlength=20), loads)
+
+def test_impossible_assignment():
+    with pytest.raises(ValueError):
+        random_regular_assignment(5, 5, 5, rng=np.random.default_rng(0))
+
+@pytest.mark.parametrize("n, d", [(5, 4), (10, 3), (40, 4), (1000, 8), (20001, 4)])
+def test_regular_graph(n, d):
+    neighbors = random_regular_graph(n, d, rng=np.random.default_rng(n))
+
+    assert neighbors.shape == (n, d)
+    assert not np.any(neighbors == np.arange(n)[:, None])
+    assert np.all(np.diff(neighbors, axis=1) > 0)
+
+    #Undirected: j is a neighbor of i exactly when i is a neighbor of j.
+    edges = np.repeat(np.arange(n), d)*n + neighbors.ravel()
+    reverse = neighbors.ravel()*n + np.repeat(np.arange(n), d)
+    assert np.array_equal(np.sort(edges), np.sort(reverse))
+
+def test_regular_graph_impossible():
+    with pytest.raises(ValueError):
+        random_regular_graph(5, 3, rng=np.random.default_rng(0))
+    with pytest.raises(ValueError):
+        random_regular_graph(4, 4, rng=np.random.default_rng(0))
+
+@pytest.mark.parametrize("reciprocal", [True, False])
+def test_assign_graders_reciprocal(reciprocal):
+    rng = np.random.default_rng(0)
+    students = initialize_student_list(50, 50, rng)
+    submissions = initialize_submission_list(students, 0, rng)
+
+    grader_dict = assign_graders(students, submissions, 4, rng, reciprocal)
+
+    grades = {(grader.id, submission.student_id) for submission, graders in grader_dict.items() for grader in graders}
+    assert len(grades) == 4*len(submissions)
+    assert all(i != j for i, j in grades)
+    if reciprocal:
+        assert all((j, i) in grades for i, j in grades)
+    else:
+        assert not all((j, i) in grades for i, j in grades)
@@ -0,0 +1,203 @@
+"""
+Checks of the indexed real-data loader (load.load_semester) against the scanning loops of load17 and load19 that it replaced, on synthetic grading data.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'real_data'))
+
+import numpy as np
+import pytest
+
+from classes import StrategicStudent, Submission
+from helpers import real_data_array
+from load import load_semester, round_grade
+
+"""
+The parameters of load_semester for the 2017 and the 2019 semesters (see load17 and load19), without the assignment partitions.
+"""
+YEARS = {17: (0, False, 100), 19: (1, True, 30)}
+
+PARTITION = [{1, 2}, {3, 4}]
+
+def load_loop(array, assignment_offset, sum_grades, partition, max_val, coarsen_grades=False, drop_TA_grades=False):
+    """
+    The body of load17/load19 before the de-duplication and the pruning were indexed (without the counts of grades and the consistency checks).
+    """
+    def value(raw_grade):
+        if sum_grades:
+            return sum(raw_grade)
+        return raw_grade
+
+    submission_map = {}
+    submission_id_map = {}
+    assignment_num_map = {}
+
+    for idx, weeks in enumerate(array):
+        for j, week in enumerate(weeks):
+            submitted = week[0]
+            for submission in submitted:
+                assignment_num = submission[0] + assignment_offset
+                s_id = submission[1]
+
+                sub = Submission(s_id, assignment_num)
+                sub.true_grade = submission[2]
+                sub.TA = bool(submission[3])
+                grades = submission[4]
+                sub.ta_grades = []
+
+                if sub.true_grade == -1:
+                    continue
+
+                assignment_num_map[s_id] = assignment_num
+
+                if drop_TA_grades and sub.TA:
+                    continue
+
+                for grade in grades:
+                    score = value(grade[0])
+                    if grade[3] == 1:
+                        sub.ta_grades.append(score)
+                    else:
+                        sub.grades[grade[2]] = score
+
+                match = False
+                i = 0
+                submissions_list = list(submission_map.values())
+                while match == False and i < len(submissions_list):
+                    s = submissions_list[i]
+                    if s.assignment_number == sub.assignment_number and s.true_grade == sub.true_grade and s.TA == sub.TA and s.grades == sub.grades and len(sub.grades) > 0:
+                        match = True
+                        first = s.student_id
+                        joint_id = (first, s_id)
+                        s.student_id = joint_id
+                        submission_map.pop(first)
+                        submission_map[joint_id] = s
+                        submission_id_map[first] = joint_id
+                        submission_id_map[s_id] = joint_id
+                    else:
+                        i += 1
+                if match == False:
+                    submission_map[s_id] = sub
+                    submission_id_map[s_id] = s_id
+
+    student_map = {}
+    for sub_id, submission in submission_map.items():
+        for grader, score in submission.grades.items():
+            if grader not in student_map.keys():
+                new_student_obj = StrategicStudent(grader)
+                new_student_obj.penalty_tasks = {}
+                student_map[grader] = new_student_obj
+            student_map[grader].grades.setdefault(submission.assignment_number, {})[submission.student_id] = score
+
+    for idx, weeks in enumerate(array):
+        if idx not in student_map.keys():
+            student_map[idx] = StrategicStudent(idx)
+        match = student_map[idx]
+        for j, week in enumerate(weeks):
+            for submission in week[1]:
+                raw_submission_id = submission[1]
+                if raw_submission_id not in assignment_num_map.keys() or raw_submission_id not in submission_id_map.keys():
+                    continue
+                assignment_num = assignment_num_map[raw_submission_id]
+                submission_id = submission_id_map[raw_submission_id]
+                grade = value(submission[2])
+
+                if assignment_num not in match.grades.keys():
+                    match.grades[assignment_num] = {}
+                if submission_id not in match.grades[assignment_num].keys():
+                    match.grades[assignment_num][submission_id] = grade
+                if match.grades[assignment_num][submission_id] == grade:
+                    submission_obj = submission_map[submission_id]
+                    if match.id not in submission_obj.grades.keys():
+                        submission_obj.grades[match.id] = grade
+
+    students = list(student_map.values())
+    submissions = list(submission_map.values())
+
+    no_updates = False
+    while not no_updates:
+        no_updates = True
+        subs_with_enough_grades = []
+        students_with_enough_grades = []
+
+        for student in students:
+            g_dict = student.grades
+            to_pop = [assignment for assignment in g_dict.keys() if len(g_dict[assignment]) < 2]
+            if len(to_pop) > 0:
+                for key in to_pop:
+                    for graded_id in g_dict[key].keys():
+                        graded_sub = [sub for sub in submissions if sub.assignment_number == key and sub.student_id == graded_id][0]
+                        graded_sub.grades.pop(student.id)
+                    g_dict.pop(key)
+                no_updates = False
+            if len(student.grades) != 0:
+                students_with_enough_grades.append(student)
+
+        students = students_with_enough_grades[:]
+
+        for submission in submissions:
+            if len(submission.grades) < 2:
+                possible_graders = [stud for stud in students if submission.assignment_number in stud.grades.keys()]
+                graders = [g for g in possible_graders if submission.student_id in g.grades[submission.assignment_number].keys()]
+                for grader in graders:
+                    grade = grader.grades[submission.assignment_number].pop(submission.student_id)
+                    grader.penalty_tasks.setdefault(submission.assignment_number, {})[submission.student_id] = grade
+                no_updates = False
+            else:
+                subs_with_enough_grades.append(submission)
+
+        submissions = subs_with_enough_grades[:]
+
+    for student in students:
+        assignments = set(student.grades.keys())
+        student.included = all(len(assignments.intersection(part)) > 0 for part in partition)
+
+    if coarsen_grades:
+        for student in students:
+            for grades in (student.grades, student.penalty_tasks):
+                for grade_dict in grades.values():
+                    for submission_id in grade_dict.keys():
+                        grade_dict[submission_id] = round_grade(grade_dict[submission_id], max_val)
+        for submission in submissions:
+            submission.true_grade = round_grade(submission.true_grade, max_val)
+            for grader in submission.grades.keys():
+                submission.grades[grader] = round_grade(submission.grades[grader], max_val)
+
+    return students, submissions
+
+def check_same_objects(objects, reference):
+    """
+    Checks that two lists of StrategicStudent or Submission objects have the same attributes, in the same order (including the order of the grades).
+    """
+    assert len(objects) == len(reference)
+    for obj, ref in zip(objects, reference):
+        assert vars(obj) == vars(ref)
+        assert list(obj.grades.items()) == list(ref.grades.items())
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("year", [17, 19])
+@pytest.mark.parametrize("coarsen_grades, drop_TA_grades", [(False, False), (True, False), (False, True)])
+def test_load_semester_matches_loop(tmp_path, seed, year, coarsen_grades, drop_TA_grades):
+    assignment_offset, sum_grades, max_val = YEARS[year]
+
+    #Saved and loaded like the real data files.
+    filename = str(tmp_path / "semester.npy")
+    np.save(filename, real_data_array(40, 4, np.random.default_rng(seed), sum_grades), allow_pickle=True)
+    array = np.load(filename, allow_pickle=1)
+
+    #The students and the submissions draw their (unused) parameters from the global random state, in the same order.
+    np.random.seed(seed)
+    students, submissions = load_semester(array, assignment_offset, sum_grades, PARTITION, max_val, coarsen_grades, drop_TA_grades)
+    np.random.seed(seed)
+    ref_students, ref_submissions = load_loop(array, assignment_offset, sum_grades, PARTITION, max_val, coarsen_grades, drop_TA_grades)
+
+    check_same_objects(students, ref_students)
+    check_same_objects(submissions, ref_submissions)
+
+    #The synthetic data exercises every cleaning step.
+    assert any(isinstance(sub.student_id, tuple) for sub in submissions)
+    assert any(len(student.penalty_tasks) > 0 for student in students)
+    assert any(student.included for student in students) and not all(student.included for student in students)
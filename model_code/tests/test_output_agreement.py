@@ -0,0 +1,22 @@
+"""
+Seeded equivalence check between the array version of the Output Agreement mechanism and its pairwise loop.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from helpers import graded_assignment, student_payments
+from mechanisms.output_agreement import oa_mechanism, oa_mechanism_arrays
+
+@pytest.mark.parametrize("seed", range(3))
+def test_oa_arrays_match_loop(seed):
+    students, grader_dict, reports = graded_assignment("OA", seed=seed)
+
+    oa_mechanism(grader_dict)
+
+    assert np.allclose(oa_mechanism_arrays(reports), student_payments(students, reports), rtol=1e-12, atol=1e-12)
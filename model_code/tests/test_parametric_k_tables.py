@@ -0,0 +1,90 @@
+"""
+Checks of the cached scoring tables of the parametric Phi-Div mechanism (phi_divergence_pairing.parametric_K_tables)
+against the per-pair evaluation of K (evaluate_K) and the penalty scores that the pairwise loop computed from it.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from math import exp
+import os, sys
+from sys import maxsize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from mechanisms.phi_divergence_pairing import evaluate_K, parametric_K_tables, parametric_K_values
+
+PHI_DIVERGENCES = ["TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER"]
+
+MU = 7
+GAMMA = 1/2.1
+
+def penalty_loop(penalty_val, phi_divergence):
+    """
+    The penalty score f*(K) as the pairwise loop computed it, with the Squared Hellinger fixups.
+    """
+    minsize = -maxsize - 1
+
+    conjugate = {
+        "TVD": lambda b: b,
+        "KL": lambda b: exp(b - 1),
+        "CHI_SQUARED": lambda b: (b*b)/4 + 1,
+        "SQUARED_HELLINGER": lambda b: (-b)/(b - 1),
+        }[phi_divergence]
+
+    if phi_divergence == "SQUARED_HELLINGER" and penalty_val == 1:
+        return minsize
+
+    with np.errstate(invalid="ignore"):
+        penalty_score = conjugate(np.float64(penalty_val))
+    if phi_divergence == "SQUARED_HELLINGER" and np.isnan(penalty_score):
+        penalty_score = -1
+
+    return penalty_score
+
+def random_parameters(seed):
+    """
+    Random reliabilities and biases for a pair of graders.
+    """
+    rng = np.random.default_rng(seed)
+    tau_1, tau_2 = rng.uniform(0.2, 3.0, size=2)
+    b_1, b_2 = rng.uniform(-1.5, 1.5, size=2)
+    return tau_1, tau_2, b_1, b_2
+
+@pytest.mark.parametrize("phi_divergence", PHI_DIVERGENCES)
+@pytest.mark.parametrize("seed", range(3))
+def test_tables_match_evaluate_K(seed, phi_divergence):
+    tau_1, tau_2, b_1, b_2 = random_parameters(seed)
+
+    K, P = parametric_K_tables(MU, GAMMA, tau_1, tau_2, b_1, b_2, phi_divergence, decimals=15)
+
+    K_loop = np.array([[evaluate_K(x, y, MU, GAMMA, tau_1, tau_2, b_1, b_2, phi_divergence) for y in range(11)] for x in range(11)])
+    P_loop = np.array([[penalty_loop(K_loop[x, y], phi_divergence) for y in range(11)] for x in range(11)])
+
+    assert np.allclose(K, K_loop, rtol=1e-12, atol=1e-12)
+    assert np.allclose(P, P_loop, rtol=1e-12, atol=1e-12)
+
+def test_tables_are_cached():
+    tau_1, tau_2, b_1, b_2 = random_parameters(0)
+
+    K, P = parametric_K_tables(MU, GAMMA, tau_1, tau_2, b_1, b_2, "KL")
+    K_again, P_again = parametric_K_tables(MU, GAMMA, tau_1 + 1e-12, tau_2, b_1, b_2 - 1e-12, "KL")
+
+    #Parameters that agree to K_TABLE_DECIMALS places share a pair of (read-only) tables.
+    assert K_again is K and P_again is P
+    assert not K.flags.writeable and not P.flags.writeable
+
+    K_other, P_other = parametric_K_tables(MU, GAMMA, tau_1 + 1e-3, tau_2, b_1, b_2, "KL")
+    assert K_other is not K
+
+def test_values_broadcast_over_pairs():
+    rng = np.random.default_rng(0)
+    x, y = rng.integers(0, 11, size=(2, 50))
+    tau_1, tau_2 = rng.uniform(0.2, 3.0, size=(2, 50))
+    b_1, b_2 = rng.uniform(-1.5, 1.5, size=(2, 50))
+
+    values = parametric_K_values(x, y, MU, GAMMA, tau_1, tau_2, b_1, b_2, "CHI_SQUARED")
+    loop = [evaluate_K(x[i], y[i], MU, GAMMA, tau_1[i], tau_2[i], b_1[i], b_2[i], "CHI_SQUARED") for i in range(50)]
+
+    assert np.allclose(values, loop, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,150 @@
+"""
+Checks of the EM procedure of the parametric mechanisms: the array version against the per-student loop that it replaced,
+and the accelerated (SQUAREM) and warm-started versions against the plain EM procedure.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from math import sqrt
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from setup import initialize_student_list, initialize_submission_list
+from grading import assign_graders, assign_grades, get_grading_dict
+from reports import AssignmentReports
+from helpers import graded_assignment
+from mechanisms.parametric_mse import EMState, em_estimate_parameters_arrays, mse_p_mechanism_arrays
+
+MU = 7
+GAMMA = 1/2.1
+
+def semester_reports(num_assignments=3, num_students=100, seed=0):
+    """
+    Simulates the reports of a semester of graded assignments (continuous effort, biased graders).
+    """
+    rng = np.random.default_rng(seed)
+    students = initialize_student_list(num_students, num_students, rng)
+
+    semester = []
+    for assignment in range(num_assignments):
+        submissions = initialize_submission_list(students, assignment, rng)
+        grader_dict = assign_graders(students, submissions, 4, rng)
+        assign_grades(get_grading_dict(grader_dict), 3, assignment, True, True, rng)
+        semester.append(AssignmentReports.from_grader_dict(grader_dict))
+
+    return semester
+
+def em_loop(grader_dict, student_list, assignment_num, mu, gamma, include_bias=False):
+    """
+    The per-submission and per-student EM loop that the array version replaced (the Gamma posterior mean a*theta is computed directly instead of with scipy.stats).
+    """
+    biases = {student.id: 0 for student in student_list}
+    reliability = {student.id: (2*gamma) for student in student_list}
+    scores = {submission.student_id: int(round(mu)) for submission in grader_dict.keys()}
+
+    new_scores = np.zeros(len(scores))
+    old_scores = np.ones(len(scores))
+
+    iteration = 0
+    termination = 0.0001
+
+    score = np.linalg.norm((old_scores - new_scores))
+
+    while score > termination and iteration < 1000:
+
+        old_scores_dict = scores.copy()
+
+        for submission in grader_dict.keys():
+            graders = list(submission.grades.keys())
+
+            numerator_sum = sum([sqrt(reliability[g])*(submission.grades[g] - biases[g]) for g in graders])
+            denominator_sum = sum([sqrt(reliability[g]) for g in graders])
+
+            scores[submission.student_id] = (sqrt(gamma)*mu + numerator_sum)/(sqrt(gamma) + denominator_sum)
+
+        if include_bias:
+            for student in student_list:
+                samples = [(s - scores[num]) for num, s in student.grades[assignment_num].items()]
+                tau = reliability[student.id]
+                biases[student.id] = (tau*sum(samples))/(1 + len(samples)*tau)
+
+        for student in student_list:
+            residuals = [(s - (scores[num] + biases[student.id]))**2 for num, s in student.grades[assignment_num].items()]
+
+            posterior_a = 10.0/1.05 + len(residuals)/2.0
+            posterior_theta = 1.0/(10.0 + sum(residuals)/2.0)
+
+            reliability[student.id] = posterior_a*posterior_theta
+
+        for idx, (sid, score) in enumerate(scores.items()):
+            old_scores[idx] = old_scores_dict[sid]
+            new_scores[idx] = score
+
+        score = np.linalg.norm((old_scores - new_scores))
+
+        iteration += 1
+
+    return biases, reliability, scores, iteration
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("include_bias, bias_correct", [(False, False), (True, False), (True, True)])
+def test_em_arrays_match_loop(seed, include_bias, bias_correct):
+    students, grader_dict, reports = graded_assignment("MSE_P", seed=seed)
+
+    biases, reliability, scores, iteration = em_loop(grader_dict, students, 0, MU, GAMMA, include_bias)
+    score_array, reliability_array, bias_array, payments, iteration_arrays = mse_p_mechanism_arrays(reports, MU, GAMMA, include_bias, bias_correct)
+
+    assert iteration_arrays == iteration
+
+    grader_ids = reports.grader_ids.tolist()
+    assert np.allclose(bias_array, [biases[g] for g in grader_ids], rtol=1e-12, atol=1e-14)
+    assert np.allclose(reliability_array, [reliability[g] for g in grader_ids], rtol=1e-12, atol=1e-14)
+
+    task_ids = reports.task_ids.tolist()
+    submissions = np.flatnonzero(reports.is_submission)
+    assert np.allclose(score_array[submissions], [scores[task_ids[t]] for t in submissions], rtol=1e-12, atol=1e-14)
+
+    #The MSE of each grader's (bias-corrected) reports from the estimated grades, as mse_p_mechanism computed it with sklearn.
+    by_id = {student.id: student for student in students}
+    loop_payments = []
+    for g in grader_ids:
+        b = biases[g] if bias_correct else 0
+        grades = by_id[g].grades[0]
+        loop_payments.append(-np.mean([(scores[task] - (report - b))**2 for task, report in grades.items()]))
+    assert np.allclose(payments, loop_payments, rtol=1e-14, atol=0)
+
+def check_same_estimates(estimates, reference, submissions):
+    biases, reliability, scores, iteration = estimates
+    ref_biases, ref_reliability, ref_scores, ref_iteration = reference
+
+    assert iteration < 1000
+    assert np.allclose(scores[submissions], ref_scores[submissions], atol=1e-3)
+    assert np.allclose(biases, ref_biases, atol=1e-3)
+    assert np.allclose(reliability, ref_reliability, rtol=1e-3)
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("include_bias", [True, False])
+def test_squarem_same_fixed_point(seed, include_bias):
+    reports = semester_reports(1, seed=seed)[0]
+
+    plain = em_estimate_parameters_arrays(reports, MU, GAMMA, include_bias)
+    accelerated = em_estimate_parameters_arrays(reports, MU, GAMMA, include_bias, accelerate=True)
+
+    check_same_estimates(accelerated, plain, reports.is_submission)
+    assert accelerated[3] <= plain[3]
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("accelerate", [False, True])
+def test_warm_start_same_fixed_point(seed, accelerate):
+    semester = semester_reports(seed=seed)
+
+    em_state = EMState(warm_start=True, accelerate=accelerate)
+    for reports in semester:
+        warm = em_state.estimate(reports, MU, GAMMA, include_bias=True)
+        check_same_estimates(warm, em_estimate_parameters_arrays(reports, MU, GAMMA, True), reports.is_submission)
+
+    assert len(em_state.iterations) == len(semester)
+    assert em_state.mean_iterations() == np.mean(em_state.iterations)
@@ -0,0 +1,25 @@
+"""
+Seeded equivalence check between the array version of the Peer Truth Serum mechanism and its pairwise loop.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from helpers import graded_assignment, student_payments
+from mechanisms.peer_truth_serum import pts_mechanism, pts_mechanism_arrays
+
+@pytest.mark.parametrize("seed", range(3))
+def test_pts_arrays_match_loop(seed):
+    students, grader_dict, reports = graded_assignment("PTS", seed=seed)
+    H_init = np.random.default_rng(seed).integers(1, 20, size=11).astype(float)
+
+    H = pts_mechanism(grader_dict, H_init.copy())
+    payments, H_arrays = pts_mechanism_arrays(reports, H_init.copy())
+
+    assert np.allclose(payments, student_payments(students, reports), rtol=1e-12, atol=1e-12)
+    assert np.array_equal(H_arrays, H)
@@ -0,0 +1,202 @@
+"""
+Seeded equivalence checks between the array version of the non-parametric Phi-Div pairing mechanism and the per-submission and per-pair loops that it replaced.
+
+The loops are given the partition, scoring matrices and penalty tasks that the array version draws from the same seed.
+The bulk sampling of penalty tasks (PenaltyIndex) is checked against the shuffle-and-scan procedure that it replaced, in distribution.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from itertools import combinations
+from math import exp
+import os, sys
+import random
+from sys import maxsize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from helpers import graded_assignment, student_payments
+from reports import AssignmentReports
+from mechanisms.phi_divergence_pairing import (compute_K, estimate_pairwise_scoring_matrices, estimate_pairwise_scoring_matrices_arrays, grader_pairs,
+                                               phi_divergence_pairing_mechanism, phi_divergence_pairing_mechanism_arrays, PenaltyIndex)
+
+PHI_DIVERGENCES = ["TVD", "KL", "CHI_SQUARED", "SQUARED_HELLINGER"]
+
+def estimate_loop(grader_dict, A, phi_divergence):
+    """
+    The per-submission loop that estimated the Phi-Div scoring matrices, for a given partition of the tasks.
+    """
+    B = [submission.student_id for submission in grader_dict.keys() if submission.student_id not in A]
+
+    JA = np.zeros(shape=(11, 11))
+    JB = np.zeros(shape=(11, 11))
+    MA = np.zeros(11)
+    MB = np.zeros(11)
+
+    for submission, graders in grader_dict.items():
+        counts = np.zeros(11)
+        for grade in submission.grades.values():
+            counts[grade] += 1
+
+        matrix = np.outer(counts, counts)
+        for i in range(len(counts)):
+            if counts[i] > 0:
+                matrix[i, i] = counts[i]*(counts[i] - 1)
+
+        normalization_coefficient = 1/(len(graders)*(len(graders) - 1))
+
+        if submission.student_id in A:
+            JA += matrix*normalization_coefficient/len(A)
+            MA += counts/len(graders)
+        else:
+            JB += matrix*normalization_coefficient/len(B)
+            MB += counts/len(graders)
+
+    MA /= len(A)
+    MB /= len(B)
+
+    return compute_K(JB, np.outer(MB, MB), phi_divergence), compute_K(JA, np.outer(MA, MA), phi_divergence)
+
+@pytest.mark.parametrize("phi_divergence", PHI_DIVERGENCES)
+@pytest.mark.parametrize("seed", range(3))
+def test_scoring_matrices_match_loop(seed, phi_divergence):
+    students, grader_dict, reports = graded_assignment("Phi-DIV", phi_divergence, seed=seed)
+
+    A, B, S_A, S_B = estimate_pairwise_scoring_matrices(grader_dict, phi_divergence, np.random.default_rng(seed))
+
+    assert len(A) == len(B) == len(grader_dict)//2
+    assert set(A) | set(B) == {submission.student_id for submission in grader_dict.keys()}
+
+    S_A_loop, S_B_loop = estimate_loop(grader_dict, set(A), phi_divergence)
+    assert np.allclose(S_A, S_A_loop, rtol=1e-12, atol=1e-12, equal_nan=True)
+    assert np.allclose(S_B, S_B_loop, rtol=1e-12, atol=1e-12, equal_nan=True)
+
+def pairing_loop(grader_dict, reports, A, S_A, S_B, penalties, phi_divergence):
+    """
+    The per-submission, per-pair scoring loop of the non-parametric Phi-Div mechanism, with the penalty tasks of each pair given.
+
+    Returns the payments and the number of submissions for which each grader was not paid (aligned with the rows of reports).
+    """
+    minsize = -maxsize - 1
+
+    conjugate = {
+        "TVD": lambda b: b,
+        "KL": lambda b: exp(b - 1),
+        "CHI_SQUARED": lambda b: (b*b)/4 + 1,
+        "SQUARED_HELLINGER": lambda b: (-b)/(b - 1),
+        }[phi_divergence]
+
+    payments = {}
+    dropped = {}
+
+    for submission, graders in grader_dict.items():
+        bonus = submission.student_id
+
+        constant_dict = {grader.id: len(graders) - 1 for grader in graders}
+        temp_scores = {grader.id: 0 for grader in graders}
+
+        for one, two in combinations(sorted(graders, key=lambda grader: reports.grader_index[grader.id]), 2):
+            penalty = penalties[(one.id, two.id, bonus)]
+            if penalty is None:
+                constant_dict[one.id] -= 1
+                constant_dict[two.id] -= 1
+                continue
+
+            penalty_one, penalty_two = penalty
+            S = S_A if bonus in A else S_B
+
+            with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+                penalty_score = conjugate(S[one.grades[0][penalty_one], two.grades[0][penalty_two]])
+            if phi_divergence == "SQUARED_HELLINGER" and np.isnan(penalty_score):
+                penalty_score = -1
+
+            score = S[one.grades[0][bonus], two.grades[0][bonus]] - penalty_score
+            if score < minsize:
+                score = minsize
+
+            temp_scores[one.id] += score
+            temp_scores[two.id] += score
+
+        for grader in graders:
+            if constant_dict[grader.id] > 0:
+                payments[grader.id] = payments.get(grader.id, 0) + temp_scores[grader.id]/constant_dict[grader.id]
+            else:
+                dropped[grader.id] = dropped.get(grader.id, 0) + 1
+
+    grader_ids = reports.grader_ids.tolist()
+    return np.array([payments.get(g, 0) for g in grader_ids]), np.array([dropped.get(g, 0) for g in grader_ids])
+
+@pytest.mark.parametrize("phi_divergence", PHI_DIVERGENCES)
+@pytest.mark.parametrize("seed", range(2))
+def test_phi_div_arrays_match_loop(seed, phi_divergence):
+    students, grader_dict, reports = graded_assignment("Phi-DIV", phi_divergence, seed=seed)
+
+    payments, dropped = phi_divergence_pairing_mechanism_arrays(reports, phi_divergence, np.random.default_rng(seed))
+
+    #The partition and the penalty tasks that phi_divergence_pairing_mechanism_arrays draws from the same seed.
+    rng = np.random.default_rng(seed)
+    in_A, S_A, S_B = estimate_pairwise_scoring_matrices_arrays(reports, phi_divergence, rng)
+    one, two, bonus = grader_pairs(reports)
+    penalty_one, penalty_two, found = PenaltyIndex(reports).sample(one, two, bonus, rng)
+
+    A = set(reports.task_ids[in_A].tolist())
+    ids, tasks = reports.grader_ids, reports.task_ids
+    penalties = {}
+    for j, k, b, p_1, p_2, f in zip(ids[one].tolist(), ids[two].tolist(), tasks[bonus].tolist(), penalty_one, penalty_two, found):
+        penalties[(j, k, b)] = (tasks[p_1], tasks[p_2]) if f else None
+
+    loop_payments, loop_dropped = pairing_loop(grader_dict, reports, A, S_A, S_B, penalties, phi_divergence)
+    assert np.allclose(payments, loop_payments, rtol=1e-9, atol=1e-9)
+    assert np.array_equal(dropped, loop_dropped)
+
+def test_phi_div_wrapper_updates_students():
+    students, grader_dict, reports = graded_assignment("Phi-DIV", "TVD")
+    for student in students:
+        student.num_graded = 0
+
+    phi_divergence_pairing_mechanism(grader_dict, "TVD", np.random.default_rng(1))
+    payments, dropped = phi_divergence_pairing_mechanism_arrays(reports, "TVD", np.random.default_rng(1))
+
+    assert np.allclose(student_payments(students, reports), payments)
+    for student in students:
+        assert -student.num_graded == dropped[reports.grader_index[student.id]]
+
+def penalty_loop(tasks_one, tasks_two, bonus):
+    """
+    The shuffle-and-scan procedure that chose the penalty tasks of a pair of graders (using the random module).
+    """
+    penalties_one = [t for t in tasks_one if t != bonus]
+    penalties_two = [t for t in tasks_two if t != bonus]
+
+    random.shuffle(penalties_one)
+    for possible in penalties_one:
+        if possible not in penalties_two:
+            return possible, random.choice(penalties_two)
+        elif len(penalties_two) > 1:
+            penalties_two.remove(possible)
+            return possible, random.choice(penalties_two)
+
+    return None
+
+@pytest.mark.parametrize("tasks_two", [[0, 2], [0, 2, 3], [0, 4, 5]])
+def test_penalty_sampling_matches_loop(tasks_two):
+    tasks_one = [0, 1, 2, 3]
+    mask = np.zeros((2, 6), dtype=bool)
+    mask[0, tasks_one] = True
+    mask[1, tasks_two] = True
+    reports = AssignmentReports.from_dense(0, [0, 1], list(range(6)), np.zeros((2, 6), dtype=np.int8), mask)
+
+    draws = 40000
+    n = np.zeros(draws, dtype=np.int64)
+    penalty_one, penalty_two, found = PenaltyIndex(reports).sample(n, n + 1, n, np.random.default_rng(0))
+    assert found.all()
+
+    random.seed(0)
+    loop = np.array([penalty_loop(tasks_one, tasks_two, 0) for _ in range(draws)])
+
+    keys = penalty_one*6 + penalty_two
+    loop_keys = loop[:, 0]*6 + loop[:, 1]
+    assert set(keys.tolist()) == set(loop_keys.tolist())
+    assert np.allclose(np.bincount(keys, minlength=36)/draws, np.bincount(loop_keys, minlength=36)/draws, atol=0.015)
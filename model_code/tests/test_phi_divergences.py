@@ -0,0 +1,108 @@
+"""
+Checks of the vectorized phi-divergences (mechanisms.phi_divergences) and compute_K against the scalar closed forms that they replaced.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+from math import exp, log, sqrt
+import os, sys
+from sys import maxsize
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from mechanisms.phi_divergences import PHI_DIVERGENCES, get_phi_divergence
+from mechanisms.phi_divergence_pairing import compute_K
+
+def tvd_subdifferential(a):
+    ans = 0
+    if a > 1:
+        ans = 0.5
+    elif a < 1:
+        ans = -0.5
+    return ans
+
+def kl_subdifferential(a):
+    ans = -np.inf
+    if a > 0:
+        ans = 1 + log(a)
+    return ans
+
+def squared_hellinger_subdifferential(a):
+    ans = -np.inf
+    if a > 0:
+        ans = 1 - 1/sqrt(a)
+    return ans
+
+"""
+The scalar subdifferentials and conjugates, as the mechanisms defined them before the registry.
+"""
+SUBDIFFERENTIALS = {
+        "TVD": tvd_subdifferential,
+        "KL": kl_subdifferential,
+        "CHI_SQUARED": lambda a: 2*a,
+        "SQUARED_HELLINGER": squared_hellinger_subdifferential,
+    }
+
+CONJUGATES = {
+        "TVD": lambda b: b,
+        "KL": lambda b: exp(b - 1),
+        "CHI_SQUARED": lambda b: (b*b)/4 + 1,
+        "SQUARED_HELLINGER": lambda b: (-b)/(b - 1),
+    }
+
+"""
+Ratios of the joint distribution to the product of the marginals, including the special cases 0 and 1.
+"""
+RATIOS = np.concatenate(([0.0, 1.0, 1e-300, 1e12], np.random.default_rng(0).gamma(1.0, 1.0, size=200)))
+
+@pytest.mark.parametrize("name", list(PHI_DIVERGENCES))
+def test_subdifferential_matches_closed_form(name):
+    values = get_phi_divergence(name).subdifferential(RATIOS)
+
+    assert np.allclose(values, [SUBDIFFERENTIALS[name](a) for a in RATIOS.tolist()], rtol=1e-15, atol=0)
+
+@pytest.mark.parametrize("name", list(PHI_DIVERGENCES))
+def test_conjugate_matches_closed_form(name):
+    #The scores that are passed to f*: the subdifferential at every ratio (including -infty), and a grid of scores below 1.
+    scores = np.concatenate((get_phi_divergence(name).subdifferential(RATIOS), np.linspace(-5, 0.9, 60)))
+    #The singular point of Squared Hellinger (b = 1) is checked separately.
+    regular = np.isfinite(scores) & (scores != 1)
+
+    values = get_phi_divergence(name).conjugate(scores)
+
+    assert np.allclose(values[regular], [CONJUGATES[name](b) for b in scores[regular].tolist()], rtol=1e-12, atol=1e-12)
+    if name == "SQUARED_HELLINGER":
+        #The limit of f* as b -> -infty (the closed form is nan there).
+        assert np.all(values[np.isinf(scores)] == -1)
+
+def test_conjugate_squared_hellinger_singular():
+    #f* is undefined at b = 1, where the mechanisms used the smallest int as the penalty score.
+    assert get_phi_divergence("SQUARED_HELLINGER").conjugate(1.0) == -maxsize - 1
+
+def test_unknown_divergence():
+    with pytest.raises(ValueError):
+        get_phi_divergence("JS")
+
+def compute_K_loop(J, PM, phi_divergence):
+    """
+    The entrywise loop that computed the scoring matrix.
+    """
+    K = np.zeros(shape=(11, 11))
+    for i in range(11):
+        for j in range(11):
+            if PM[i, j] != 0:
+                K[i, j] = SUBDIFFERENTIALS[phi_divergence](J[i, j]/PM[i, j])
+    return K
+
+@pytest.mark.parametrize("name", list(PHI_DIVERGENCES))
+@pytest.mark.parametrize("seed", range(3))
+def test_compute_K_matches_loop(seed, name):
+    rng = np.random.default_rng(seed)
+    J = rng.random((11, 11))*(rng.random((11, 11)) < 0.7)
+    J /= J.sum()
+    marginal = J.sum(axis=1)
+    PM = np.outer(marginal, marginal)
+
+    assert np.allclose(compute_K(J, PM, name), compute_K_loop(J, PM, name), rtol=1e-15, atol=0)
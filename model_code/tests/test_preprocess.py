@@ -0,0 +1,74 @@
+"""
+Checks that the cached semesters (preprocess.py) rebuild the same students and submissions as load17 and load19.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'real_data'))
+
+import numpy as np
+import pytest
+
+from helpers import real_data_array
+from load import load17, load19
+from preprocess import cache_path, file_hash, load_cached, read_arrays, read_semester, source_file, write_semester
+
+def check_same_objects(objects, reference):
+    """
+    Checks that two lists of StrategicStudent or Submission objects have the same data, in the same order (including the order of the grades).
+    The parameters that the objects draw at random are not cached, so they are left out.
+    """
+    assert len(objects) == len(reference)
+    for obj, ref in zip(objects, reference):
+        for attr in ("id", "student_id", "assignment_number", "true_grade", "TA", "ta_grades", "grades", "penalty_tasks", "included"):
+            assert getattr(obj, attr, None) == getattr(ref, attr, None)
+        assert list(obj.grades.items()) == list(ref.grades.items())
+        if hasattr(ref, "penalty_tasks"):
+            assert list(obj.penalty_tasks.items()) == list(ref.penalty_tasks.items())
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    A working directory with synthetic data files for Spring 2017 and Fall 2019 (in the 2019 format).
+    """
+    monkeypatch.chdir(tmp_path)
+    for seed, (year, semester) in enumerate([(17, "Spring"), (19, "Fall")]):
+        np.save(source_file(year, semester), real_data_array(40, 15, np.random.default_rng(seed), year == 19), allow_pickle=True)
+    return tmp_path
+
+@pytest.mark.parametrize("year, semester", [(17, "Spring"), (19, "Fall")])
+@pytest.mark.parametrize("coarsen_grades, drop_TA_grades", [(False, False), (True, True)])
+def test_write_read_round_trip(data_dir, year, semester, coarsen_grades, drop_TA_grades):
+    load = load17 if year == 17 else load19
+    students, submissions = load(semester, coarsen_grades, drop_TA_grades)
+
+    path = str(data_dir / "semester")
+    write_semester(path, students, submissions)
+    cached_students, cached_submissions = read_semester(path)
+
+    check_same_objects(cached_students, students)
+    check_same_objects(cached_submissions, submissions)
+    assert any(isinstance(sub.student_id, tuple) for sub in cached_submissions)
+
+    for array in read_arrays(path).values():
+        assert isinstance(array, np.memmap)
+        assert not array.flags.writeable
+
+def test_load_cached(data_dir):
+    students, submissions = load17("Spring")
+
+    #The first call cleans the semester and writes the cache, the second reads it.
+    for _ in range(2):
+        cached_students, cached_submissions = load_cached(17, "Spring", cache_dir="cache")
+        check_same_objects(cached_students, students)
+        check_same_objects(cached_submissions, submissions)
+
+    path = cache_path(17, "Spring", False, False, file_hash(source_file(17, "Spring")), "cache")
+    assert os.listdir("cache") == [os.path.basename(path)]
+
+    #A new source file is cached under a new name.
+    np.save(source_file(17, "Spring"), real_data_array(40, 15, np.random.default_rng(10)), allow_pickle=True)
+    load_cached(17, "Spring", cache_dir="cache")
+    assert len(os.listdir("cache")) == 2
@@ -0,0 +1,108 @@
+"""
+Checks of the array-backed reports (reports.AssignmentReports) against the dict attributes of the Student and Submission objects that they are built from.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from setup import initialize_student_list, initialize_submission_list
+from grading import assign_graders, assign_grades, get_grading_dict
+from reports import AssignmentReports
+from mechanisms.baselines import mean_squared_error_arrays
+
+def graded_assignment(num_students=30, seed=0):
+    """
+    Simulates one graded assignment (4 graders per submission), with a penalty task for the first two students.
+    """
+    rng = np.random.default_rng(seed)
+    students = initialize_student_list(num_students, num_students, rng)
+    submissions = initialize_submission_list(students, 0, rng)
+    grader_dict = assign_graders(students, submissions, 4, rng)
+    assign_grades(get_grading_dict(grader_dict), 3, 0, True, True, rng)
+
+    students[0].penalty_tasks[0] = {"extra": 3}
+    students[1].penalty_tasks[0] = {"extra": 9}
+
+    return students, submissions, grader_dict
+
+def test_reports_match_objects():
+    students, submissions, grader_dict = graded_assignment()
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+
+    assert reports.num_reports == 4*len(submissions) + 2
+    assert not reports.is_submission[reports.task_index["extra"]]
+
+    rows, cols, values = reports.entries()
+    grader_ids, task_ids = reports.grader_ids.tolist(), reports.task_ids.tolist()
+    for g, t, v in zip(rows.tolist(), cols.tolist(), values.tolist()):
+        grader = students[grader_ids[g]]
+        assert v == {**grader.grades[0], **grader.penalty_tasks.get(0, {})}[task_ids[t]]
+
+    #Sorted by grader, then by task.
+    assert np.all(np.diff(rows * reports.num_tasks + cols) > 0)
+
+    indptr, indices = reports.graders_by_task()
+    for submission in submissions:
+        t = reports.task_index[submission.student_id]
+        graders = [grader_ids[g] for g in indices[indptr[t]:indptr[t + 1]]]
+        assert graders == sorted(graders, key=reports.grader_index.get)
+        assert set(graders) == set(submission.grades.keys())
+
+def test_dense_view_and_lookup():
+    students, submissions, grader_dict = graded_assignment()
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+
+    dense, mask = reports.to_dense()
+    assert mask.sum() == reports.num_reports
+    assert np.array_equal(mask.sum(axis=0), reports.graders_per_task())
+
+    rows, cols = np.meshgrid(np.arange(reports.num_graders), np.arange(reports.num_tasks), indexing="ij")
+    assert np.array_equal(reports.lookup(rows, cols), dense)
+
+    copy = AssignmentReports.from_dense(0, reports.grader_ids, reports.task_ids, dense, mask, reports.is_submission, reports.true_grades)
+    for a, b in zip(copy.entries(), reports.entries()):
+        assert np.array_equal(a, b)
+
+def test_write_to_objects_round_trip():
+    students, submissions, grader_dict = graded_assignment()
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+
+    grades = [dict(student.grades[0]) for student in students]
+    submission_grades = [dict(submission.grades) for submission in submissions]
+    for student in students:
+        student.grades[0] = {}
+    for submission in submissions:
+        submission.grades = {}
+
+    reports.write_to_objects(students, submissions)
+
+    assert [student.grades[0] for student in students] == grades
+    assert [submission.grades for submission in submissions] == submission_grades
+
+@pytest.mark.parametrize("seed", range(3))
+def test_squared_errors_and_mse_baseline(seed):
+    students, submissions, grader_dict = graded_assignment(seed=seed)
+    reports = AssignmentReports.from_grader_dict(grader_dict)
+
+    #Penalty tasks do not count.
+    errors = [sum((report - submissions[task].true_grade)**2 for task, report in students[g].grades[0].items()) for g in reports.grader_ids.tolist()]
+    assert np.allclose(reports.squared_errors(), errors)
+    assert np.array_equal(reports.submissions_per_grader(), [len(students[g].grades[0]) for g in reports.grader_ids.tolist()])
+
+    #The MSE baseline pays -1/4 of the squared error from the mean report of each submission.
+    consensus_grades = np.full(reports.num_tasks, np.nan)
+    payments = np.zeros(reports.num_graders)
+    for submission, graders in grader_dict.items():
+        consensus = np.mean(list(submission.grades.values()))
+        consensus_grades[reports.task_index[submission.student_id]] = consensus
+        for grader in graders:
+            payments[reports.grader_index[grader.id]] -= 0.25*(grader.grades[0][submission.student_id] - consensus)**2
+
+    scores, payments_arrays = mean_squared_error_arrays(reports)
+    assert np.allclose(scores, consensus_grades, rtol=1e-12, atol=1e-12, equal_nan=True)
+    assert np.allclose(payments_arrays, payments, rtol=1e-12, atol=1e-12)
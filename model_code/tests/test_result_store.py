@@ -0,0 +1,92 @@
+"""
+Checks that an experiment that is interrupted and then resumed from its result store (result_store.py) gives the same results as an uninterrupted run.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import importlib
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pytest
+
+from result_store import ResultStore
+from runner import evaluate_mechanisms
+
+script = importlib.import_module("simulation_continuous-effort_bias")
+
+MECHANISMS = [("OA", "0"), ("MSE_P", "0")]
+
+CONFIG = ("test", MECHANISMS)
+
+class Interrupted(Exception):
+    pass
+
+class InterruptingStore:
+    """
+    Wraps a PointStore and raises Interrupted instead of saving once num_saves batches have been saved, like a run that is killed part of the way through.
+    """
+
+    def __init__(self, store, num_saves):
+        self.store = store
+        self.batch_size = store.batch_size
+        self.num_saves = num_saves
+
+    def load(self, batch):
+        return self.store.load(batch)
+
+    def save(self, batch, results):
+        if self.num_saves == 0:
+            raise Interrupted()
+        self.num_saves -= 1
+        self.store.save(batch, results)
+
+def run(store=None, seed=0, common_random_numbers=False, workers=1):
+    return evaluate_mechanisms(script.SETTING, 7, 2, (40, 40), MECHANISMS, seed=seed, common_random_numbers=common_random_numbers, store=store, workers=workers)
+
+@pytest.mark.parametrize("common_random_numbers, workers", [(False, 1), (True, 1), (False, 2)])
+def test_resumed_run_matches_uninterrupted(tmp_path, common_random_numbers, workers):
+    filename = str(tmp_path / "results.jobs.jsonl")
+    expected = run(common_random_numbers=common_random_numbers)
+
+    store = ResultStore(filename, CONFIG, batch_size=2)
+    with pytest.raises(Interrupted):
+        run(InterruptingStore(store.point((40,), 0), 2), common_random_numbers=common_random_numbers, workers=workers)
+
+    #A write that was cut off part of the way through a line.
+    with open(filename, 'a', encoding='utf-8') as f:
+        f.write('{"config": "')
+
+    store = ResultStore(filename, CONFIG, batch_size=2)
+    assert len(store.records) == 2
+
+    assert run(store.point((40,), 0), common_random_numbers=common_random_numbers, workers=workers) == expected
+
+    #Every batch is in the store now, so the results can be merged without simulating.
+    merged = ResultStore(filename, CONFIG, batch_size=2, read_only=True)
+    assert run(merged.point((40,), 0), common_random_numbers=common_random_numbers) == expected
+
+def test_unseeded_run_resumes_with_recorded_entropy(tmp_path):
+    filename = str(tmp_path / "results.jobs.jsonl")
+
+    store = ResultStore(filename, CONFIG, batch_size=4)
+    seed = store.root_seed(None)
+    with pytest.raises(Interrupted):
+        run(InterruptingStore(store.point((40,), seed), 1), seed)
+
+    store = ResultStore(filename, CONFIG, batch_size=4)
+    assert store.root_seed(None) == seed
+    assert run(store.point((40,), seed), seed) == run(seed=seed)
+
+def test_read_only_store_is_missing_batches(tmp_path):
+    filename = str(tmp_path / "results.jobs.jsonl")
+
+    store = ResultStore(filename, CONFIG, batch_size=2)
+    with pytest.raises(Interrupted):
+        run(InterruptingStore(store.point((40,), 0), 1))
+
+    with pytest.raises(ValueError):
+        run(ResultStore(filename, CONFIG, batch_size=2, read_only=True).point((40,), 0))
+
+    #Records of another configuration are ignored.
+    assert ResultStore(filename, ("other", MECHANISMS), batch_size=2).records == {}
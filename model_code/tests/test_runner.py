@@ -0,0 +1,34 @@
+"""
+Checks of the shared experiment runner (runner.py) on a small simulation setting.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import importlib
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pytest
+
+from runner import evaluate_mechanisms
+
+script = importlib.import_module("simulation_continuous-effort_bias")
+
+MECHANISMS = [("OA", "0"), ("MSE_P", "0"), ("Phi-DIV_P", "TVD")]
+
+@pytest.mark.parametrize("common_random_numbers", [False, True])
+def test_em_iterations_recorded(common_random_numbers):
+    plain = evaluate_mechanisms(script.SETTING, 3, 3, (40, 40), MECHANISMS, seed=0, common_random_numbers=common_random_numbers)
+    fast = evaluate_mechanisms(script.SETTING, 3, 3, (40, 40), MECHANISMS, seed=0, common_random_numbers=common_random_numbers, warm_start=True, accelerate=True)
+
+    assert "EM Iterations" not in plain["OA: 0"]
+    assert plain["OA: 0"] == fast["OA: 0"]
+
+    for key in ("MSE_P: 0", "Phi-DIV_P: TVD"):
+        assert len(plain[key]["EM Iterations"]) == 3
+        assert all(iterations > 0 for iterations in plain[key]["EM Iterations"])
+        assert sum(fast[key]["EM Iterations"]) < sum(plain[key]["EM Iterations"])
+
+    #The flags only change the settings of the copy of the setting that the semesters are run with.
+    assert not script.SETTING.mechanism_settings.warm_start
+    assert not script.SETTING.mechanism_settings.accelerate
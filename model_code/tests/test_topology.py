@@ -0,0 +1,104 @@
+"""
+Checks of the CSR assignment topology (topology.AssignmentTopology) against the grader_dict loops that it replaced.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pytest
+
+from setup import initialize_student_list, initialize_submission_list
+from grading import assign_graders, get_grading_dict, random_regular_assignment
+from grading_dmi import assign_graders_dmi_clusters, dmi_cluster_topology
+from topology import AssignmentTopology
+
+def grading_dict_loop(grader_dict):
+    """
+    The dict inversion that get_grading_dict did before it was done on index arrays.
+    """
+    grading_dict = {}
+    for key, val in grader_dict.items():
+        for grader in val:
+            if grader not in grading_dict.keys():
+                grading_dict[grader] = []
+            grading_dict[grader].append(key)
+    return grading_dict
+
+def dmi_clusters_loop(student_list, submission_list, cluster_size):
+    """
+    The DMI cluster assignment before it was built from a cached topology.
+    """
+    grader_dict = {}
+
+    submissions = submission_list[cluster_size:] + submission_list[:cluster_size]
+
+    for i in range(0, len(submissions), cluster_size):
+        students = [student_list[i + j] for j in range(cluster_size)]
+        for j in range(cluster_size):
+            grader_dict[submissions[i + j]] = students
+
+    return grader_dict
+
+def semester(num_students, seed):
+    """
+    The students and the submissions for one assignment, and the Generator to assign graders with.
+    """
+    rng = np.random.default_rng(seed)
+    students = initialize_student_list(num_students, num_students, rng)
+    submissions = initialize_submission_list(students, 0, rng)
+    return students, submissions, rng
+
+@pytest.mark.parametrize("seed, reciprocal", [(0, True), (1, True), (2, False)])
+def test_grader_dict_round_trip(seed, reciprocal):
+    students, submissions, rng = semester(50, seed)
+    grader_dict = assign_graders(students, submissions, 4, rng, reciprocal)
+
+    topology, graders, submission_list = AssignmentTopology.from_grader_dict(grader_dict)
+
+    assert submission_list == list(grader_dict.keys())
+    assert topology.grader_dict(graders, submission_list) == grader_dict
+
+    #Same keys in the same order, with the submissions of each grader in the same order.
+    grading_dict = get_grading_dict(grader_dict)
+    reference = grading_dict_loop(grader_dict)
+    assert list(grading_dict.keys()) == list(reference.keys())
+    assert grading_dict == reference
+
+@pytest.mark.parametrize("num_submissions, num_graders, d", [(40, 40, 4), (100, 30, 3), (30, 100, 5)])
+def test_csr_directions_agree(num_submissions, num_graders, d):
+    assignment = random_regular_assignment(num_submissions, num_graders, d, rng=np.random.default_rng(d))
+    topology = AssignmentTopology.from_assignment(assignment, num_graders)
+
+    for s in range(num_submissions):
+        assert np.array_equal(topology.graders_of(s), assignment[s])
+
+    for g in range(num_graders):
+        assert np.array_equal(topology.tasks_of(g), np.flatnonzero(np.any(assignment == g, axis=1)))
+
+    assert np.array_equal(topology.graders_per_submission(), np.full(num_submissions, d))
+    assert np.array_equal(topology.tasks_per_grader(), np.bincount(assignment.ravel(), minlength=num_graders))
+
+    submissions, graders = topology.edges()
+    assert np.array_equal(submissions, np.repeat(np.arange(num_submissions), d))
+    assert np.array_equal(graders, assignment.ravel())
+
+    with pytest.raises(ValueError):
+        topology.tasks_indices[0] = 0
+
+@pytest.mark.parametrize("num_students, cluster_size", [(40, 4), (40, 5), (48, 8)])
+def test_dmi_clusters_match_loop(num_students, cluster_size):
+    students, submissions, rng = semester(num_students, 0)
+
+    grader_dict = assign_graders_dmi_clusters(students, submissions, cluster_size)
+    reference = dmi_clusters_loop(students, submissions, cluster_size)
+
+    assert list(grader_dict.keys()) == list(reference.keys())
+    assert grader_dict == reference
+    assert dmi_cluster_topology(num_students, cluster_size) is dmi_cluster_topology(num_students, cluster_size)
+
+def test_dmi_clusters_indivisible():
+    with pytest.raises(ValueError):
+        dmi_cluster_topology(42, 4)
@@ -0,0 +1,210 @@
+"""
+Array representation of the assignment of graders to submissions for an assignment (the "topology" of the review graph).
+
+An AssignmentTopology stores the assignment as index arrays in both directions (submission -> graders and grader -> submissions), in CSR form.
+It does not hold any Student or Submission objects, so the same topology can be cached and reused across assignments whenever the assignment of graders is fixed
+(e.g. the clusters used for the DMI mechanism), and a grader_dict or grading_dict can be built from it for any list of students and submissions.
+
+@author: Noah Burrell <burrelln@umich.edu>
+"""
+
+import numpy as np
+
+class AssignmentTopology:
+    """
+    The assignment of graders to submissions, as CSR index arrays.
+
+    Attributes
+    ----------
+    num_submissions : int.
+    num_graders : int.
+    graders_indptr : np.array of ints, shape (num_submissions + 1,).
+    graders_indices : np.array of ints.
+                      The graders of submission s are graders_indices[graders_indptr[s]:graders_indptr[s + 1]].
+    tasks_indptr : np.array of ints, shape (num_graders + 1,).
+    tasks_indices : np.array of ints.
+                    The submissions graded by grader g are tasks_indices[tasks_indptr[g]:tasks_indptr[g + 1]], in increasing order.
+
+    All of the arrays are read-only, so a topology can be shared safely.
+    """
+
+    def __init__(self, submissions, graders, num_submissions, num_graders):
+        """
+        Creates an AssignmentTopology object from a list of (submission, grader) edges.
+
+        Parameters
+        ----------
+        submissions : np.array of ints.
+                      The submission index of each edge.
+        graders : np.array of ints.
+                  The grader index of each edge.
+        num_submissions : int.
+        num_graders : int.
+
+        """
+        submissions = np.asarray(submissions, dtype=np.int64)
+        graders = np.asarray(graders, dtype=np.int64)
+
+        self.num_submissions = num_submissions
+        self.num_graders = num_graders
+
+        order = np.argsort(submissions, kind="stable")
+        self.graders_indptr = _indptr(submissions, num_submissions)
+        self.graders_indices = graders[order]
+
+        #Sorted by grader, then by submission.
+        order = np.lexsort((submissions, graders))
+        self.tasks_indptr = _indptr(graders, num_graders)
+        self.tasks_indices = submissions[order]
+
+        for array in (self.graders_indptr, self.graders_indices, self.tasks_indptr, self.tasks_indices):
+            array.setflags(write=False)
+
+    @classmethod
+    def from_assignment(cls, assignment, num_graders):
+        """
+        Creates an AssignmentTopology object from an (num_submissions, d) array, in which row s contains the indices of the graders of submission s
+        (e.g. the output of grading.random_regular_assignment).
+
+        Parameters
+        ----------
+        assignment : np.array of ints, shape (num_submissions, d).
+        num_graders : int.
+
+        Returns
+        -------
+        topology : AssignmentTopology object.
+
+        """
+        assignment = np.asarray(assignment, dtype=np.int64)
+        num_submissions, d = assignment.shape
+        submissions = np.repeat(np.arange(num_submissions, dtype=np.int64), d)
+        return cls(submissions, assignment.reshape(-1), num_submissions, num_graders)
+
+    @classmethod
+    def from_grader_dict(cls, grader_dict):
+        """
+        Creates an AssignmentTopology object from a grader_dict.
+        Submissions are indexed in the order of the keys of grader_dict and graders in the order in which they first appear.
+
+        Parameters
+        ----------
+        grader_dict : dict.
+                      Maps a Submission object to a list of graders (Student objects).
+
+        Returns
+        -------
+        topology : AssignmentTopology object.
+        graders : list of Student objects.
+                  The grader with each index.
+        submissions : list of Submission objects.
+                      The submission with each index.
+
+        """
+        grader_index = {}
+        submission_idx = []
+        grader_idx = []
+
+        for s_idx, grader_list in enumerate(grader_dict.values()):
+            for grader in grader_list:
+                g_idx = grader_index.setdefault(grader, len(grader_index))
+                submission_idx.append(s_idx)
+                grader_idx.append(g_idx)
+
+        topology = cls(submission_idx, grader_idx, len(grader_dict), len(grader_index))
+
+        return topology, list(grader_index.keys()), list(grader_dict.keys())
+
+    def graders_of(self, submission):
+        """
+        Returns the indices of the graders of a submission (by index).
+        """
+        return self.graders_indices[self.graders_indptr[submission]:self.graders_indptr[submission + 1]]
+
+    def tasks_of(self, grader):
+        """
+        Returns the indices of the submissions graded by a grader (by index).
+        """
+        return self.tasks_indices[self.tasks_indptr[grader]:self.tasks_indptr[grader + 1]]
+
+    def graders_per_submission(self):
+        """
+        Returns the number of graders of each submission, as an np.array of ints, shape (num_submissions,).
+        """
+        return np.diff(self.graders_indptr)
+
+    def tasks_per_grader(self):
+        """
+        Returns the number of submissions graded by each grader, as an np.array of ints, shape (num_graders,).
+        """
+        return np.diff(self.tasks_indptr)
+
+    def edges(self):
+        """
+        Returns the (submission, grader) edges in submission-major order.
+
+        Returns
+        -------
+        submissions : np.array of ints.
+        graders : np.array of ints.
+
+        """
+        submissions = np.repeat(np.arange(self.num_submissions, dtype=np.int64), self.graders_per_submission())
+        return submissions, self.graders_indices
+
+    def grader_dict(self, student_list, submission_list):
+        """
+        Builds a grader_dict, where grader g is student_list[g] and submission s is submission_list[s].
+
+        Parameters
+        ----------
+        student_list : list of Student objects.
+        submission_list : list of Submission objects.
+
+        Returns
+        -------
+        grader_dict : dict.
+                      Maps a Submission object to a list of Student objects will grade that submission.
+                      grader_dict = { submission (Submission object): [ graders (Student objects) ] }
+
+        """
+        indptr = self.graders_indptr.tolist()
+        indices = self.graders_indices.tolist()
+
+        grader_dict = {}
+        for s_idx, submission in enumerate(submission_list):
+            grader_dict[submission] = [student_list[g] for g in indices[indptr[s_idx]:indptr[s_idx + 1]]]
+        return grader_dict
+
+    def grading_dict(self, student_list, submission_list):
+        """
+        Builds a grading_dict, where grader g is student_list[g] and submission s is submission_list[s]. Graders without any submissions are left out.
+
+        Parameters
+        ----------
+        student_list : list of Student objects.
+        submission_list : list of Submission objects.
+
+        Returns
+        -------
+        grading_dict : dict.
+                       Maps a grader (Student object) to a list of Submission objects.
+                       grading_dict = { Student object: [ Submission objects ] }
+
+        """
+        indptr = self.tasks_indptr.tolist()
+        indices = self.tasks_indices.tolist()
+
+        grading_dict = {}
+        for g_idx, grader in enumerate(student_list):
+            if indptr[g_idx + 1] > indptr[g_idx]:
+                grading_dict[grader] = [submission_list[s] for s in indices[indptr[g_idx]:indptr[g_idx + 1]]]
+        return grading_dict
+
+def _indptr(index, n):
+    """
+    Returns the CSR index pointer for an array of row indices with n rows.
+    """
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(index, minlength=n))
+    return indptr
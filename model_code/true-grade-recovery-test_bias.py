@@ -14,7 +14,6 @@ from mechanisms.baselines import mean_squared_error
 from mechanisms.parametric_mse import mse_p_mechanism
 
 from evaluation import true_grade_mse
-from graphing import plot_estimation_mses
 
 import warnings
 
@@ -138,6 +137,7 @@ def simulate(filename):
     """
     Graphing the results in the figures directory
     """
+    from graphing import plot_estimation_mses
     plot_estimation_mses(results, filename)
 
 if __name__ == "__main__":